@@ -0,0 +1,234 @@
+# batched.py
+
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+from prophecy import (prepare_series, forecastability_issue, choose_growth, finalize_forecast,
+                      forecast_one, FUTURE_IN_STOCK_DAYS)
+
+# Prophet-ის ნაგულისხმევი მნიშვნელობები, თუ config.PROPHET_PARAMS-ში არ არის მითითებული
+PROPHET_DEFAULTS = {
+    'n_changepoints': 25,
+    'changepoint_range': 0.8,
+    'changepoint_prior_scale': 0.05,
+    'seasonality_prior_scale': 10.0,
+    'holidays_prior_scale': 10.0,
+}
+
+DAY_NS = np.int64(24 * 3600 * 10**9)
+
+
+def _param(name: str) -> float:
+    return config.PROPHET_PARAMS.get(name, PROPHET_DEFAULTS[name])
+
+
+def _expand_holidays(combined_holidays: pd.DataFrame) -> pd.DataFrame:
+    """Expands holiday windows into one (holiday, ds) row per affected day, as Prophet does."""
+    if combined_holidays is None or combined_holidays.empty:
+        return pd.DataFrame({'holiday': pd.Series(dtype=str), 'ds': pd.Series(dtype='datetime64[ns]')})
+
+    hol = combined_holidays.copy()
+    hol['ds'] = pd.to_datetime(hol['ds']).dt.normalize()
+    for col in ('lower_window', 'upper_window'):
+        if col not in hol.columns:
+            hol[col] = 0
+    hol['offset'] = [list(range(int(lo), int(up) + 1))
+                     for lo, up in zip(hol['lower_window'].fillna(0), hol['upper_window'].fillna(0))]
+    hol = hol.explode('offset')
+    hol['ds'] = hol['ds'] + pd.to_timedelta(hol['offset'].astype(int), unit='D')
+    return hol[['holiday', 'ds']].drop_duplicates()
+
+
+def _design(ds: np.ndarray, future_ds: np.ndarray, regressor: np.ndarray, hol_days: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Builds stacked Prophet-style design matrices for S series of equal length n.
+    ds: (S, n) datetime64, future_ds: (S,) datetime64, regressor: (S, n) in_stock_days.
+    Returns (X (S, n, p), X_future (S, p), prior_scales (p,)).
+    """
+    S, n = ds.shape
+    ds_ns = ds.astype('datetime64[ns]').astype(np.int64)
+    fut_ns = future_ds.astype('datetime64[ns]').astype(np.int64)
+
+    # --- Piecewise-linear trend ---
+    start = ds_ns[:, :1]
+    t_scale = (ds_ns[:, -1:] - start).astype(float)
+    t_scale[t_scale == 0] = 1.0
+    t = (ds_ns - start) / t_scale
+    t_fut = (fut_ns[:, None] - start) / t_scale
+
+    hist_size = int(np.floor(n * _param('changepoint_range')))
+    n_cp = min(int(_param('n_changepoints')), hist_size - 1)
+    if n_cp > 0:
+        cp_idx = np.linspace(0, hist_size - 1, n_cp + 1).round().astype(int)[1:]
+        s = t[:, cp_idx]
+        cp = np.clip(t[:, :, None] - s[:, None, :], 0, None)
+        cp_fut = np.clip(t_fut[:, :, None] - s[:, None, :], 0, None)[:, 0, :]
+    else:
+        cp = np.zeros((S, n, 0))
+        cp_fut = np.zeros((S, 0))
+
+    blocks = [np.ones((S, n, 1)), t[:, :, None], cp]
+    fut_blocks = [np.ones((S, 1)), t_fut, cp_fut]
+    # Laplace(0, b)-ის ვარიანსი 2b²-ია, ამიტომ ნორმალურ მიახლოებაში სკალა b·√2
+    scales = [5.0, 5.0] + [_param('changepoint_prior_scale') * np.sqrt(2)] * cp.shape[2]
+
+    # --- Fourier terms (MONTHLY_SEASONALITY) ---
+    period = config.MONTHLY_SEASONALITY['period']
+    order = config.MONTHLY_SEASONALITY['fourier_order']
+    days = ds_ns / DAY_NS
+    days_fut = fut_ns / DAY_NS
+    seasonal_scale = config.MONTHLY_SEASONALITY.get('prior_scale', _param('seasonality_prior_scale'))
+    for i in range(1, order + 1):
+        for fn in (np.sin, np.cos):
+            blocks.append(fn(2 * np.pi * i * days / period)[:, :, None])
+            fut_blocks.append(fn(2 * np.pi * i * days_fut / period)[:, None])
+            scales.append(seasonal_scale)
+
+    # --- Holiday indicators (only holidays that touch this bucket's dates) ---
+    all_days = np.concatenate([ds.ravel(), future_ds]).astype('datetime64[ns]')
+    hits = hol_days[hol_days['ds'].isin(pd.DatetimeIndex(np.unique(all_days)))]
+    for _, name_days in hits.groupby('holiday'):
+        dates = name_days['ds'].to_numpy(dtype='datetime64[ns]')
+        blocks.append(np.isin(ds, dates).astype(float)[:, :, None])
+        fut_blocks.append(np.isin(future_ds, dates).astype(float)[:, None])
+        scales.append(_param('holidays_prior_scale'))
+
+    # --- in_stock_days regressor (standardized per series, like Prophet) ---
+    mu = regressor.mean(axis=1, keepdims=True)
+    std = regressor.std(axis=1, ddof=1, keepdims=True) if n > 1 else np.zeros((S, 1))
+    constant = np.isclose(std, 0)
+    mu = np.where(constant, 0.0, mu)
+    std = np.where(constant, 1.0, std)
+    blocks.append(((regressor - mu) / std)[:, :, None])
+    fut_blocks.append((FUTURE_IN_STOCK_DAYS - mu) / std)
+    scales.append(_param('holidays_prior_scale'))
+
+    return np.concatenate(blocks, axis=2), np.concatenate(fut_blocks, axis=1), np.asarray(scales, dtype=float)
+
+
+def _solve(X: np.ndarray, y: np.ndarray, prior_scales: np.ndarray) -> np.ndarray:
+    """Solves S ridge problems at once: (XᵀX + Λ) β = Xᵀy, with Λ_jj = σ² / scale_j²."""
+    penalty = np.diag((config.BATCHED_NOISE_SCALE / prior_scales) ** 2)
+    A = np.einsum('snp,snq->spq', X, X) + penalty
+    b = np.einsum('snp,sn->sp', X, y)
+    return np.linalg.solve(A, b[:, :, None])[:, :, 0]
+
+
+def forecast_batched(series: Iterable[Tuple[str, pd.DataFrame, float]], combined_holidays: pd.DataFrame) -> List[tuple]:
+    """
+    Forecasts all barcodes at once with regularized least squares on Prophet-like designs.
+    series: iterable of (barcode, group_df, median_add_3m).
+    Returns (barcode, forecast_value, start_time, end_time, info) tuples in input order,
+    with the same median fallbacks (and info keys) as forecast_one. Each barcode is timed with
+    its own preparation plus an equal share of its bucket's solve (also its fit_seconds), laid
+    out back to back from the start of the batch.
+    """
+    start_time = datetime.now()
+    results: Dict[str, float] = {}
+    infos: Dict[str, dict] = {}
+    seconds: Dict[str, float] = {}
+    order: List[str] = []
+    buckets: Dict[int, list] = {}
+
+    # --- PREPARE AND VALIDATE (same rules as forecast_one) ---
+    for barcode, group, median_add_3m in series:
+        prepare_start = time.perf_counter()
+        order.append(barcode)
+        try:
+            info = infos[barcode] = {'series_len': 0, 'growth': None, 'fallback': None, 'cached': False,
+                                     'fit_seconds': None, 'worker': os.getpid()}
+            if median_add_3m == 0 or pd.isna(median_add_3m):
+                results[barcode] = 0.0
+                info['fallback'] = 'zero_median'
+                continue
+            df = prepare_series(group)
+            issue = 'no_demand_column' if df is None else forecastability_issue(df)
+            if issue:
+                info['series_len'] = 0 if df is None else len(df)
+                results[barcode] = median_add_3m
+                info['fallback'] = issue
+                continue
+            df = df.drop_duplicates(subset=['ds']).sort_values('ds')
+            info['growth'], cap_val = choose_growth(df)
+            info['series_len'] = len(df)
+            buckets.setdefault(len(df), []).append((barcode, df, median_add_3m, cap_val))
+        finally:
+            seconds[barcode] = time.perf_counter() - prepare_start
+
+    hol_days = _expand_holidays(combined_holidays)
+
+    # --- SOLVE EACH EQUAL-LENGTH BUCKET AS ONE STACKED PROBLEM ---
+    for items in buckets.values():
+        solve_start = time.perf_counter()
+        ds = np.stack([item[1]['ds'].to_numpy(dtype='datetime64[ns]') for item in items])
+        y = np.stack([item[1]['y'].to_numpy(dtype=float) for item in items])
+        regressor = np.stack([item[1]['in_stock_days'].to_numpy(dtype=float) for item in items])
+        future_ds = (pd.DatetimeIndex(ds[:, -1]) + pd.offsets.MonthBegin(1)).to_numpy(dtype='datetime64[ns]')
+
+        y_scale = np.abs(y).max(axis=1, keepdims=True)
+        y_scale[y_scale == 0] = 1.0
+
+        X, X_future, prior_scales = _design(ds, future_ds, regressor, hol_days)
+        beta = _solve(X, y / y_scale, prior_scales)
+        yhat = np.einsum('sp,sp->s', X_future, beta) * y_scale[:, 0]
+        share = (time.perf_counter() - solve_start) / len(items)
+
+        for (barcode, _, median_add_3m, cap_val), value in zip(items, yhat):
+            if cap_val is not None:
+                # ლოგისტიკური ზრდის მიახლოება: პროგნოზი floor-სა და cap-ს შორის
+                value = min(max(value, 0.01), cap_val)
+            results[barcode], infos[barcode]['fallback'] = finalize_forecast(barcode, value, median_add_3m)
+            infos[barcode]['fit_seconds'] = share
+            seconds[barcode] += share
+
+    end_time = datetime.now()
+    print(f"INFO: Batched engine solved {sum(len(v) for v in buckets.values())} series in {len(buckets)} buckets "
+          f"({(end_time - start_time).total_seconds():.2f}s).")
+    timed = []
+    cursor = start_time
+    for barcode in order:
+        end = cursor + timedelta(seconds=seconds[barcode])
+        timed.append((barcode, results[barcode], cursor, end, infos[barcode]))
+        cursor = end
+    return timed
+
+
+def compare_with_prophet(series: List[Tuple[str, pd.DataFrame, float]], combined_holidays: pd.DataFrame,
+                         batched_results: List[tuple], sample_size: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Refits a random sample of barcodes with forecast_one and reports how far the
+    batched forecasts are from Prophet's.
+    """
+    batched = {res[0]: res[1] for res in batched_results}
+    candidates = [item for item in series if batched.get(item[0], 0) != item[2]]  # skip pure median fallbacks
+    sample = random.Random(seed).sample(candidates, min(sample_size, len(candidates)))
+
+    # საცდელი ფიტები არ უნდა მოხვდეს warm-start საცავში, შედეგების ქეშსა და მოდელების საცავში
+    saved = config.WARM_START, config.RESULT_CACHE, config.MODEL_STORE, config.PREDICT_ONLY
+    config.WARM_START = config.RESULT_CACHE = config.MODEL_STORE = config.PREDICT_ONLY = False
+    rows = []
+    try:
+        for barcode, group, median_add_3m in sample:
+            prophet_value = forecast_one((barcode, group, median_add_3m), combined_holidays)[1]
+            rows.append({'barcode': barcode, 'prophet': prophet_value, 'batched': batched[barcode]})
+    finally:
+        config.WARM_START, config.RESULT_CACHE, config.MODEL_STORE, config.PREDICT_ONLY = saved
+
+    comparison = pd.DataFrame(rows, columns=['barcode', 'prophet', 'batched'])
+    if comparison.empty:
+        print("INFO: No eligible barcodes to compare batched and Prophet forecasts.")
+        return comparison
+
+    comparison['abs_diff'] = (comparison['batched'] - comparison['prophet']).abs()
+    nonzero = comparison['prophet'] != 0
+    mape = (comparison.loc[nonzero, 'abs_diff'] / comparison.loc[nonzero, 'prophet'].abs()).mean() * 100
+    print(f"INFO: Batched vs Prophet on {len(comparison)} barcodes: "
+          f"MAE={comparison['abs_diff'].mean():.4f}, MAPE={mape:.2f}%, max abs diff={comparison['abs_diff'].max():.4f}")
+    return comparison
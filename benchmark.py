@@ -0,0 +1,276 @@
+# benchmark.py
+
+import os
+import io
+import json
+import math
+import time
+import argparse
+import logging
+import warnings
+import contextlib
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+warnings.filterwarnings("ignore")
+logging.basicConfig(level=logging.ERROR)
+logging.getLogger('prophet').setLevel(logging.ERROR)
+logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
+
+import config
+from synthetic_data import generate_dataset, generate_sales_data
+from holidays import holidays as standard_holidays
+
+RESULTS_COLUMNS = ['run_id', 'timestamp', 'git_rev', 'benchmark', 'variant', 'n_skus', 'n_months', 'n_items',
+                   'seconds', 'throughput', 'unit', 'details']
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except Exception:
+        return ''
+
+
+def _best_of(fn: Callable, repeat: int):
+    """Runs fn repeat times; returns (fastest seconds, last result)."""
+    best, result = float('inf'), None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _record(name: str, variant: str, n_items: int, seconds: float, unit: str, details: dict = None) -> dict:
+    return {'benchmark': name, 'variant': variant, 'n_items': n_items, 'seconds': round(seconds, 4),
+            'throughput': round(n_items / seconds, 2) if seconds > 0 else None, 'unit': unit,
+            'details': json.dumps(details or {}, default=str)}
+
+
+def _forecast_sample(data: dict, args) -> Callable[[], list]:
+    """Initializes this process as a forecast worker; returns a function running forecast_one on a sample of barcodes."""
+    from prophecy import forecast_one, init_worker
+    from utils import config_snapshot
+
+    sales, additional, holidays = data['sales'], data['additional'], data['holidays']
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_worker(holidays, config_snapshot())
+
+    medians = additional.set_index('barcode')['median_add_3m']
+    barcodes = pd.Series(medians.index).sample(min(args.fit_sample, len(medians)), random_state=args.seed)
+    groups = {barcode: group for barcode, group in sales[sales['barcode'].isin(set(barcodes))].groupby('barcode')}
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [forecast_one((barcode, groups[barcode], float(medians[barcode]))) for barcode in barcodes]
+    return run
+
+
+def _fit_details(results: list) -> dict:
+    infos = pd.DataFrame([res[4] for res in results])
+    errors = infos.loc[infos['fallback'] == 'exception', 'error'] if 'error' in infos else pd.Series(dtype=str)
+    if len(errors):
+        print(f"WARNING: {len(errors)} of {len(infos)} forecasts failed and fell back to the median, e.g.: {errors.iloc[0]}")
+    fit_seconds = infos['fit_seconds'].dropna()
+    return {
+        'fitted': len(fit_seconds),
+        'fit_p50': round(float(fit_seconds.median()), 4) if len(fit_seconds) else None,
+        'fit_p90': round(float(fit_seconds.quantile(0.9)), 4) if len(fit_seconds) else None,
+        'fallbacks': infos['fallback'].value_counts().to_dict(),
+    }
+
+
+def bench_forecast(data: dict, args) -> List[dict]:
+    """forecast_one on a sample of barcodes in this process, with the result cache and warm start off."""
+    config.WARM_START = config.RESULT_CACHE = False
+    run = _forecast_sample(data, args)
+    seconds, results = _best_of(run, args.repeat)
+    return [_record('forecast_one', 'prophet', len(results), seconds, 'barcodes/s', _fit_details(results))]
+
+
+def bench_warm_start(data: dict, args) -> List[dict]:
+    """
+    The forecast_one sample fitted twice against a fresh parameter store: cold, then warm-started
+    from the first pass's parameters, with the optimizer iterations of each pass.
+    """
+    import param_store
+
+    path = os.path.join(config.OUTPUT_FOLDER, "benchmark_params.sqlite")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    config.PARAM_STORE_PATH = path
+    param_store._connection = None
+    config.WARM_START, config.RESULT_CACHE = True, False
+    run = _forecast_sample(data, args)
+
+    records = []
+    for variant in ('cold', 'warm'):
+        start = time.perf_counter()
+        results = run()
+        seconds = time.perf_counter() - start
+        details = _fit_details(results)
+        iterations = pd.read_sql_query("SELECT iterations FROM fit_stats WHERE run_id = ? AND warm = ?",
+                                       param_store._get_connection(),
+                                       params=(config.RUN_ID, int(variant == 'warm')))['iterations']
+        details['iterations_p50'] = float(iterations.median()) if len(iterations) else None
+        records.append(_record('forecast_one', f'prophet_{variant}_start', len(results), seconds, 'barcodes/s', details))
+    return records
+
+
+def bench_kpi(data: dict, args) -> List[dict]:
+    from prophecy import calculate_kpis
+
+    sales, additional = data['sales'], data['additional']
+    forecast_df = additional[['barcode', 'median_add_3m']].rename(columns={'median_add_3m': 'forecastedADD'})
+    seconds, _ = _best_of(lambda: calculate_kpis(sales, forecast_df, additional), args.repeat)
+    return [_record('calculate_kpis', 'vectorized', len(sales), seconds, 'rows/s')]
+
+
+def lambda_kpi_aggregates(df_raw: pd.DataFrame, demand_col: str) -> pd.DataFrame:
+    """The per-barcode lambda aggregation kpi_base used before utils.group_mean_filtered."""
+    from utils import safe_mean_filtered
+
+    filtered = df_raw[df_raw[demand_col] > 0]
+    return filtered.groupby('barcode').agg(
+        averageADD=(demand_col, lambda x: round(x[x > 0].mean(), 4)),
+        DSI=('dsi', lambda x: safe_mean_filtered(x)),
+        GMROI=('gmroi', lambda x: safe_mean_filtered(x)),
+    )
+
+
+def bench_kpi_aggregation(data: dict, args) -> List[dict]:
+    """
+    kpi_aggregates (vectorized) against the old per-barcode lambdas on generated frames of
+    --agg-rows rows each; the lambda variant takes minutes at 10M rows.
+    """
+    from prophecy import kpi_aggregates
+
+    records = []
+    for n_rows in args.agg_rows:
+        # new/intermittent series start late, so generate some spare barcodes and cut to size
+        sales = generate_sales_data(math.ceil(n_rows / args.months * 1.3), args.months, '2025-06-01', args.seed).head(n_rows)
+        details = {'rows': len(sales), 'barcodes': int(sales['barcode'].nunique())}
+        for variant, fn in (('vectorized', kpi_aggregates), ('lambda', lambda_kpi_aggregates)):
+            seconds, _ = _best_of(lambda: fn(sales, 'avg_daily_demand'), args.repeat)
+            records.append(_record('kpi_aggregates', f"{variant}_{n_rows}rows", len(sales), seconds, 'rows/s', details))
+        del sales
+    return records
+
+
+def bench_optimize(data: dict, args) -> List[dict]:
+    from optimize import run_optimal_allocation
+
+    kpi_df = data['kpis']
+    budget = float(kpi_df['cost'].sum() * 10)
+    caps = {'mother_cat_name': budget / 5}
+    records = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for solver, solver_caps in [('knapsack', {}), ('lp', caps)]:
+            seconds, result = _best_of(lambda: run_optimal_allocation(kpi_df.copy(), budget, solver_caps, solver),
+                                       args.repeat)
+            records.append(_record('run_optimal_allocation', solver, len(kpi_df), seconds, 'products/s',
+                                   {'budget': budget, 'spent': round(float(result['Optimal_spent'].sum()), 2)}))
+    return records
+
+
+def bench_db(data: dict, args) -> List[dict]:
+    """save_results_to_db against a local SQLite file standing in for PostgreSQL."""
+    from sqlalchemy import create_engine, text
+    from database_writer import save_results_to_db
+
+    path = os.path.join(config.OUTPUT_FOLDER, "benchmark.sqlite")
+    engine = create_engine(f"sqlite:///{path}")
+    kpi_df = data['kpis']
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds, _ = _best_of(lambda: save_results_to_db(kpi_df, 'benchmark_results', engine=engine), args.repeat)
+    with engine.connect() as connection:
+        saved = connection.execute(text('SELECT COUNT(*) FROM benchmark_results')).scalar()
+    engine.dispose()
+    if saved != len(kpi_df):
+        print(f"WARNING: save_results_to_db wrote {saved} of {len(kpi_df)} rows; the timing is not meaningful.")
+    return [_record('save_results_to_db', 'sqlite', len(kpi_df), seconds, 'rows/s', {'rows_in_table': saved})]
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'forecast': bench_forecast,
+    'warm_start': bench_warm_start,
+    'kpi': bench_kpi,
+    'kpi_agg': bench_kpi_aggregation,
+    'optimize': bench_optimize,
+    'db': bench_db,
+}
+
+
+def compare_with_previous(results: pd.DataFrame, history: pd.DataFrame) -> pd.DataFrame:
+    """Adds the previous run's seconds for the same benchmark, variant and data size, and the speedup."""
+    keys = ['benchmark', 'variant', 'n_skus', 'n_months']
+    previous = history[~history['run_id'].isin(results['run_id'])]
+    previous = previous.sort_values('timestamp').groupby(keys, as_index=False).last()[keys + ['seconds', 'git_rev']]
+    merged = results.merge(previous, on=keys, how='left', suffixes=('', '_previous'))
+    merged['speedup'] = (merged['seconds_previous'] / merged['seconds']).round(2)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline stages on synthetic data")
+    parser.add_argument('--skus', type=int, default=2000, help="number of synthetic barcodes")
+    parser.add_argument('--months', type=int, default=24, help="months of history per barcode")
+    parser.add_argument('--fit-sample', type=int, default=50, help="barcodes fitted by the forecast_one benchmark")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per benchmark; the fastest one is recorded")
+    parser.add_argument('--only', default=','.join(name for name in BENCHMARKS if name != 'kpi_agg'),
+                        help=f"comma-separated subset of {list(BENCHMARKS)} (kpi_agg is slow and only runs when listed)")
+    parser.add_argument('--agg-rows', type=lambda value: [int(n) for n in value.split(',')], default=[1_000_000, 10_000_000],
+                        help="comma-separated frame sizes for the kpi_agg benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {sorted(unknown)}")
+
+    os.makedirs(config.OUTPUT_FOLDER, exist_ok=True)
+    print(f"INFO: Generating synthetic data: {args.skus} barcodes x {args.months} months...")
+    sales, additional, promos = generate_dataset(args.skus, args.months, args.seed)
+    data = {
+        'sales': sales,
+        'additional': additional,
+        'holidays': pd.concat([standard_holidays, promos], ignore_index=True),
+    }
+    from prophecy import calculate_kpis
+    forecast_df = additional[['barcode', 'median_add_3m']].rename(columns={'median_add_3m': 'forecastedADD'})
+    data['kpis'] = calculate_kpis(sales, forecast_df, additional)
+    print(f"INFO: {len(sales)} sales rows, {len(additional)} products, {len(promos)} promo days.")
+
+    records = []
+    for name in names:
+        print(f"INFO: Running benchmark '{name}'...")
+        records.extend(BENCHMARKS[name](data, args))
+
+    results = pd.DataFrame(records)
+    results.insert(0, 'run_id', config.RUN_ID)
+    results.insert(1, 'timestamp', datetime.now().isoformat(timespec='seconds'))
+    results.insert(2, 'git_rev', _git_rev())
+    results.insert(5, 'n_skus', args.skus)
+    results.insert(6, 'n_months', args.months)
+    results = results[RESULTS_COLUMNS]
+
+    path = os.path.join(config.OUTPUT_FOLDER, config.BENCHMARK_FILENAME)
+    history = pd.read_csv(path) if os.path.exists(path) else pd.DataFrame(columns=RESULTS_COLUMNS)
+    pd.concat([history, results], ignore_index=True).to_csv(path, index=False)
+
+    report = compare_with_previous(results, history)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(report[['benchmark', 'variant', 'n_items', 'seconds', 'throughput', 'unit',
+                      'seconds_previous', 'speedup']].to_string(index=False))
+    print(f"SUCCESS: Benchmark results appended to {path}")
+
+
+if __name__ == "__main__":
+    main()
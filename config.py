@@ -3,13 +3,30 @@
 from datetime import datetime
 import os
 
+# --- RUN IDENTIFICATION ---
+RUN_ID = os.getenv('RUN_ID', datetime.now().strftime("%Y%m%d_%H%M%S"))
+
 # --- DATA LOADING PARAMETERS ---
 START_DATE = "2023-01-01"
 END_DATE = datetime.now().strftime("%Y-%m-%d")
 PROMO_MIN_CASHBACK = 11000
 
+# --- DATA SNAPSHOT ---
+# LoadData-ს შედეგები ლოკალურად ინახება (Arrow, თვეების მიხედვით); ბაზიდან მხოლოდ ბოლო თვეები მოდის
+SNAPSHOT_ENABLED = os.getenv('SNAPSHOT_ENABLED', '1') == '1'
+SNAPSHOT_REFRESH_MONTHS = 2  # რამდენი ბოლო თვე ჩამოიტვირთება თავიდან ყოველ გაშვებაზე
+SNAPSHOT_MAX_AGE_HOURS = 12  # additional_metrics / promo_campaigns სნეპშოტის ვადა
+
+# --- SCHEDULING ---
+# ბირთვების ბიუჯეტი იყოფა worker პროცესებსა და თითო ფიტის ნაკადებს შორის (processes x threads <= CORE_BUDGET)
+CORE_BUDGET = int(os.getenv('CORE_BUDGET', 0))  # 0 = ხელმისაწვდომი ბირთვები - 1
+STAN_N_JOBS = int(os.getenv('STAN_N_JOBS', 1))  # ნაკადები თითო ფიტზე (BLAS/OpenMP/Stan); L-BFGS ფიტი ერთნაკადიანია
+# ფიტის სავარაუდო ღირებულება: (COST_PER_FIT + COST_PER_POINT * თვეები) x COST_LOGISTIC_FACTOR ლოგისტიკურზე
+COST_PER_FIT = 1.0
+COST_PER_POINT = 0.05
+COST_LOGISTIC_FACTOR = 1.6
+
 # --- PROPHET MODEL HYPERPARAMETERS ---
-STAN_N_JOBS = int(os.getenv('STAN_N_JOBS', 8))
 PROPHET_PARAMS = {
     'yearly_seasonality': False,
     'weekly_seasonality': False,
@@ -26,6 +43,82 @@ MONTHLY_SEASONALITY = {
     'fourier_order': 2
 }
 
+WORKER_WARM_UP = True  # ყოველი worker პროცესი სტარტზე ერთ საცდელ ფიტს აკეთებს
+
+# --- FIT DEADLINES ---
+# ფიტი, რომელიც FIT_TIMEOUT_SECONDS-ს აჭარბებს, წყდება (CmdStan ჩერდება) და SKU median_add_3m-ს იღებს ('fit_timeout')
+FIT_TIMEOUT_SECONDS = float(os.getenv('FIT_TIMEOUT_SECONDS', 120))  # 0 = ლიმიტის გარეშე
+# დავალება, რომელიც ამაზე დიდხანს გრძელდება (მაგ. გაჭედილი CmdStan), მის worker-ს მშობელი პროცესი კლავს და
+# ცვლის ახლით ('task_timeout'); 0 = გამორთული (მაშინ დავალებები chunk-ებად იგზავნება)
+TASK_HARD_TIMEOUT_SECONDS = float(os.getenv('TASK_HARD_TIMEOUT_SECONDS', 300))
+TASK_WINDOW_PER_WORKER = 2  # ერთდროულად გაგზავნილი დავალებები თითო worker-ზე (დანარჩენი რიგში რჩება მშობელთან)
+
+# --- STREAMING ---
+# შედეგები KPI ფაილში იწერება პროგნოზირების პარალელურად (მხოლოდ prophet ძრავისთვის)
+# მეხსიერებაში არ ინახება შედეგების სია და საბოლოო ცხრილი; df_raw, KPI ბაზა და დავალებების რიგი კი კატალოგის ზომისაა
+STREAMING = os.getenv('STREAMING', '1') == '1'
+STREAM_CHUNKS_PER_WORKER = 4  # რამდენ ნაწილად (chunk) ნაწილდება დავალებები თითო worker-ზე
+STREAM_MAX_CHUNKSIZE = 64
+STREAM_FLUSH_EVERY = 500  # რამდენი შედეგის შემდეგ ჩაიწეროს KPI სტრიქონები ფაილში
+
+# --- FORECAST ENGINE ---
+# "prophet" - ერთი Prophet/Stan ფიტი თითო ბარკოდზე
+# "batched" - ყველა ბარკოდი ერთად, რეგულარიზებული უმცირესი კვადრატებით (NumPy)
+# "hierarchical" - ერთი Prophet მოდელი კატეგორიაზე, პროგნოზი SKU-ებზე ნაწილდება წილის მიხედვით
+FORECAST_ENGINE = os.getenv('FORECAST_ENGINE', 'prophet')
+BATCHED_NOISE_SCALE = 0.05  # ხმაურის სკალა (y-ის სკალირებულ ერთეულებში) რეგულარიზაციისთვის
+# Prophet-თან შესადარებელი ბარკოდები: N სერიული Prophet ფიტი მშობელ პროცესში, მხოლოდ მოთხოვნით (მაგ. 30)
+BATCHED_COMPARE_SAMPLE = int(os.getenv('BATCHED_COMPARE_SAMPLE', 0))
+
+# --- HIERARCHICAL FORECASTING (FORECAST_ENGINE = "hierarchical") ---
+HIERARCHY_LEVEL = 'subcategory'  # ჯგუფის სვეტი additional_data-ში (ცარიელზე mother_cat_name)
+HIERARCHY_INDIVIDUAL_QUANTILE = 0.8  # median_add_3m-ის ამ კვანტილზე მაღალი SKU-ები ინდივიდუალურად ფიტდება
+HIERARCHY_MIN_GROUP_SIZE = 3  # უფრო პატარა ჯგუფების წევრები ინდივიდუალურად ფიტდება
+HIERARCHY_SHARE_MONTHS = 3  # წილი ითვლება ბოლო N თვის გაყიდვებით
+# ბოლო თვის შედარება per-SKU-სთან: N SKU-ს სერიული ფიტი მშობელ პროცესში, მხოლოდ მოთხოვნით (მაგ. 30)
+HIERARCHY_COMPARE_SAMPLE = int(os.getenv('HIERARCHY_COMPARE_SAMPLE', 0))
+
+# --- WARM START ---
+# წინა გაშვების პარამეტრები (k, m, delta, beta, sigma_obs) გამოიყენება საწყის წერტილად
+WARM_START = os.getenv('WARM_START', '1') == '1'
+
+# --- RESULT CACHE ---
+# უცვლელი მონაცემების მქონე ბარკოდებისთვის პროგნოზი ქეშიდან იკითხება (Stan-ის გარეშე)
+RESULT_CACHE = os.getenv('RESULT_CACHE', '1') == '1'
+FORCE_REFIT = os.getenv('FORCE_REFIT', '0') == '1'  # ქეშის იგნორირება (იგივეა, რაც --refit)
+# ზედა ზღვარი ბაიტებში (გასაღები + შიგთავსი); ძველი ჩანაწერები LRU-ით იშლება
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(100 * 1024 ** 2)))
+CV_FOLD_CACHE_MAX_BYTES = int(os.getenv('CV_FOLD_CACHE_MAX_BYTES', str(1024 ** 3)))
+
+# --- MODEL STORE ---
+# ფიტირებული Prophet მოდელები ინახება (JSON) მონაცემების fingerprint-თან ერთად;
+# --predict-only რეჟიმი მათ პირდაპირ იყენებს და თავიდან ფიტავს მხოლოდ შეცვლილ სერიებს
+MODEL_STORE = os.getenv('MODEL_STORE', '1') == '1'
+PREDICT_ONLY = os.getenv('PREDICT_ONLY', '0') == '1'  # იგივეა, რაც --predict-only
+
+# --- RUN JOURNAL ---
+# დასრულებული პროგნოზები იწერება დისკზე ჟურნალში; შეწყვეტილი გაშვება გრძელდება --resume-ით
+JOURNAL_FSYNC_EVERY = 50  # fsync ყოველ N ჩანაწერზე (flush ყოველ ჩანაწერზე ხდება)
+
+# --- SHARDING (python main.py --shard i/N, შემდეგ --merge-shards) ---
+# "hash" - ბარკოდის სტაბილური ჰეში; "cost" - სერიის სიგრძით დაბალანსებული დაყოფა
+SHARD_BALANCE = os.getenv('SHARD_BALANCE', 'hash')
+
+# --- HYPERPARAMETER TUNING (python main.py --tune) ---
+# სეგმენტზე (კატეგორია x მოცულობის დონე) successive halving: ყველა კონფიგურაცია ფასდება რამდენიმე SKU-ზე,
+# საუკეთესო 1/TUNING_ETA გადადის შემდეგ საფეხურზე TUNING_ETA-ჯერ მეტი SKU-ით
+TUNING_GRID = {
+    'changepoint_prior_scale': [0.01, 0.03, 0.06, 0.15, 0.5],
+    'seasonality_prior_scale': [0.01, 0.08, 1.0, 10.0],
+}
+TUNING_VOLUME_TIERS = 3  # median_add_3m-ის კვანტილური დონეები სეგმენტებისთვის
+TUNING_HOLDOUT_MONTHS = 2  # ბოლო N თვე ფიტში არ შედის და მასზე ფასდება შეცდომა
+TUNING_MIN_SKUS = 3  # პირველი საფეხურის SKU-ები; უფრო პატარა სეგმენტები დონის მიხედვით ერთიანდება
+TUNING_MAX_SKUS = 27  # მაქსიმუმ ამდენი SKU თითო სეგმენტზე (ბოლო საფეხური)
+TUNING_ETA = 3
+TUNING_SEED = 42
+TUNED_PARAMS = os.getenv('TUNED_PARAMS', '1') == '1'  # forecast_one იყენებს სეგმენტის საუკეთესო პარამეტრებს
+
 # --- FORECASTING LOGIC PARAMETERS ---
 MIN_DATA_POINTS_FOR_FORECAST = 6  # მინიმუმ 6 თვის მონაცემი
 STD_DEV_THRESHOLD = 0.01  # მინიმალური სტანდარტული გადახრა
@@ -38,11 +131,28 @@ CV_INITIAL = '180 days'
 CV_PERIOD = '30 days'
 CV_HORIZON = '30 days'
 MIN_DATA_POINTS_FOR_CV = 10 # მინიმუმ 10 თვის მონაცემი შეფასებისთვის
+CV_CUTOFF_THREADS = int(os.getenv('CV_CUTOFF_THREADS', 2))  # პარალელური cutoff-ები ერთი ბარკოდის შიგნით
+
+# --- FORECAST LEDGER (python ledger.py) ---
+ACCURACY_LOOKBACK_MONTHS = 6  # რამდენი ბოლო დასრულებული სამიზნე თვე ფასდება
 
 # --- OPTIMIZATION PARAMETERS ---
 TOTAL_BUDGET = 1_000_000
+# ბიუჯეტის ლიმიტები ჯგუფებზე, მაგ. {'mother_cat_name': {'Food': 200_000}, 'supplier_name': 50_000}
+OPTIMIZATION_CAPS = {}
 
 # --- OUTPUT PARAMETERS ---
 OUTPUT_FOLDER = "output"
+SNAPSHOT_FOLDER = os.path.join(OUTPUT_FOLDER, "snapshots")  # იხ. DATA SNAPSHOT
 FINAL_KPI_FILENAME = "final_kpis.csv"
-EVALUATION_FILENAME = "evaluation_metrics.csv"
\ No newline at end of file
+EVALUATION_FILENAME = "evaluation_metrics.csv"
+BENCHMARK_FILENAME = "benchmark_results.csv"  # benchmark.py-ის შედეგები (ყოველი გაშვება ემატება)
+PARAM_STORE_PATH = os.path.join(OUTPUT_FOLDER, "prophet_params.sqlite")
+RESULT_CACHE_PATH = os.path.join(OUTPUT_FOLDER, "forecast_cache.sqlite")
+MODEL_STORE_PATH = os.path.join(OUTPUT_FOLDER, "prophet_models.sqlite")
+JOURNAL_FOLDER = os.path.join(OUTPUT_FOLDER, "journal")  # journal_<RUN_ID>.jsonl
+SHARD_FOLDER = os.path.join(OUTPUT_FOLDER, "shards")  # <RUN_ID>/shard_<i>of<N>.csv
+TUNED_PARAMS_PATH = os.path.join(OUTPUT_FOLDER, "tuned_params.json")  # python main.py --tune
+LEDGER_FOLDER = os.path.join(OUTPUT_FOLDER, "ledger")  # run_month=YYYY-MM/<RUN_ID>.parquet
+ACCURACY_FILENAME = "forecast_accuracy.csv"
+PROFILE_SLOWEST_N = 20  # run_profile_<RUN_ID>.json-ში ჩაწერილი ყველაზე ნელი ბარკოდები
\ No newline at end of file
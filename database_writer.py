@@ -1,71 +1,111 @@
 # database_writer.py
 
+import io
+import time
+from typing import Iterable, Union
 import pandas as pd
-import os
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from db import get_engine
 
-# .env ფაილიდან ცვლადების ჩატვირთვა
-load_dotenv()
+# COPY-ით ერთ ჯერზე გასაგზავნი სტრიქონების რაოდენობა
+COPY_CHUNK_ROWS = 50_000
 
 def get_sqlalchemy_engine():
     """
-    Creates an SQLAlchemy engine from environment variables for efficient data writing.
+    Returns the shared pooled engine from db.py (created on first use), or None if the
+    database is not configured or unreachable.
     """
-    db_user = os.getenv("DB_USER")
-    db_password = os.getenv("DB_PASSWORD")
-    db_host = os.getenv("DB_HOST")
-    db_port = os.getenv("DB_PORT")
-    db_name = os.getenv("DB_NAME")
-
-    if not all([db_user, db_password, db_host, db_name]):
-        print("ERROR: Database environment variables are not set.")
-        return None
-
-    # SQLAlchemy კავშირის URL ფორმატი PostgreSQL-სთვის
-    db_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-    
     try:
-        engine = create_engine(db_url)
-        # შევამოწმოთ კავშირი
-        with engine.connect() as connection:
-            print("INFO: SQLAlchemy engine created and connection successful.")
+        engine = get_engine()
+        # შევამოწმოთ კავშირი (pool-იდან, ახალი engine-ის გარეშე)
+        with engine.connect():
+            pass
         return engine
     except Exception as e:
         print(f"ERROR: Could not create SQLAlchemy engine: {e}")
         return None
 
-def save_results_to_db(df: pd.DataFrame, table_name: str):
+def _copy_into(engine: Engine, df: pd.DataFrame, table_name: str):
+    """Streams the rows into an existing table with PostgreSQL COPY FROM STDIN, chunk by chunk."""
+    columns = ", ".join(f'"{col}"' for col in df.columns)
+    sql = f'COPY "{table_name}" ({columns}) FROM STDIN WITH (FORMAT csv)'
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            for start in range(0, len(df), COPY_CHUNK_ROWS):
+                buffer = io.StringIO()
+                df.iloc[start:start + COPY_CHUNK_ROWS].to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+def _swap_in(engine: Engine, staging: str, table_name: str):
+    """Replaces the target table with the staging table in one transaction."""
+    old = f"{table_name}__old"
+    with engine.begin() as connection:
+        connection.execute(text(f'DROP TABLE IF EXISTS "{old}"'))
+        if inspect(connection).has_table(table_name):
+            connection.execute(text(f'ALTER TABLE "{table_name}" RENAME TO "{old}"'))
+        connection.execute(text(f'ALTER TABLE "{staging}" RENAME TO "{table_name}"'))
+        connection.execute(text(f'DROP TABLE IF EXISTS "{old}"'))
+
+def _without_excel_prefix(df: pd.DataFrame) -> pd.DataFrame:
+    # --- მნიშვნელოვანი: Excel-ისთვის დამატებული აპოსტროფის მოშორება ---
+    # `main.py`-ში ბარკოდს ვუმატებთ "'" პრეფიქსს. ეს ბაზაში არ უნდა შევინახოთ.
+    df_to_save = df.copy()
+    if 'barcode' in df_to_save.columns:
+        df_to_save['barcode'] = df_to_save['barcode'].astype(str).str.lstrip("'")
+    return df_to_save
+
+def save_results_to_db(df: Union[pd.DataFrame, Iterable[pd.DataFrame]], table_name: str, engine: Engine = None):
     """
     Saves a DataFrame to a PostgreSQL table, completely replacing the table on each run.
+    Rows are bulk-loaded into a staging table (COPY on PostgreSQL, batched inserts elsewhere)
+    which is then renamed over the target inside a transaction, so readers never see a
+    missing or half-written table.
+    df may also be an iterable of DataFrames with the same columns and dtypes (e.g. a chunked
+    pd.read_csv); they are loaded one at a time, so the table never has to fit in memory.
     """
     print(f"INFO: Preparing to save results to database table '{table_name}'...")
-    
-    engine = get_sqlalchemy_engine()
+
+    engine = engine or get_sqlalchemy_engine()
     if engine is None:
         print("WARNING: Could not get database engine. Skipping database save.")
         return
 
-    # --- მნიშვნელოვანი: Excel-ისთვის დამატებული აპოსტროფის მოშორება ---
-    # `main.py`-ში ბარკოდს ვუმატებთ "'" პრეფიქსს. ეს ბაზაში არ უნდა შევინახოთ.
-    df_to_save = df.copy()
-    if 'barcode' in df_to_save.columns:
-        df_to_save['barcode'] = df_to_save['barcode'].astype(str).str.lstrip("'")
-
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+    staging = f"{table_name}__staging"
+    start = time.perf_counter()
     try:
-        # ვიყენებთ pandas-ის to_sql მეთოდს. if_exists='replace' წაშლის ძველ ცხრილს
-        # და მის ადგილას შექმნის ახალს ამ DataFrame-ის სტრუქტურით.
-        df_to_save.to_sql(
-            name=table_name,
-            con=engine,
-            if_exists='replace',
-            index=False,
-            method='multi' # ეფექტურია დიდი რაოდენობის მონაცემების ჩაწერისთვის
-        )
-        print(f"SUCCESS: {len(df_to_save)} rows saved to table '{table_name}'. The old table was replaced.")
+        rows = 0
+        for i, chunk in enumerate(chunks):
+            df_to_save = _without_excel_prefix(chunk)
+            if i == 0:
+                # ცარიელი staging ცხრილი DataFrame-ის სტრუქტურით
+                df_to_save.head(0).to_sql(name=staging, con=engine, if_exists='replace', index=False)
+
+            if engine.dialect.name == 'postgresql':
+                _copy_into(engine, df_to_save, staging)
+            else:
+                df_to_save.to_sql(name=staging, con=engine, if_exists='append', index=False, chunksize=COPY_CHUNK_ROWS)
+            rows += len(df_to_save)
+
+        _swap_in(engine, staging, table_name)
+        elapsed = time.perf_counter() - start
+        rate = rows / elapsed if elapsed > 0 else float('inf')
+        print(f"SUCCESS: {rows} rows saved to table '{table_name}' in {elapsed:.2f}s "
+              f"({rate:,.0f} rows/s). The old table was replaced.")
     except Exception as e:
         print(f"ERROR: Failed to save data to database table '{table_name}': {e}")
-    finally:
-        # გავათავისუფლოთ რესურსები
-        if engine:
-            engine.dispose()
\ No newline at end of file
+        # staging-ის დასუფთავება; სამიზნე ცხრილი უცვლელი რჩება
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(f'DROP TABLE IF EXISTS "{staging}"'))
+        except Exception:
+            pass
@@ -1,18 +1,28 @@
 # db.py
 
 import os
-import sys
-import psycopg2
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 # .env ფაილიდან ცვლადების ჩატვირთვა
 load_dotenv()
 
-def get_db_connection():
+# კავშირი არ იხსნება იმპორტისას: engine და pool იქმნება პირველი გამოყენებისას
+_engine = None
+_engine_lock = threading.Lock()
+# თითო ნაკადს საკუთარი კავშირი აქვს, რომ პარალელური მოთხოვნები ერთმანეთს არ ელოდონ
+_thread_state = threading.local()
+
+def get_database_url() -> str:
     """
-    Establishes a secure connection to the database using environment variables.
-    Exits the program if required variables are not set.
+    Builds the database URL from environment variables.
+    DATABASE_URL (e.g. sqlite:///local.db) overrides the DB_* variables.
     """
+    db_url = os.getenv("DATABASE_URL")
+    if db_url:
+        return db_url
+
     db_user = os.getenv("DB_USER")
     db_password = os.getenv("DB_PASSWORD")
     db_host = os.getenv("DB_HOST")
@@ -20,21 +30,64 @@ def get_db_connection():
     db_name = os.getenv("DB_NAME")
 
     if not all([db_user, db_password, db_host, db_name]):
-        print("Error: Database environment variables (DB_USER, DB_PASSWORD, DB_HOST, DB_NAME) must be set.", file=sys.stderr)
-        sys.exit(1)
+        raise RuntimeError("Database environment variables (DB_USER, DB_PASSWORD, DB_HOST, DB_NAME) must be set.")
+
+    return f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
+def get_engine():
+    """
+    Returns the process-wide pooled SQLAlchemy engine, creating it on first use.
+    Nothing connects until a connection is actually checked out.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from sqlalchemy import create_engine
+                _engine = create_engine(
+                    get_database_url(),
+                    pool_pre_ping=True,
+                    pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+                )
+    return _engine
+
+@contextmanager
+def pooled_connection():
+    """Checks a DBAPI (psycopg2) connection out of the pool and returns it afterwards."""
+    conn = get_engine().raw_connection()
     try:
-        conn = psycopg2.connect(
-            user=db_user,
-            password=db_password,
-            host=db_host,
-            port=db_port,
-            database=db_name
-        )
-        return conn
-    except psycopg2.OperationalError as e:
-        print(f"Error: Could not connect to the database: {e}", file=sys.stderr)
-        sys.exit(1)
-
-# ერთი კავშირის ობიექტი, რომელსაც მოდულები გამოიყენებენ
-db_connection = get_db_connection()
\ No newline at end of file
+        yield conn
+    finally:
+        conn.close()  # აბრუნებს pool-ში, არ ხურავს ფიზიკურ კავშირს
+
+def get_db_connection():
+    """
+    Returns the pooled DBAPI connection of the calling thread, opening it on first use.
+    Each thread gets its own, so queries issued from several threads run concurrently.
+    Raises RuntimeError if the database is not configured or unreachable.
+    """
+    connection = getattr(_thread_state, 'connection', None)
+    if connection is None:
+        try:
+            connection = _thread_state.connection = get_engine().raw_connection()
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Could not connect to the database: {e}") from e
+    return connection
+
+def release_db_connection():
+    """Returns the calling thread's connection to the pool (for short-lived loader threads)."""
+    connection = getattr(_thread_state, 'connection', None)
+    if connection is not None:
+        _thread_state.connection = None
+        connection.close()
+
+class _LazyConnection:
+    """Stand-in for the old module-level connection: connects on first attribute access."""
+
+    def __getattr__(self, name):
+        return getattr(get_db_connection(), name)
+
+# კავშირის ობიექტი, რომელსაც მოდულები გამოიყენებენ (თითო ნაკადზე, იხსნება პირველი გამოყენებისას)
+db_connection = _LazyConnection()
@@ -1,58 +1,156 @@
 # evaluate.py
 
+import os
+import time
 import pandas as pd
-from prophet.diagnostics import cross_validation, performance_metrics
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+from prophet.diagnostics import generate_cutoffs, performance_metrics
 import logging
-from typing import Union
+from typing import Union, List, Tuple
+from tqdm import tqdm
 import config
-from utils import create_prophet_model
+from utils import create_prophet_model, config_snapshot
+from param_store import to_init
+from result_cache import fold_key, get_cached_fold, put_cached_fold
+from holiday_index import holiday_index_for
+from scheduler import plan_workers, limit_worker_threads
 
 logging.getLogger('prophet').setLevel(logging.ERROR)
 logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
 
+def _fit_folds(history: pd.DataFrame, cutoffs: List[pd.Timestamp], combined_holidays: pd.DataFrame) -> Tuple[List[pd.DataFrame], int]:
+    """
+    Fits consecutive cutoffs in order. Each fit is warm-started from the previous cutoff's
+    parameters (the training windows overlap almost entirely), and folds whose inputs are
+    unchanged since an earlier run are read from the cache instead of refitted.
+    Returns (fold predictions, number of folds served from the cache).
+    """
+    horizon = pd.Timedelta(config.CV_HORIZON)
+    index = holiday_index_for(combined_holidays)
+    folds, cached, init = [], 0, None
+    for cutoff in cutoffs:
+        train = history[history['ds'] <= cutoff]
+        test = history[(history['ds'] > cutoff) & (history['ds'] <= cutoff + horizon)]
+        if len(train) < 2 or test.empty:
+            continue
+
+        fold_holidays = index.for_dates(pd.concat([train['ds'], test['ds']]))
+        key = None
+        if config.RESULT_CACHE:
+            key = fold_key(train, test['ds'], fold_holidays)
+            fold = None if config.FORCE_REFIT else get_cached_fold(key)
+            if fold is not None:
+                folds.append(fold)
+                cached += 1
+                continue
+
+        model = create_prophet_model(fold_holidays if not fold_holidays.empty else None, growth_type='linear')
+        model.fit(train, **({'init': init} if init is not None else {}))
+        init = to_init(model.params)
+
+        forecast = model.predict(test[['ds']])
+        fold = pd.DataFrame({'ds': test['ds'].values, 'yhat': forecast['yhat'].values,
+                             'y': test['y'].values, 'cutoff': cutoff})
+        if key is not None:
+            put_cached_fold(key, fold)
+        folds.append(fold)
+    return folds, cached
+
+
 def evaluate_model_accuracy(barcode: str, group: pd.DataFrame, combined_holidays: pd.DataFrame) -> Union[pd.DataFrame, None]:
     """
     Performs cross-validation for a single product and returns performance metrics.
+    Cutoffs are split into CV_CUTOFF_THREADS contiguous chunks that are fitted in parallel threads.
     """
     df = group.copy()
     df['ds'] = pd.to_datetime(df['transaction_month'])
-    
+
     demand_cols = ['rolling_median_add', 'avg_daily_demand', 'avg_daily_demand_real']
     y_col = next((col for col in demand_cols if col in df.columns and df[col].notna().any()), None)
-    
+
     if not y_col:
         print(f"INFO: No suitable demand column for evaluation of barcode {barcode}")
         return None
 
     df['y'] = df[y_col]
-    df = df[['ds', 'y']].dropna().drop_duplicates(subset=['ds'])
+    df = df[['ds', 'y']].dropna().drop_duplicates(subset=['ds']).sort_values('ds').reset_index(drop=True)
 
     if len(df) < config.MIN_DATA_POINTS_FOR_CV:
         print(f"INFO: Not enough data for CV for barcode {barcode} (has {len(df)}, needs {config.MIN_DATA_POINTS_FOR_CV}).")
         return None
 
     try:
-        # Use the same model creation logic for consistency
-        model = create_prophet_model(combined_holidays, growth_type='linear')
-        
         # NOTE: For evaluation, complex logic like logistic growth can make CV unstable.
         # We stick to linear to get a baseline performance metric.
-        model.fit(df[['ds', 'y']])
-
-        df_cv = cross_validation(
-            model, 
-            initial=config.CV_INITIAL,
-            period=config.CV_PERIOD,
-            horizon=config.CV_HORIZON,
-            disable_tqdm=True,
-            error_score='raise'
-        )
-        
+        cutoffs = generate_cutoffs(df, pd.Timedelta(config.CV_HORIZON),
+                                   pd.Timedelta(config.CV_INITIAL), pd.Timedelta(config.CV_PERIOD))
+
+        chunks = [list(chunk) for chunk in np.array_split(np.array(cutoffs, dtype=object), config.CV_CUTOFF_THREADS) if len(chunk)]
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            chunk_results = list(executor.map(lambda chunk: _fit_folds(df, chunk, combined_holidays), chunks))
+
+        folds = [fold for chunk_folds, _ in chunk_results for fold in chunk_folds]
+        if not folds:
+            raise ValueError("no cutoff produced a forecast")
+        df_cv = pd.concat(folds, ignore_index=True)
+
         df_perf = performance_metrics(df_cv)
-        print(f"SUCCESS: CV completed for barcode {barcode}.")
+        cached = sum(n for _, n in chunk_results)
+        print(f"SUCCESS: CV completed for barcode {barcode} ({len(folds)} folds, {cached} from cache).")
         df_perf['barcode'] = barcode
+        df_perf['n_folds'] = len(folds)
+        df_perf['cached_folds'] = cached
         return df_perf
 
     except Exception as e:
         print(f"WARNING: Cross-validation failed for barcode {barcode}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def evaluate_stored(barcode: str) -> Tuple[str, Union[pd.DataFrame, None], float]:
+    """Pool task: cross-validates a barcode from the worker's shared series store and times it."""
+    from prophecy import worker_series, worker_holidays
+
+    start = time.perf_counter()
+    df_perf = evaluate_model_accuracy(barcode, worker_series(barcode), worker_holidays())
+    return barcode, df_perf, time.perf_counter() - start
+
+
+def run_evaluation(store, combined_holidays: pd.DataFrame) -> str:
+    """
+    Cross-validates every barcode of the series store in a process pool and appends the
+    metrics to EVALUATION_FILENAME as each SKU finishes. Processes x cutoff threads stay
+    within the available cores.
+    """
+    from prophecy import init_worker
+
+    os.makedirs(config.OUTPUT_FOLDER, exist_ok=True)
+    output_path = os.path.join(config.OUTPUT_FOLDER, config.EVALUATION_FILENAME)
+    processes, _ = plan_workers(threads_per_task=config.CV_CUTOFF_THREADS)
+    limit_worker_threads(1)  # parallelism comes from the cutoff threads, not from BLAS/OpenMP
+    barcodes = store.barcodes
+
+    start = time.perf_counter()
+    timings, evaluated = [], 0
+    init_args = (combined_holidays, config_snapshot(), store.handle())
+    with open(output_path, 'w', encoding='utf-8-sig', newline='') as out, \
+            get_context("spawn").Pool(processes=processes, initializer=init_worker, initargs=init_args) as pool:
+        header = True
+        for barcode, df_perf, seconds in tqdm(pool.imap_unordered(evaluate_stored, barcodes), total=len(barcodes), desc="Evaluating"):
+            timings.append(seconds)
+            if df_perf is None:
+                continue
+            df_perf['eval_seconds'] = round(seconds, 3)
+            df_perf.to_csv(out, index=False, header=header)
+            out.flush()
+            header = False
+            evaluated += 1
+
+    elapsed = time.perf_counter() - start
+    if timings:
+        print(f"INFO: Evaluated {evaluated}/{len(barcodes)} barcodes in {elapsed:.1f}s "
+              f"({len(barcodes) / elapsed:.2f} SKUs/s, {processes} processes x {config.CV_CUTOFF_THREADS} cutoff threads). "
+              f"Per-SKU time: mean {np.mean(timings):.2f}s, max {np.max(timings):.2f}s.")
+    return output_path
@@ -0,0 +1,29 @@
+# file_lock.py
+
+import contextlib
+import os
+import sys
+
+
+@contextlib.contextmanager
+def folder_lock(folder: str):
+    """
+    Exclusive lock on a folder (its .lock file), so processes sharing it (e.g. concurrent
+    --shard runs on one machine, or two order exports) take turns instead of racing.
+    """
+    with open(os.path.join(folder, ".lock"), 'a+') as lock_file:
+        if sys.platform == 'win32':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == 'win32':
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
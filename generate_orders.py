@@ -2,68 +2,222 @@
 
 import pandas as pd
 import os
+import json
+import shutil
 import logging
-from db import db_connection  
+import argparse
+import time
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import psycopg2.extensions
+from db import pooled_connection
+from file_lock import folder_lock
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def fetch_and_save_orders_data():
+ORDERS_DIR = os.path.join("output", "orders")
+WATERMARK_FILE = os.path.join(ORDERS_DIR, "_watermark.json")
+CHUNK_ROWS = 100_000  # სერვერული კურსორიდან ერთ ჯერზე წამოღებული სტრიქონები
+LOOKBACK_DAYS = 35  # ბოლო თვეები თავიდან იტვირთება, რათა დაბრუნებები/ცვლილებებიც აისახოს
+EXPORT_FORMAT = os.getenv("ORDERS_EXPORT_FORMAT", "parquet")  # "parquet" ან "csv"
+
+ORDERS_SELECT = """
+select id as order_id,
+       paid_date,
+       user_id,
+       product_id,
+       barcode,
+       product_name,
+       round(price::numeric, 2) as price,
+       round(cost::numeric, 2) as cost,
+       round(beginning_quantity::numeric, 2) as beginning_quantity,
+       round(refunded_quantity::numeric, 2) as refunded_quantity,
+       round(quantity::numeric, 2) as quantity,
+       round(cogs::numeric, 2) as cogs,
+       round(revenue::numeric, 2) as revenue,
+       card,
+       transaction_payment_method,
+       is_juridical,
+       card_type,
+       brand,
+       supplier,
+       mother_cat_name,
+       subcategory,
+       round(vendor_cashback::numeric, 2) as vendor_cashback,
+       cashback_campaign_name,
+       round(voucher_cashback::numeric, 2) as voucher_cashback,
+       round(promotion_cashback::numeric, 2) as promotion_cashback
+from table_of_orders
+"""
+
+# numeric -> float, რათა ყველა ნაწილს (part) ერთნაირი სქემა ჰქონდეს
+DEC2FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, 'DEC2FLOAT',
+    lambda value, cursor: float(value) if value is not None else None)
+
+# PostgreSQL-ის ტიპის OID -> Arrow-ის ტიპი (დანარჩენი ტექსტად იწერება)
+PG_ARROW_TYPES = {
+    16: pa.bool_(),                          # bool
+    20: pa.int64(), 21: pa.int64(), 23: pa.int64(),  # int8, int2, int4
+    700: pa.float64(), 701: pa.float64(),    # float4, float8
+    1700: pa.float64(),                      # numeric (DEC2FLOAT)
+    1082: pa.date32(),                       # date
+    1114: pa.timestamp('us'),                # timestamp
+    1184: pa.timestamp('us', tz='UTC'),      # timestamptz
+}
+
+def _read_watermark():
+    if not os.path.exists(WATERMARK_FILE):
+        return None
+    with open(WATERMARK_FILE) as f:
+        return pd.Timestamp(json.load(f)['paid_date'])
+
+def _write_watermark(paid_date: pd.Timestamp):
+    with open(WATERMARK_FILE, 'w') as f:
+        json.dump({'paid_date': paid_date.isoformat()}, f)
+
+def _partition_name(month) -> str:
+    return f"paid_month={month}"
+
+def _arrow_schema(description) -> pa.Schema:
     """
-    Fetches detailed orders data from the database using the existing connection
-    and saves it to a CSV file.
+    One schema for every part file, taken from the query's column types rather than inferred
+    per chunk (where an all-NULL or whole-number chunk would get a different type).
     """
-    logging.info("Starting to fetch detailed orders data...")
-    
-    sql_query = """
-    select id as order_id,
-           paid_date,
-           user_id,
-           product_id,
-           barcode,
-           product_name,
-           round(price::numeric, 2) as price,
-           round(cost::numeric, 2) as cost,
-           round(beginning_quantity::numeric, 2) as beginning_quantity,
-           round(refunded_quantity::numeric, 2) as refunded_quantity,
-           round(quantity::numeric, 2) as quantity,
-           round(cogs::numeric, 2) as cogs,
-           round(revenue::numeric, 2) as revenue,
-           card,
-           transaction_payment_method,
-           is_juridical,
-           card_type,
-           brand,
-           supplier,
-           mother_cat_name,
-           subcategory,
-           round(vendor_cashback::numeric, 2) as vendor_cashback,
-           cashback_campaign_name,
-           round(voucher_cashback::numeric, 2) as voucher_cashback,
-           round(promotion_cashback::numeric, 2) as promotion_cashback
-    from table_of_orders
+    return pa.schema([(col[0], PG_ARROW_TYPES.get(col[1], pa.string())) for col in description])
+
+def _write_chunk(chunk: pd.DataFrame, staging_dir: str, part: int, schema: pa.Schema):
+    """Writes one fetched chunk as a part file into each paid_date month it touches."""
+    months = pd.to_datetime(chunk['paid_date']).dt.strftime('%Y-%m').fillna('unknown')
+    for month, rows in chunk.groupby(months):
+        month_dir = os.path.join(staging_dir, _partition_name(month))
+        os.makedirs(month_dir, exist_ok=True)
+        path = os.path.join(month_dir, f"part-{part:05d}.{EXPORT_FORMAT}")
+        table = pa.Table.from_pandas(rows, schema=schema, preserve_index=False)
+        if EXPORT_FORMAT == 'parquet':
+            pq.write_table(table, path)
+        else:
+            pa_csv.write_csv(table, path)
+
+def _recover_interrupted():
+    """
+    Cleans up after exports that crashed (under any PID): their _staging_* folders are deleted,
+    and partitions a _publish moved aside into _replaced_* before its new ones were in place
+    are put back. Runs under the export lock, so none of these folders belongs to a live export.
+    """
+    for staging in os.listdir(ORDERS_DIR):
+        if staging.startswith("_staging_"):
+            logging.warning(f"Removing {staging} left by an interrupted export.")
+            shutil.rmtree(os.path.join(ORDERS_DIR, staging))
+    for aside in os.listdir(ORDERS_DIR):
+        if not aside.startswith("_replaced_"):
+            continue
+        aside_dir = os.path.join(ORDERS_DIR, aside)
+        for name in os.listdir(aside_dir):
+            if not os.path.exists(os.path.join(ORDERS_DIR, name)):
+                logging.warning(f"Restoring partition {name} left aside by an interrupted export.")
+                os.replace(os.path.join(aside_dir, name), os.path.join(ORDERS_DIR, name))
+        shutil.rmtree(aside_dir)
+
+def _publish(staging_dir: str, since_month):
     """
-    
+    Replaces the exported month partitions with the freshly fetched ones.
+    Months from since_month onwards were fetched completely, so their old files are dropped.
+    Old partitions are first renamed aside, the new ones renamed in, and only then are the old
+    ones deleted, so a crash never leaves a month without data (see _recover_interrupted).
+    """
+    aside_dir = os.path.join(ORDERS_DIR, f"_replaced_{os.getpid()}")
+    os.makedirs(aside_dir, exist_ok=True)
+    for name in os.listdir(ORDERS_DIR):
+        if not name.startswith("paid_month="):
+            continue
+        month = name[len("paid_month="):]
+        if since_month is None or (month != 'unknown' and month >= since_month):
+            os.replace(os.path.join(ORDERS_DIR, name), os.path.join(aside_dir, name))
+    for name in os.listdir(staging_dir):
+        os.replace(os.path.join(staging_dir, name), os.path.join(ORDERS_DIR, name))
+    shutil.rmtree(aside_dir)
+    shutil.rmtree(staging_dir)
+
+def _export(full: bool):
+    """The body of fetch_and_save_orders_data, run under the export lock."""
+    watermark = None if full else _read_watermark()
+    since = None
+    sql_query = ORDERS_SELECT
+    params = {}
+    if watermark is not None:
+        since = (watermark - pd.Timedelta(days=LOOKBACK_DAYS)).replace(day=1).normalize()
+        sql_query += "where paid_date >= %(since)s\n"
+        params['since'] = since.to_pydatetime()
+        logging.info(f"Incremental export: fetching orders paid since {since.date()} (watermark {watermark}).")
+    else:
+        logging.info("Full export: fetching the whole order history.")
+
+    staging_dir = os.path.join(ORDERS_DIR, f"_staging_{os.getpid()}")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    start = time.perf_counter()
+    total_rows = 0
+    max_paid_date = watermark
     try:
-        logging.info("Using existing database connection to execute query...")
-        
-        df_orders = pd.read_sql(sql_query, db_connection)
-        
-        if df_orders.empty:
+        logging.info("Using pooled database connection to execute query...")
+
+        # სახელიანი (server-side) კურსორი: მონაცემები ნაწილ-ნაწილ მოდის
+        with pooled_connection() as conn:
+            with conn.cursor(name="orders_export") as cursor:
+                psycopg2.extensions.register_type(DEC2FLOAT, cursor)
+                cursor.itersize = CHUNK_ROWS
+                cursor.execute(sql_query, params)
+                schema = None
+                part = 0
+                while True:
+                    rows = cursor.fetchmany(CHUNK_ROWS)
+                    if not rows:
+                        break
+                    chunk = pd.DataFrame(rows, columns=[col[0] for col in cursor.description])
+                    if schema is None:
+                        # a named cursor only has a description after the first fetch
+                        schema = _arrow_schema(cursor.description)
+                    _write_chunk(chunk, staging_dir, part, schema)
+                    chunk_max = pd.to_datetime(chunk['paid_date']).max()
+                    if pd.notna(chunk_max) and (max_paid_date is None or chunk_max > max_paid_date):
+                        max_paid_date = chunk_max
+                    total_rows += len(chunk)
+                    part += 1
+                    logging.info(f"Fetched {total_rows} rows so far...")
+            conn.commit()
+
+        if total_rows == 0:
             logging.warning("No data returned from the orders query.")
+            shutil.rmtree(staging_dir, ignore_errors=True)
             return
 
-        output_dir = "output"
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, "orders_details.csv")
-        
-        logging.info(f"Query successful. Saving {len(df_orders)} rows to {output_path}...")
-        df_orders.to_csv(output_path, index=False)
-        logging.info("Successfully saved the data.")
+        _publish(staging_dir, since.strftime('%Y-%m') if since is not None else None)
+        if max_paid_date is not None:
+            _write_watermark(max_paid_date)
+        logging.info(f"Successfully saved {total_rows} rows to {ORDERS_DIR} in {time.perf_counter() - start:.1f}s.")
 
     except Exception as e:
+        shutil.rmtree(staging_dir, ignore_errors=True)
         logging.error(f"An error occurred: {e}")
 
-if __name__ == "__main__":
-
-    fetch_and_save_orders_data()
+def fetch_and_save_orders_data(full: bool = False):
+    """
+    Exports detailed orders data into month-partitioned files under output/orders/.
+    Rows are streamed through a server-side cursor in CHUNK_ROWS chunks, so memory does not
+    grow with order history. After the first run only whole months from
+    (last paid_date - LOOKBACK_DAYS) onwards are fetched again and replaced.
+    The export holds ORDERS_DIR's lock, so a second export waits for the first to finish.
+    """
+    logging.info("Starting to fetch detailed orders data...")
+    os.makedirs(ORDERS_DIR, exist_ok=True)
+    with folder_lock(ORDERS_DIR):
+        _recover_interrupted()
+        _export(full)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export orders into month-partitioned files")
+    parser.add_argument('--full', action='store_true', help="ignore the paid_date watermark and export everything")
+    fetch_and_save_orders_data(full=parser.parse_args().full)
@@ -0,0 +1,191 @@
+# hierarchical.py
+
+import io
+import contextlib
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+from prophecy import DEMAND_COLS, forecast_one, forecast_fallback
+from pipeline import median_lookup
+from scheduler import estimate_costs
+
+GROUP_PREFIX = "group:"  # ჯგუფის სერიის "ბარკოდი" SeriesStore-ში და შედეგებში
+
+
+def _group_lookup(additional_data: pd.DataFrame) -> pd.Series:
+    """Pooling group per barcode: HIERARCHY_LEVEL, falling back to mother_cat_name where it is missing."""
+    if additional_data is None or additional_data.empty:
+        return pd.Series(dtype=object)
+    attrs = additional_data.drop_duplicates(subset=['barcode']).set_index('barcode')
+    group = attrs[config.HIERARCHY_LEVEL] if config.HIERARCHY_LEVEL in attrs.columns else pd.Series(np.nan, index=attrs.index)
+    if 'mother_cat_name' in attrs.columns:
+        group = group.fillna(attrs['mother_cat_name'])
+    return group.dropna().astype(str)
+
+
+def _member_months(df_raw: pd.DataFrame, barcodes) -> pd.DataFrame:
+    """One row per (barcode, month) with the demand columns and in_stock_days averaged, as prepare_series does."""
+    value_cols = [col for col in DEMAND_COLS if col in df_raw.columns] + ['in_stock_days']
+    members = df_raw[df_raw['barcode'].isin(set(barcodes))]
+    return members.groupby(['barcode', 'ds'], as_index=False)[value_cols].mean()
+
+
+def _aggregate(months: pd.DataFrame, group_of: pd.Series) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Sums member demand per group and month (in_stock_days is averaged) and computes each
+    member's share of its group's demand over the last HIERARCHY_SHARE_MONTHS months.
+    Returns (group series in the df_raw layout, share per barcode).
+    """
+    demand_cols = [col for col in DEMAND_COLS if col in months.columns]
+    months = months.assign(group=months['barcode'].map(group_of))
+
+    series = months.groupby(['group', 'ds'], as_index=False).agg(
+        {**{col: 'sum' for col in demand_cols}, 'in_stock_days': 'mean'})
+    series['barcode'] = GROUP_PREFIX + series['group'].astype(str)
+    series['transaction_month'] = series['ds']
+
+    last_month = months.groupby('group')['ds'].transform('max')
+    recent = months[months['ds'] > last_month - pd.DateOffset(months=config.HIERARCHY_SHARE_MONTHS)]
+    volume = recent.groupby('barcode')[demand_cols[0]].sum().reindex(group_of.index).fillna(0.0)
+    group_volume = volume.groupby(group_of).transform('sum')
+    group_size = volume.groupby(group_of).transform('size')
+    # ჯგუფში ბოლო თვეებში გაყიდვა არ ყოფილა: თანაბარი წილები
+    share = (volume / group_volume).where(group_volume > 0, 1.0 / group_size)
+    return series.drop(columns=['group']), share
+
+
+class Hierarchy:
+    """
+    Hierarchical plan for one run: SKUs above the HIERARCHY_INDIVIDUAL_QUANTILE volume threshold
+    (or without a group) keep their own fit; the rest are pooled into one model per group,
+    whose forecast is split back to the members by their recent share of group demand.
+    """
+
+    def __init__(self, df_raw: pd.DataFrame, additional_data: pd.DataFrame):
+        barcodes = pd.Index(df_raw['barcode'].unique()).sort_values()
+        medians = median_lookup(additional_data).reindex(barcodes).fillna(0.0)
+        group_of = _group_lookup(additional_data).reindex(barcodes)
+
+        positive = medians[medians > 0]
+        threshold = positive.quantile(config.HIERARCHY_INDIVIDUAL_QUANTILE) if len(positive) else np.inf
+        candidates = (medians > 0) & (medians < threshold) & group_of.notna()
+        sizes = group_of[candidates].value_counts()
+        pooled = candidates & group_of.isin(sizes[sizes >= config.HIERARCHY_MIN_GROUP_SIZE].index)
+
+        members = pd.DataFrame({'barcode': barcodes[pooled.to_numpy()],
+                                'group': group_of[pooled].to_numpy(),
+                                'median_add_3m': medians[pooled].to_numpy()})
+        self.group_series, share = _aggregate(_member_months(df_raw, members['barcode']),
+                                              members.set_index('barcode')['group'])
+        members['share'] = members['barcode'].map(share).fillna(0.0)
+
+        self.threshold = threshold
+        self.medians = medians
+        self.members = members
+        self.individual = [barcode for barcode in barcodes[~pooled.to_numpy()]]
+        self.group_medians = members.groupby('group')['median_add_3m'].sum()
+        self._by_group = {group: rows[['barcode', 'share', 'median_add_3m']].to_numpy()
+                          for group, rows in members.groupby('group')}
+        self.tasks: List[Tuple[str, float]] = (
+            [(barcode, float(medians[barcode])) for barcode in self.individual]
+            + [(GROUP_PREFIX + group, float(median)) for group, median in self.group_medians.items()]
+        )
+
+    def series_frame(self, df_raw: pd.DataFrame) -> pd.DataFrame:
+        """Rows for the SeriesStore: the individually fitted SKUs plus one series per group."""
+        return pd.concat([df_raw[df_raw['barcode'].isin(set(self.individual))], self.group_series],
+                         ignore_index=True)
+
+    def expand(self, result: tuple) -> List[tuple]:
+        """
+        Turns a group result into one result per member (forecast x share, with the member's
+        own median safeguards); SKU results pass through. The group's task and fit time are spread
+        over its members so that per-barcode timings still add up; RunProfile counts the group
+        as one fit through the members' 'pooled' key.
+        """
+        barcode = result[0]
+        if not str(barcode).startswith(GROUP_PREFIX):
+            return [result]
+
+        _, value, start_time, end_time, info = result
+        group = barcode[len(GROUP_PREFIX):]
+        rows = self._by_group.get(group, [])
+        step = (end_time - start_time) / max(len(rows), 1)
+        fit_share = info['fit_seconds'] / max(len(rows), 1) if info.get('fit_seconds') is not None else None
+        expanded = []
+        for i, (member, share, median_add_3m) in enumerate(rows):
+            if info.get('fallback'):
+                # ჯგუფის მოდელმა ვერ იმუშავა: წევრი საკუთარ მედიანას იღებს
+                member_value, fallback = median_add_3m, f"group_{info['fallback']}"
+            else:
+                raw = value * share
+                fallback = forecast_fallback(raw, median_add_3m)
+                member_value = round(float(median_add_3m if fallback else raw), 4)
+            member_info = {**info, 'fallback': fallback, 'pooled': group, 'share': round(float(share), 6),
+                           'fit_seconds': fit_share}
+            expanded.append((member, member_value, start_time + step * i, start_time + step * (i + 1), member_info))
+        return expanded
+
+    def report(self, df_raw: pd.DataFrame):
+        """Prints the fit count of this plan next to the per-SKU baseline (SKUs that would reach Stan)."""
+        fitted = (estimate_costs(df_raw, self.medians.index) > 0) & (self.medians > 0)
+        baseline = int(fitted.sum())
+        individual_fits = int(fitted[self.individual].sum())
+        print(f"INFO: Hierarchical mode: {len(self.group_medians)} group models for {len(self.members)} pooled SKUs "
+              f"+ {individual_fits} individual fits = {len(self.group_medians) + individual_fits} fits "
+              f"(per-SKU baseline: {baseline} fits; individual threshold median_add_3m >= {self.threshold:.4f}).")
+
+
+def compare_with_per_sku(df_raw: pd.DataFrame, additional_data: pd.DataFrame, combined_holidays: pd.DataFrame,
+                         sample_size: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Holds out the last month and forecasts it for a sample of pooled SKUs twice: with their own
+    Prophet fit and with the hierarchical plan built from the remaining history. Prints MAE/MAPE
+    of both against the actual demand.
+    """
+    last_month = df_raw['ds'].max()
+    history = df_raw[df_raw['ds'] < last_month]
+    plan = Hierarchy(history, additional_data)
+    if plan.members.empty:
+        print("INFO: No pooled SKUs to compare against per-SKU forecasts.")
+        return pd.DataFrame()
+
+    actual_months = _member_months(df_raw[df_raw['ds'] == last_month], plan.members['barcode'])
+    demand_col = next(col for col in DEMAND_COLS if col in actual_months.columns)
+    actual = actual_months.set_index('barcode')[demand_col].dropna()
+    members = plan.members[plan.members['barcode'].isin(actual.index)]
+    sample = members.sample(min(sample_size, len(members)), random_state=seed)
+
+    # საცდელი ფიტები არ უნდა მოხვდეს warm-start საცავში, შედეგების ქეშსა და მოდელების საცავში
+    saved = config.WARM_START, config.RESULT_CACHE, config.MODEL_STORE, config.PREDICT_ONLY
+    config.WARM_START = config.RESULT_CACHE = config.MODEL_STORE = config.PREDICT_ONLY = False
+    rows = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            groups = {}
+            for group in sample['group'].unique():
+                group_key = GROUP_PREFIX + group
+                series = plan.group_series[plan.group_series['barcode'] == group_key]
+                result = forecast_one((group_key, series, float(plan.group_medians[group])), combined_holidays)
+                groups.update({res[0]: res[1] for res in plan.expand(result)})
+            for barcode, median_add_3m in zip(sample['barcode'], sample['median_add_3m']):
+                own = forecast_one((barcode, history[history['barcode'] == barcode], float(median_add_3m)),
+                                   combined_holidays)[1]
+                rows.append({'barcode': barcode, 'actual': actual[barcode], 'per_sku': own,
+                             'hierarchical': groups[barcode]})
+    finally:
+        config.WARM_START, config.RESULT_CACHE, config.MODEL_STORE, config.PREDICT_ONLY = saved
+
+    comparison = pd.DataFrame(rows)
+    nonzero = comparison['actual'] != 0
+    summary = []
+    for method in ('per_sku', 'hierarchical'):
+        error = (comparison[method] - comparison['actual']).abs()
+        mape = (error[nonzero] / comparison.loc[nonzero, 'actual'].abs()).mean() * 100
+        summary.append(f"{method} MAE={error.mean():.4f} MAPE={mape:.2f}%")
+    print(f"INFO: Hold-out {last_month:%Y-%m} on {len(comparison)} pooled SKUs "
+          f"({sample['group'].nunique()} group fits vs {len(comparison)} SKU fits): {', '.join(summary)}.")
+    return comparison
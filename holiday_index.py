@@ -0,0 +1,69 @@
+# holiday_index.py
+
+from typing import Iterable, Union
+
+import numpy as np
+import pandas as pd
+
+HOLIDAY_COLUMNS = ['holiday', 'ds', 'lower_window', 'upper_window']
+
+
+class HolidayIndex:
+    """
+    Precomputed day-level index of a holiday table (standard holidays + promo days).
+    Prophet builds one feature column per holiday name (and window offset) and sets it only on
+    rows whose ds falls on one of its days. Our series are monthly, so most promo days never
+    coincide with a series date and only add all-zero regressors to the fit. for_dates returns
+    just the rows that can be active on the given dates, i.e. the same fit with fewer columns.
+    """
+
+    def __init__(self, combined_holidays: Union[pd.DataFrame, None]):
+        if combined_holidays is None or combined_holidays.empty:
+            self.holidays = pd.DataFrame(columns=HOLIDAY_COLUMNS)
+            self._row = np.empty(0, dtype=np.int64)
+            self._day = np.empty(0, dtype='datetime64[ns]')
+            return
+
+        hol = combined_holidays.reset_index(drop=True).copy()
+        hol['ds'] = pd.to_datetime(hol['ds'])
+        for col in ('lower_window', 'upper_window'):
+            if col not in hol.columns:
+                hol[col] = 0
+        # ერთი და იგივე (holiday, ds, window) სტრიქონები Prophet-ისთვის ერთნაირია
+        hol = hol.drop_duplicates(subset=HOLIDAY_COLUMNS).reset_index(drop=True)
+        self.holidays = hol
+
+        # ყველა (სტრიქონი, დღე) წყვილი ერთხელ, ფანჯრების ჩათვლით
+        lower = hol['lower_window'].fillna(0).astype(int).to_numpy()
+        upper = hol['upper_window'].fillna(0).astype(int).to_numpy()
+        span = np.maximum(upper - lower + 1, 1)
+        row = np.repeat(np.arange(len(hol)), span)
+        offset = np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span) + np.repeat(lower, span)
+        self._row = row
+        self._day = (hol['ds'].dt.normalize().to_numpy(dtype='datetime64[ns]')[row]
+                     + offset.astype('timedelta64[D]').astype('timedelta64[ns]'))
+
+    def for_dates(self, dates: Iterable) -> pd.DataFrame:
+        """Holiday rows active on at least one of the dates (e.g. a series' history plus its forecast month)."""
+        dates = pd.to_datetime(pd.Series(dates)).dt.normalize().to_numpy(dtype='datetime64[ns]')
+        rows = np.unique(self._row[np.isin(self._day, dates)])
+        return self.holidays.iloc[rows].reset_index(drop=True)
+
+    def __len__(self) -> int:
+        return len(self.holidays)
+
+    @property
+    def n_names(self) -> int:
+        return self.holidays['holiday'].nunique()
+
+
+# ბოლოს აგებული ინდექსი (worker-ში ერთი ცხრილი ყველა ამოცანისთვის)
+_last_index = {'source': None, 'index': None}
+
+
+def holiday_index_for(combined_holidays: Union[pd.DataFrame, None]) -> HolidayIndex:
+    """Index of a holiday table, rebuilt only when a different table object is passed."""
+    if _last_index['index'] is None or _last_index['source'] is not combined_holidays:
+        _last_index['source'] = combined_holidays
+        _last_index['index'] = HolidayIndex(combined_holidays)
+    return _last_index['index']
@@ -0,0 +1,138 @@
+# journal.py
+
+import glob
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Iterator, Set, Union
+
+import pandas as pd
+
+import config
+
+JOURNAL_PREFIX = "journal_"
+
+
+def data_fingerprint(series_frame: pd.DataFrame, medians: pd.Series, combined_holidays: pd.DataFrame) -> str:
+    """Hash of everything the forecasts of a run depend on: the series, medians, holidays, forecast config and tuned params."""
+    from prophecy import DEMAND_COLS
+    from tuning import lookup_fingerprint
+
+    columns = ['barcode', 'ds'] + [col for col in DEMAND_COLS + ['in_stock_days'] if col in series_frame.columns]
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(series_frame[columns], index=False).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(medians.sort_index(), index=True).values.tobytes())
+    if combined_holidays is not None and not combined_holidays.empty:
+        digest.update(pd.util.hash_pandas_object(combined_holidays.reset_index(drop=True), index=False).values.tobytes())
+    settings = {name: getattr(config, name) for name in dir(config)
+                if (name.startswith(('PROPHET_', 'MONTHLY_', 'HIERARCHY_', 'BATCHED_', 'LOGISTIC_'))
+                    and not name.endswith('_COMPARE_SAMPLE'))
+                or name in ('FORECAST_ENGINE', 'MIN_DATA_POINTS_FOR_FORECAST', 'STD_DEV_THRESHOLD')}
+    settings['tuned_params'] = lookup_fingerprint()
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def latest_run_id(suffix: str = "", folder: str = None) -> Union[str, None]:
+    """
+    Run ID of the most recently written journal, or None if there is none. suffix selects
+    the journals of one shard (e.g. '_shard2of4', stripped from the result); without it,
+    shard journals are ignored.
+    """
+    paths = glob.glob(os.path.join(folder or config.JOURNAL_FOLDER, f"{JOURNAL_PREFIX}*{suffix}.jsonl"))
+    if not suffix:
+        paths = [path for path in paths if '_shard' not in os.path.basename(path)]
+    if not paths:
+        return None
+    name = os.path.basename(max(paths, key=os.path.getmtime))
+    return name[len(JOURNAL_PREFIX):-len(suffix + ".jsonl")]
+
+
+def _json_default(value):
+    # numpy სკალარები (np.int64 და ა.შ.) და სხვა ტიპები
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class ForecastJournal:
+    """
+    Append-only JSON-lines journal of finished forecast results for one run. The first line
+    holds the run ID and data fingerprint; every following line is one result
+    (barcode, forecastedADD, start/end time, info), flushed as soon as it arrives and fsynced
+    every JOURNAL_FSYNC_EVERY lines, so a crashed run loses only the series still in flight.
+    """
+
+    def __init__(self, run_id: str, fingerprint: str, resume: bool = False, folder: str = None):
+        folder = folder or config.JOURNAL_FOLDER
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f"{JOURNAL_PREFIX}{run_id}.jsonl")
+        self.run_id = run_id
+        self.fingerprint = fingerprint
+        self._done: Set[str] = set()
+        self._unsynced = 0
+
+        if resume and os.path.exists(self.path):
+            header = self._read()
+            if header is None or header.get('fingerprint') != fingerprint:
+                print(f"WARNING: Journal {self.path} was written for different input data or settings; "
+                      f"starting the run from scratch.")
+                self._done = set()
+            else:
+                self._file = open(self.path, 'a', encoding='utf-8')
+                return
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._write_line({'run_id': run_id, 'fingerprint': fingerprint, 'created_at': datetime.now().isoformat()})
+        self._sync()
+
+    def _read(self) -> Union[dict, None]:
+        """Loads the header and finished barcodes of an existing journal; drops a torn last line left by a crash."""
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        complete = data[:data.rfind(b'\n') + 1]
+        if len(complete) < len(data):
+            with open(self.path, 'r+b') as f:
+                f.truncate(len(complete))
+        lines = complete.decode('utf-8').splitlines()
+        if not lines:
+            return None
+        self._done = {json.loads(line)['barcode'] for line in lines[1:]}
+        return json.loads(lines[0])
+
+    def _write_line(self, row: dict):
+        self._file.write(json.dumps(row, default=_json_default) + "\n")
+        self._file.flush()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def append(self, result: tuple):
+        """Records one finished result (barcode, value, start_time, end_time, info)."""
+        barcode, value, start_time, end_time = result[:4]
+        info = result[4] if len(result) > 4 else {}
+        self._write_line({'barcode': barcode, 'forecastedADD': value, 'start_time': start_time.isoformat(),
+                          'end_time': end_time.isoformat(), 'info': info})
+        self._done.add(barcode)
+        self._unsynced += 1
+        if self._unsynced >= config.JOURNAL_FSYNC_EVERY:
+            self._sync()
+
+    def completed(self) -> Set[str]:
+        """Barcodes (series keys) with a journaled result."""
+        return set(self._done)
+
+    def results(self) -> Iterator[tuple]:
+        """Reads the journaled results back from disk, in the order they finished."""
+        if not self._file.closed:
+            self._file.flush()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            next(f)  # header
+            for line in f:
+                row = json.loads(line)
+                yield (row['barcode'], row['forecastedADD'], datetime.fromisoformat(row['start_time']),
+                       datetime.fromisoformat(row['end_time']), row['info'])
+
+    def close(self):
+        if not self._file.closed:
+            self._sync()
+            self._file.close()
@@ -0,0 +1,187 @@
+# ledger.py
+
+import os
+import argparse
+import time
+from datetime import datetime
+from typing import Iterable, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import config
+
+PARTITION_COL = 'run_month'
+LEDGER_SCHEMA = pa.schema([
+    ('run_id', pa.large_string()),
+    ('created_at', pa.timestamp('us')),
+    ('target_month', pa.timestamp('us')),
+    ('barcode', pa.large_string()),
+    ('forecastedADD', pa.float64()),
+    ('median_add_3m', pa.float64()),
+    ('category', pa.large_string()),
+    ('fallback', pa.large_string()),
+])
+
+
+def _target_months(df_raw: pd.DataFrame) -> pd.Series:
+    """Month each barcode's forecast is for: the month after its last month of history."""
+    return df_raw.groupby('barcode')['ds'].max() + pd.offsets.MonthBegin(1)
+
+
+def record_forecasts(forecasts: Union[pd.DataFrame, Iterable[pd.DataFrame]], df_raw: pd.DataFrame,
+                     additional_data: pd.DataFrame, run_id: str = None) -> str:
+    """
+    Appends one run's forecasts (barcode, forecastedADD[, fallback]) to the ledger: one Parquet
+    file per run under run_month=YYYY-MM/, with the target month, median_add_3m and category.
+    forecasts may also be an iterable of such DataFrames; each becomes a row group, so the run's
+    entries never have to be in memory at once.
+    """
+    run_id = run_id or config.RUN_ID
+    now = datetime.now()
+    attrs = additional_data.drop_duplicates(subset=['barcode']).set_index('barcode')
+    target_months = _target_months(df_raw)
+
+    folder = os.path.join(config.LEDGER_FOLDER, f"{PARTITION_COL}={now:%Y-%m}")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{run_id}.parquet")
+    rows = 0
+    # Parquet-ის dictionary encoding + zstd: განმეორებადი run_id/category/fallback თითქმის არაფერს იკავებს
+    with pq.ParquetWriter(path + ".tmp", LEDGER_SCHEMA, compression='zstd') as writer:
+        for forecast_df in ([forecasts] if isinstance(forecasts, pd.DataFrame) else forecasts):
+            barcodes = forecast_df['barcode'].astype(str)
+            entries = pd.DataFrame({
+                'run_id': run_id,
+                'created_at': pd.Timestamp(now),
+                'target_month': barcodes.map(target_months).to_numpy(),
+                'barcode': barcodes.to_numpy(),
+                'forecastedADD': pd.to_numeric(forecast_df['forecastedADD'], errors='coerce').to_numpy(),
+                'median_add_3m': barcodes.map(attrs['median_add_3m']).to_numpy() if 'median_add_3m' in attrs else np.nan,
+                'category': barcodes.map(attrs['mother_cat_name']).to_numpy() if 'mother_cat_name' in attrs else None,
+                'fallback': forecast_df['fallback'].fillna('model').to_numpy() if 'fallback' in forecast_df else 'model',
+            })
+            writer.write_table(pa.Table.from_pandas(entries, schema=LEDGER_SCHEMA, preserve_index=False))
+            rows += len(entries)
+    os.replace(path + ".tmp", path)
+    print(f"INFO: {rows} forecasts recorded in the ledger ({path}).")
+    return path
+
+
+def read_ledger(since_month: str = None) -> pd.DataFrame:
+    """Ledger entries, optionally only from runs in since_month (YYYY-MM) or later (partition pruning)."""
+    if not os.path.isdir(config.LEDGER_FOLDER):
+        return pd.DataFrame()
+    dataset = ds.dataset(config.LEDGER_FOLDER, format='parquet', partitioning='hive',
+                         exclude_invalid_files=True)
+    if not dataset.files:
+        return pd.DataFrame()
+    expression = ds.field(PARTITION_COL) >= since_month if since_month else None
+    ledger = dataset.to_table(filter=expression).to_pandas()
+    for name in ('run_id', 'category', 'fallback', PARTITION_COL):
+        if name in ledger:
+            ledger[name] = ledger[name].astype(str)
+    return ledger
+
+
+def realized_demand(df_raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Actual demand per (barcode, month) in the units the forecast was fitted on: the first
+    DEMAND_COLS column the barcode has values in, averaged per month as in prepare_series.
+    """
+    from prophecy import DEMAND_COLS
+
+    cols = [col for col in DEMAND_COLS if col in df_raw.columns]
+    monthly = df_raw.groupby(['barcode', 'ds'])[cols].mean()
+    has_values = df_raw[cols].notna().groupby(df_raw['barcode']).any()
+    # პირველი სვეტი, რომელშიც ბარკოდს მნიშვნელობები აქვს (იგივე წესი, რაც ფიტისას)
+    chosen = has_values.to_numpy().argmax(axis=1)
+    chosen = pd.Series(chosen, index=has_values.index).where(has_values.any(axis=1))
+    column_of_row = chosen.reindex(monthly.index.get_level_values('barcode')).to_numpy()
+
+    values = monthly.to_numpy()
+    valid = ~np.isnan(column_of_row)
+    actual = np.full(len(monthly), np.nan)
+    actual[valid] = values[np.flatnonzero(valid), column_of_row[valid].astype(int)]
+    return pd.DataFrame({'barcode': monthly.index.get_level_values('barcode'),
+                         'target_month': monthly.index.get_level_values('ds'),
+                         'actual': actual}).dropna()
+
+
+def _metrics(frame: pd.DataFrame, keys) -> pd.DataFrame:
+    error = frame['forecastedADD'] - frame['actual']
+    nonzero = frame['actual'] != 0
+    parts = pd.DataFrame({
+        'abs_error': error.abs(),
+        'error': error,
+        'ape': (error.abs() / frame['actual'].abs()).where(nonzero),
+    })
+    grouped = parts.groupby([frame[key] for key in keys] if keys else np.zeros(len(frame)), observed=True)
+    result = grouped.agg(n=('error', 'size'), mae=('abs_error', 'mean'), mape=('ape', 'mean'), bias=('error', 'mean'))
+    result['mape'] *= 100
+    return result.reset_index(drop=not keys)
+
+
+def accuracy_report(ledger: pd.DataFrame, actuals: pd.DataFrame) -> pd.DataFrame:
+    """
+    Joins the latest forecast per (barcode, target month) with realized demand and returns
+    n, MAE, MAPE (%, nonzero actuals) and bias (forecast - actual) per SKU, category,
+    fallback path and overall, in one long table (level, key, ...).
+    """
+    latest = ledger.sort_values('created_at').drop_duplicates(subset=['barcode', 'target_month'], keep='last')
+    joined = latest.merge(actuals, on=['barcode', 'target_month'], how='inner')
+    joined['category'] = joined['category'].fillna('unknown')
+
+    levels = [('sku', ['barcode']), ('category', ['category']), ('fallback', ['fallback']), ('overall', [])]
+    reports = []
+    for level, keys in levels:
+        report = _metrics(joined, keys)
+        report.insert(0, 'key', report.pop(keys[0]) if keys else 'all')
+        report.insert(0, 'level', level)
+        reports.append(report)
+    return pd.concat(reports, ignore_index=True).round(4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast accuracy from the ledger against realized demand")
+    parser.add_argument('--months', type=int, default=config.ACCURACY_LOOKBACK_MONTHS,
+                        help="target months to evaluate, counting back from the last complete month")
+    args = parser.parse_args()
+
+    import snapshot
+
+    start = time.perf_counter()
+    current_month = pd.Timestamp.now().to_period('M').start_time
+    first_month = current_month - pd.DateOffset(months=args.months)
+    # ვადები, რომლებშიც პროგნოზი შეიძლებოდა გაკეთებულიყო: სამიზნე თვემდე ერთი თვით ადრე
+    ledger = read_ledger(since_month=(first_month - pd.DateOffset(months=1)).strftime('%Y-%m'))
+    if ledger.empty:
+        print("INFO: The forecast ledger is empty; nothing to evaluate.")
+        return
+    # მიმდინარე (დაუსრულებელი) თვე არ ფასდება
+    ledger = ledger[(ledger['target_month'] >= first_month) & (ledger['target_month'] < current_month)]
+
+    # the main run's snapshot is only read here; load_sales_data with another start date would rebuild it
+    last_day = current_month - pd.Timedelta(days=1)
+    sales = snapshot.read_sales_data(first_month.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d'))
+    sales['ds'] = sales['transaction_month']
+    report = accuracy_report(ledger, realized_demand(sales))
+
+    os.makedirs(config.OUTPUT_FOLDER, exist_ok=True)
+    path = os.path.join(config.OUTPUT_FOLDER, config.ACCURACY_FILENAME)
+    report.to_csv(path, index=False, encoding='utf-8-sig')
+    overall = report[report['level'] == 'overall']
+    if overall.empty or overall['n'].iloc[0] == 0:
+        print("WARNING: No ledger forecasts have realized demand yet.")
+    else:
+        row = overall.iloc[0]
+        print(f"INFO: {int(row['n'])} forecasts evaluated: MAE={row['mae']:.4f}, MAPE={row['mape']:.2f}%, "
+              f"bias={row['bias']:+.4f}.")
+    print(f"SUCCESS: Accuracy by SKU, category and fallback path saved to {path} "
+          f"in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 # main.py
 
 import os
+import argparse
 import logging
 import warnings
-from multiprocessing import get_context, cpu_count
+from typing import Iterable, Union
+from multiprocessing import get_context
+from collections import Counter
 from tqdm import tqdm
 import pandas as pd
-from database_writer import save_results_to_db
+from database_writer import save_results_to_db, COPY_CHUNK_ROWS
 
 # --- Global Settings for Silence ---
 # Disable warnings
@@ -21,67 +24,292 @@ os.environ['CMDSTAN_NO_STDOUT'] = '1'
 os.environ['CMDSTAN_NO_STDERR'] = '1'
 
 import config
-from query.LoadData import LoadData
+import snapshot
 from holidays import holidays as standard_holidays
-from prophecy import forecast_one, calculate_kpis
-from evaluate import evaluate_model_accuracy
+from prophecy import forecast_stored, calculate_kpis, init_worker, publish_worker_inputs
+from series_store import SeriesStore
+from param_store import report_warm_start_stats, last_fit_seconds
+from result_cache import report_cache_stats, prune_cache
+from utils import config_snapshot
+from evaluate import run_evaluation
+from tuning import run_tuning
 from optimize import run_optimal_allocation
+from batched import forecast_batched, compare_with_prophet
+from hierarchical import Hierarchy, compare_with_per_sku
+from pipeline import iter_forecast_tasks, median_lookup, tuned_chunksize, forecast_frames, KpiStreamWriter
+from run_profile import RunProfile
+from ledger import record_forecasts
+from journal import ForecastJournal, data_fingerprint, latest_run_id
+from sharding import parse_shard, shard_suffix, assign_shards, write_shard, read_shards, latest_shard_run
+from scheduler import plan_workers, limit_worker_threads, estimate_costs, order_longest_first
+from watchdog import imap_with_deadline
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sales forecasting pipeline")
+    parser.add_argument('--refit', action='store_true',
+                        help="ignore the forecast result cache and refit every barcode")
+    parser.add_argument('--predict-only', action='store_true',
+                        help="predict with the stored fitted models; only barcodes whose data changed are refitted")
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='RUN_ID',
+                        help="continue an interrupted run (default: the latest journal), skipping journaled series")
+    parser.add_argument('--shard', metavar='i/N',
+                        help="forecast only shard i of N (stable barcode hash, see SHARD_BALANCE) and write a shard file")
+    parser.add_argument('--merge-shards', nargs='?', const='latest', metavar='RUN_ID',
+                        help="combine the shard files of a run (default: the latest), compute KPIs and save once")
+    parser.add_argument('--evaluate', action='store_true',
+                        help="cross-validate all eligible barcodes instead of forecasting")
+    parser.add_argument('--tune', action='store_true',
+                        help="search Prophet hyperparameters per segment (successive halving) and save them for forecasting")
+    parser.add_argument('--validate-snapshot', action='store_true',
+                        help="compare the local sales snapshot with a full database query before running")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    if args.refit:
+        config.FORCE_REFIT = True
+    if args.predict_only:
+        config.PREDICT_ONLY = True
+    shard = parse_shard(args.shard) if args.shard else None
+    if shard is not None and not args.resume and 'RUN_ID' not in os.environ:
+        # a timestamp RUN_ID differs per process, and each shard would land in its own run folder
+        raise ValueError(f"--shard needs the same RUN_ID on every shard, e.g. "
+                         f"RUN_ID=<id> python main.py --shard {args.shard}; merge with --merge-shards <id>.")
+    if args.resume:
+        run_id = latest_run_id(shard_suffix(shard)) if args.resume == 'latest' else args.resume
+        if run_id is None:
+            print("WARNING: No run journal found to resume; starting a new run.")
+        else:
+            config.RUN_ID = run_id
+    # shards of one run share its RUN_ID (set it on every node); journals and profiles are kept per shard
+    shard_run_id = config.RUN_ID
+    config.RUN_ID += shard_suffix(shard)
+
     print("🔮 Starting forecast process...")
-    
-    # --- 1. Load Data ---
-    print("Step 1/5: Loading data...")
-    df_raw = LoadData.get_sales_data(config.START_DATE, config.END_DATE)
-    df_raw['ds'] = pd.to_datetime(df_raw['transaction_month'])
-    df_raw['barcode'] = df_raw['barcode'].astype(str)
+    profile = RunProfile(config.RUN_ID)
+    if not os.path.exists(config.OUTPUT_FOLDER):
+        os.makedirs(config.OUTPUT_FOLDER)
 
-    additional_data = LoadData.get_additional_metrics()
-    additional_data['barcode'] = additional_data['barcode'].astype(str)
+    # The forecast pool is spawned first, so worker imports and warm-up fits overlap with the
+    # data queries; the workers receive the holidays and series store on their first task.
+    pool = None
+    if not (args.evaluate or args.tune or args.merge_shards) and config.FORECAST_ENGINE in ('prophet', 'hierarchical'):
+        processes, threads = plan_workers()
+        limit_worker_threads(threads)
+        profile.workers = processes
+        context_path = os.path.join(config.OUTPUT_FOLDER, f"worker_inputs_{config.RUN_ID}.pkl")
+        context = get_context("spawn")
+        # workers report the tasks they start, so a stuck one can be killed at TASK_HARD_TIMEOUT_SECONDS
+        task_starts = context.Queue() if config.TASK_HARD_TIMEOUT_SECONDS > 0 else None
+        init_args = (None, config_snapshot(), None, context_path, task_starts)
+        pool = context.Pool(processes=processes, initializer=init_worker, initargs=init_args)
 
-    promo_holidays = LoadData.get_promo_campaigns(config.PROMO_MIN_CASHBACK)
+    # --- 1. Load Data ---
+    print("Step 1/5: Loading data...")
+    profile.begin('load')
+    if args.validate_snapshot:
+        snapshot.validate_sales_snapshot(config.START_DATE, config.END_DATE)
+    # the three queries run concurrently; barcode and month dtypes are converted once while loading
+    df_raw, additional_data, promo_holidays = snapshot.load_inputs(config.START_DATE, config.END_DATE,
+                                                                   config.PROMO_MIN_CASHBACK)
     combined_holidays = pd.concat([standard_holidays, promo_holidays], ignore_index=True)
 
+    if args.merge_shards:
+        run_id = latest_shard_run() if args.merge_shards == 'latest' else args.merge_shards
+        if run_id is None:
+            raise RuntimeError(f"No shard results found in {config.SHARD_FOLDER}.")
+        forecast_df = read_shards(run_id)
+        print("Step 2-3/5: Forecasts merged from shards.")
+        save_final_kpis(df_raw, forecast_df, additional_data, profile)
+        return
+
     # --- 2. Prepare Arguments for Parallel Processing ---
     print("Step 2/5: Preparing arguments for forecasting...")
-    barcode_groups = list(df_raw.groupby('barcode'))
-    
-    forecast_args = []
-    for barcode, group_df in barcode_groups:
-        median_add_3m = 0.0
-        if not additional_data.empty:
-            match = additional_data[additional_data['barcode'] == barcode]
-            if not match.empty:
-                val = match['median_add_3m'].iloc[0]
-                median_add_3m = 0.0 if pd.isna(val) else float(val)
-        
-        forecast_args.append((barcode, group_df, combined_holidays, median_add_3m))
-
-    # --- 3. Run Forecasting in Parallel ---
-    print(f"Step 3/5: Running forecast for {len(forecast_args)} products...")
-    with get_context("spawn").Pool(processes=max(1, cpu_count() - 1)) as pool:
-        forecast_results = list(tqdm(pool.imap(forecast_one, forecast_args), total=len(forecast_args), desc="Forecasting"))
-
-    forecast_df = pd.DataFrame([res[:2] for res in forecast_results], columns=['barcode', 'forecastedADD'])
+    profile.begin('prepare')
+    # Workers read their series from one shared-memory copy instead of pickled DataFrames
+    hierarchy = None
+    series_frame = df_raw
+    if config.FORECAST_ENGINE == 'hierarchical' and not (args.evaluate or args.tune):
+        # pooled SKUs are replaced by one aggregated series per group
+        hierarchy = Hierarchy(df_raw, additional_data)
+        hierarchy.report(df_raw)
+        series_frame = hierarchy.series_frame(df_raw)
+    # fingerprint of the whole input, so all shards and resumes of a run can be checked against each other
+    fingerprint = data_fingerprint(series_frame, median_lookup(additional_data), combined_holidays)
+    if shard is not None:
+        shards = assign_shards(series_frame, series_frame['barcode'].unique(), shard[1])
+        series_frame = series_frame[series_frame['barcode'].map(shards) == shard[0]]
+        print(f"INFO: Shard {shard[0]}/{shard[1]} ({config.SHARD_BALANCE} split): "
+              f"{series_frame['barcode'].nunique()} of {len(shards)} series.")
+    store = SeriesStore.from_frame(series_frame)
+    print(f"INFO: Series store holds {len(store.barcodes)} barcodes in {store.nbytes / 1e6:.1f} MB of shared memory.")
+
+    if args.evaluate:
+        print("Step 3/5: Cross-validating products (--evaluate)...")
+        try:
+            output_path = run_evaluation(store, combined_holidays)
+        finally:
+            store.close()
+        if config.RESULT_CACHE:
+            prune_cache(config.RESULT_CACHE_MAX_BYTES, config.CV_FOLD_CACHE_MAX_BYTES)
+        print(f"✅ Evaluation finished! Metrics saved to {output_path}")
+        return
+
+    if args.tune:
+        print("Step 3/5: Tuning Prophet hyperparameters per segment (--tune)...")
+        try:
+            output_path = run_tuning(store, series_frame, additional_data, combined_holidays)
+        finally:
+            store.close()
+        if config.RESULT_CACHE:
+            prune_cache(config.RESULT_CACHE_MAX_BYTES, config.CV_FOLD_CACHE_MAX_BYTES)
+        print(f"✅ Tuning finished! Segment parameters saved to {output_path}")
+        return
+
+    # holidays are shipped once per worker by init_worker; tasks are only (barcode, median_add_3m)
+    if hierarchy is None:
+        forecast_tasks = iter_forecast_tasks(store.barcodes, additional_data)
+    else:
+        in_store = set(store.barcodes)
+        forecast_tasks = [task for task in hierarchy.tasks if task[0] in in_store]
+    expand = hierarchy.expand if hierarchy is not None else lambda res: [res]
+
+    # finished results are journaled as they arrive; --resume skips the series already in the journal
+    journal = ForecastJournal(config.RUN_ID, fingerprint, resume=bool(args.resume))
+    journaled = journal.completed() & set(store.barcodes)
+    if journaled:
+        print(f"INFO: Resuming run {config.RUN_ID}: {len(journaled)} of {len(store.barcodes)} series already journaled.")
+        forecast_tasks = (task for task in forecast_tasks if task[0] not in journaled)
+    n_tasks = len(store.barcodes) - len(journaled)
+
+    output_path = os.path.join(config.OUTPUT_FOLDER, config.FINAL_KPI_FILENAME)
+    streaming = config.STREAMING and config.FORECAST_ENGINE in ('prophet', 'hierarchical') and shard is None
+
+    # --- 3. Run Forecasting ---
+    print(f"Step 3/5: Running forecast for {n_tasks} series ({config.FORECAST_ENGINE} engine)...")
+    profile.begin('forecast')
+    if streaming:
+        # KPI rows are appended to the output file as forecasts arrive (journaled ones first)
+        writer = KpiStreamWriter(df_raw, additional_data, output_path)
+        if journaled:
+            for res in journal.results():
+                for sku_res in expand(res):
+                    writer.add(sku_res)
+    try:
+        if config.FORECAST_ENGINE == 'batched':
+            profile.workers = 1  # one process; every barcode is timed with its share of the batch
+            series = [(barcode, store.frame(barcode), median_add_3m) for barcode, median_add_3m in forecast_tasks]
+            batch_results = forecast_batched(series, combined_holidays) if series else []
+            for res in batch_results:
+                journal.append(res)
+                profile.add_task(res)
+            if config.BATCHED_COMPARE_SAMPLE > 0 and series:
+                compare_with_prophet(series, combined_holidays, batch_results, config.BATCHED_COMPARE_SAMPLE)
+            del series, batch_results
+        elif config.FORECAST_ENGINE in ('prophet', 'hierarchical'):
+            # longest expected fits first, so the run does not end on a few slow stragglers
+            observed = last_fit_seconds() if config.WARM_START else None
+            forecast_tasks = order_longest_first(forecast_tasks, estimate_costs(series_frame, store.barcodes, observed))
+            print(f"INFO: {processes} worker processes x {threads} thread(s) per fit, tasks ordered longest-first.")
+            publish_worker_inputs(context_path, combined_holidays, store.handle())
+            with pool:
+                if task_starts is not None:
+                    # one task per round trip, so a series past its deadline only holds back itself
+                    results = imap_with_deadline(pool, forecast_stored, forecast_tasks, task_starts,
+                                                 config.TASK_HARD_TIMEOUT_SECONDS,
+                                                 window=processes * config.TASK_WINDOW_PER_WORKER)
+                else:
+                    results = pool.imap_unordered(forecast_stored, forecast_tasks,
+                                                  chunksize=tuned_chunksize(n_tasks, processes))
+                cache_lookups = Counter()
+                for res in tqdm(results, total=n_tasks, desc="Forecasting"):
+                    journal.append(res)
+                    cache_lookups[res[4].get('cache_lookup')] += 1
+                    # group forecasts (hierarchical engine) are split into one result per member SKU
+                    for sku_res in expand(res):
+                        profile.add_task(sku_res)
+                        if streaming:
+                            writer.add(sku_res)
+            if config.WARM_START:
+                report_warm_start_stats(config.RUN_ID)
+            if config.RESULT_CACHE:
+                report_cache_stats(cache_lookups['hit'], cache_lookups['miss'])
+                prune_cache(config.RESULT_CACHE_MAX_BYTES, config.CV_FOLD_CACHE_MAX_BYTES)
+            if hierarchy is not None and config.HIERARCHY_COMPARE_SAMPLE > 0:
+                compare_with_per_sku(df_raw, additional_data, combined_holidays, config.HIERARCHY_COMPARE_SAMPLE)
+        else:
+            raise ValueError(f"Unknown FORECAST_ENGINE '{config.FORECAST_ENGINE}'. Use 'prophet', 'batched' or 'hierarchical'.")
+    except BaseException:
+        print(f"ERROR: Forecasting was interrupted; {len(journal.completed())} finished series are kept in {journal.path}. "
+              f"Continue with: python main.py --resume {config.RUN_ID}")
+        raise
+    finally:
+        store.close()
+        journal.close()
+        if pool is not None:
+            pool.terminate()
+            if os.path.exists(context_path):
+                os.remove(context_path)
+
+    if shard is not None:
+        # KPIs and the database write happen once, in the merge step
+        path = write_shard(shard_run_id, shard, (sku_res for res in journal.results() for sku_res in expand(res)),
+                           fingerprint)
+        profile.write()
+        print(f"✅ Shard {shard[0]}/{shard[1]} finished! Forecasts saved to {path}. "
+              f"Merge with: python main.py --merge-shards {shard_run_id}")
+        return
+
+    # Steps 4-5 are built from the journal, so resumed and newly forecast series are treated alike
+    forecast_results = (sku_res for res in journal.results() for sku_res in expand(res))
+    if streaming:
+        writer.close()
+        print(f"Step 4/5: KPIs for {writer.rows_written} products were written while forecasting.")
+        print("Step 5/5: Saving results...")
+        profile.begin('save')
+        print(f"✅ Process finished successfully! Results saved to {output_path}")
+        # the ledger and the database read the journal and the streamed file chunk by chunk, never as one frame
+        record_in_ledger(forecast_frames(forecast_results, COPY_CHUNK_ROWS), df_raw, additional_data)
+        with pd.read_csv(output_path, dtype=writer.column_dtypes(), encoding='utf-8-sig',
+                         chunksize=COPY_CHUNK_ROWS) as final_chunks:
+            save_results_to_db(final_chunks, 'veli_prophet_results')
+        profile.write()
+        print(f"✅ Process finished successfully!")
+    else:
+        forecast_df = pd.concat(forecast_frames(forecast_results, COPY_CHUNK_ROWS), ignore_index=True)
+        save_final_kpis(df_raw, forecast_df, additional_data, profile)
+
+
+def record_in_ledger(forecast_df: Union[pd.DataFrame, Iterable[pd.DataFrame]], df_raw: pd.DataFrame, additional_data: pd.DataFrame):
+    """Appends the run's forecasts to the accuracy ledger; a failure here must not fail the run."""
+    try:
+        record_forecasts(forecast_df, df_raw, additional_data)
+    except Exception as e:
+        print(f"WARNING: Could not record forecasts in the ledger: {e}")
+
+
+def save_final_kpis(df_raw: pd.DataFrame, forecast_df: pd.DataFrame, additional_data: pd.DataFrame,
+                    profile: RunProfile):
+    """Steps 4-5: KPIs from (barcode, forecastedADD[, fallback]), the output CSV, the ledger and the single database write."""
     forecast_df['barcode'] = forecast_df['barcode'].astype(str)
+    output_path = os.path.join(config.OUTPUT_FOLDER, config.FINAL_KPI_FILENAME)
 
     # --- 4. Calculate KPIs and Finalize ---
     print("Step 4/5: Calculating final KPIs...")
-    final_df = calculate_kpis(df_raw, forecast_df, additional_data)
+    profile.begin('kpi')
+    final_df = calculate_kpis(df_raw, forecast_df[['barcode', 'forecastedADD']], additional_data)
 
     # --- 5. Save Results ---
     print("Step 5/5: Saving results...")
-    if not os.path.exists(config.OUTPUT_FOLDER):
-        os.makedirs(config.OUTPUT_FOLDER)
-    
-    output_path = os.path.join(config.OUTPUT_FOLDER, config.FINAL_KPI_FILENAME)
-    
+    profile.begin('save')
     final_df['barcode'] = "'" + final_df['barcode'].astype(str)
     final_df.to_csv(output_path, index=False, encoding='utf-8-sig')
 
     print(f"✅ Process finished successfully! Results saved to {output_path}")
 
+    record_in_ledger(forecast_df, df_raw, additional_data)
     save_results_to_db(final_df, 'veli_prophet_results')
+    profile.write()
     print(f"✅ Process finished successfully!")
 
 
@@ -0,0 +1,53 @@
+# model_store.py
+
+import os
+import sqlite3
+import time
+
+import config
+
+# ერთი კავშირი თითო პროცესზე (worker-ები ერთ SQLite ფაილს იზიარებენ)
+_connection = None
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(config.MODEL_STORE_PATH) or '.', exist_ok=True)
+        _connection = sqlite3.connect(config.MODEL_STORE_PATH, timeout=30)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS models (
+                barcode TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                model TEXT NOT NULL,
+                saved_at REAL NOT NULL
+            )""")
+        _connection.commit()
+    return _connection
+
+
+def save_model(barcode: str, fingerprint: str, model):
+    """Serializes a fitted Prophet model (prophet.serialize JSON) together with the fingerprint of its training data."""
+    from prophet.serialize import model_to_json
+
+    conn = _get_connection()
+    conn.execute("INSERT OR REPLACE INTO models (barcode, fingerprint, model, saved_at) VALUES (?, ?, ?, ?)",
+                 (barcode, fingerprint, model_to_json(model), time.time()))
+    conn.commit()
+
+
+def load_model(barcode: str, fingerprint: str):
+    """
+    Returns the stored fitted model of a barcode, or None if there is none or it was
+    trained on different data, holidays or config (stale fingerprint).
+    """
+    from prophet.serialize import model_from_json
+
+    row = _get_connection().execute(
+        "SELECT fingerprint, model FROM models WHERE barcode = ?", (barcode,)
+    ).fetchone()
+    if row is None or row[0] != fingerprint:
+        return None
+    return model_from_json(row[1])
+
@@ -1,14 +1,16 @@
 # optimize.py
 
+import numpy as np
 import pandas as pd
 from pulp import LpMaximize, LpProblem, LpVariable, lpSum, PULP_CBC_CMD
+from typing import Dict, Iterable, Union
 import config
 
-def run_optimal_allocation(kpi_df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Runs budget optimization. This is a placeholder and requires
-    'Bmax' and 'R_index' columns to be defined in the input DataFrame.
-    """
+# ლიმიტები ჯგუფებზე: {სვეტი: {მნიშვნელობა: ლიმიტი}} ან {სვეტი: ერთი ლიმიტი ყველა მნიშვნელობისთვის}
+GroupCaps = Dict[str, Union[float, Dict[str, float]]]
+
+def _prepare(kpi_df: pd.DataFrame) -> Union[pd.DataFrame, None]:
+    """Adds Bmax/R_index and keeps the products that can receive budget. Returns None if the inputs are missing."""
     df = kpi_df.copy()
 
     # --- This logic is illustrative. Bmax and R_index must be calculated first ---
@@ -17,40 +19,157 @@ def run_optimal_allocation(kpi_df: pd.DataFrame) -> pd.DataFrame:
         df['Bmax'] = df['cost'] * df['forecastedADD'] * 30 * 2  # Example: 2 months of stock
         df['R_index'] = (df['price'] - df['cost']) / df['cost'] # Example: simple margin
     else:
-        print("WARNING: 'cost' or 'forecastedADD' not in DataFrame. Skipping optimization.")
-        kpi_df['Optimal_spent'] = 0.0
-        return kpi_df
+        return None
     # --- End of illustrative logic ---
 
-    df = df[(df['Bmax'] > 0) & (df['R_index'].notnull()) & (df['R_index'] > 0)].copy()
+    return df[(df['Bmax'] > 0) & (df['R_index'].notnull()) & (df['R_index'] > 0)].copy()
 
-    if df.empty:
-        print("WARNING: No products available for optimization.")
-        kpi_df['Optimal_spent'] = 0.0
-        return kpi_df
+def solve_budget_knapsack(returns: np.ndarray, upper: np.ndarray, budget: float) -> np.ndarray:
+    """
+    Exact solution of max sum(r*x) s.t. sum(x) <= budget, 0 <= x <= upper (r > 0):
+    fund products in decreasing r until the budget runs out. O(n log n).
+    """
+    order = np.argsort(-returns, kind='stable')
+    cum_upper = np.cumsum(upper[order])
+    filled = np.clip(budget - (cum_upper - upper[order]), 0, upper[order])
+    allocation = np.empty_like(filled)
+    allocation[order] = filled
+    return allocation
+
+def solve_sparse_lp(df: pd.DataFrame, budget: float, caps: GroupCaps) -> np.ndarray:
+    """
+    Solves the allocation LP with the total budget plus per-group caps (e.g. per category,
+    supplier or brand). The constraint matrix is built column-wise as one sparse matrix.
+    """
+    from scipy.optimize import linprog
+    from scipy.sparse import csr_matrix, vstack
+
+    n = len(df)
+    rows = [csr_matrix(np.ones((1, n)))]
+    limits = [float(budget)]
+    for column, column_caps in caps.items():
+        codes, groups = pd.factorize(df[column], use_na_sentinel=True)
+        if isinstance(column_caps, dict):
+            group_limits = np.array([column_caps.get(group, np.inf) for group in groups], dtype=float)
+        else:
+            group_limits = np.full(len(groups), float(column_caps))
+        capped = np.flatnonzero(np.isfinite(group_limits))
+        if capped.size == 0:
+            continue
+        row_of_group = np.full(len(groups), -1)
+        row_of_group[capped] = np.arange(capped.size)
+        member = codes >= 0
+        member[member] = row_of_group[codes[member]] >= 0
+        var_idx = np.flatnonzero(member)
+        rows.append(csr_matrix((np.ones(var_idx.size), (row_of_group[codes[var_idx]], var_idx)), shape=(capped.size, n)))
+        limits.extend(group_limits[capped])
 
+    result = linprog(
+        c=-df['R_index'].to_numpy(dtype=float),
+        A_ub=vstack(rows).tocsr(),
+        b_ub=np.array(limits),
+        bounds=np.column_stack([np.zeros(n), df['Bmax'].to_numpy(dtype=float)]),
+        method='highs',
+    )
+    if not result.success:
+        raise RuntimeError(f"Allocation LP failed: {result.message}")
+    return result.x
+
+def _solve_pulp(df: pd.DataFrame, budget: float) -> np.ndarray:
+    """Original CBC model, kept for cross-checking the fast solvers."""
     model = LpProblem(name="optimal-budget-allocation", sense=LpMaximize)
-    
+
     # Define variables
-    x = {
-        row['barcode']: LpVariable(name=f"x_{row['barcode']}", lowBound=0, upBound=row['Bmax'])
-        for _, row in df.iterrows()
-    }
+    x = [LpVariable(name=f"x_{barcode}", lowBound=0, upBound=bmax) for barcode, bmax in zip(df['barcode'], df['Bmax'])]
 
     # Set objective function
-    model += lpSum(
-        x[row['barcode']] * row['R_index'] for _, row in df.iterrows()
-    ), "Total_ROI"
+    model += lpSum(var * r for var, r in zip(x, df['R_index'])), "Total_ROI"
 
     # Set budget constraint
-    model += lpSum(x.values()) <= config.TOTAL_BUDGET, "Budget_Limit"
+    model += lpSum(x) <= budget, "Budget_Limit"
 
     # Solve the problem
     model.solve(PULP_CBC_CMD(msg=0)) # msg=0 silences the solver output
+    return np.array([var.value() or 0.0 for var in x])
+
+def run_optimal_allocation(kpi_df: pd.DataFrame, budget: float = None, caps: GroupCaps = None,
+                           solver: str = 'auto') -> pd.DataFrame:
+    """
+    Runs budget optimization. This is a placeholder and requires
+    'Bmax' and 'R_index' columns to be defined in the input DataFrame.
+
+    solver: 'auto' uses the exact sort-and-fill solver when there are no group caps and the
+    sparse LP otherwise; 'knapsack', 'lp' and 'pulp' force a specific solver.
+    """
+    budget = config.TOTAL_BUDGET if budget is None else budget
+    caps = config.OPTIMIZATION_CAPS if caps is None else caps
+
+    df = _prepare(kpi_df)
+    if df is None:
+        print("WARNING: 'cost' or 'forecastedADD' not in DataFrame. Skipping optimization.")
+        kpi_df['Optimal_spent'] = 0.0
+        return kpi_df
+
+    if df.empty:
+        print("WARNING: No products available for optimization.")
+        kpi_df['Optimal_spent'] = 0.0
+        return kpi_df
+
+    if solver == 'auto':
+        solver = 'lp' if caps else 'knapsack'
+    if solver == 'knapsack':
+        if caps:
+            raise ValueError("The knapsack solver does not support group caps; use solver='lp'.")
+        spent = solve_budget_knapsack(df['R_index'].to_numpy(dtype=float), df['Bmax'].to_numpy(dtype=float), budget)
+    elif solver == 'lp':
+        spent = solve_sparse_lp(df, budget, caps or {})
+    elif solver == 'pulp':
+        if caps:
+            raise ValueError("The PuLP solver does not support group caps; use solver='lp'.")
+        spent = _solve_pulp(df, budget)
+    else:
+        raise ValueError(f"Unknown solver '{solver}'. Use 'auto', 'knapsack', 'lp' or 'pulp'.")
 
     # Map results back
-    allocation = {barcode: var.value() for barcode, var in x.items()}
+    allocation = pd.Series(spent, index=df['barcode'].to_numpy())
+    allocation = allocation[~allocation.index.duplicated()]
     kpi_df['Optimal_spent'] = kpi_df['barcode'].map(allocation).fillna(0.0)
-    
+
     print("SUCCESS: Optimization completed.")
-    return kpi_df
\ No newline at end of file
+    return kpi_df
+
+def allocation_curve(kpi_df: pd.DataFrame, budgets: Iterable[float]) -> pd.DataFrame:
+    """
+    Optimal total return for many TOTAL_BUDGET values in one pass (single budget constraint).
+    After one sort, each budget is a binary search over the cumulative Bmax.
+    Returns one row per budget: spent, total_return, products_funded and marginal_R_index
+    (return per extra unit of budget at that point).
+    """
+    budgets = np.asarray(list(budgets), dtype=float)
+    df = _prepare(kpi_df)
+    if df is None or df.empty:
+        return pd.DataFrame({'budget': budgets, 'spent': 0.0, 'total_return': 0.0,
+                             'products_funded': 0, 'marginal_R_index': 0.0})
+
+    returns = df['R_index'].to_numpy(dtype=float)
+    upper = df['Bmax'].to_numpy(dtype=float)
+    order = np.argsort(-returns, kind='stable')
+    returns, upper = returns[order], upper[order]
+
+    cum_upper = np.concatenate([[0.0], np.cumsum(upper)])
+    cum_return = np.concatenate([[0.0], np.cumsum(upper * returns)])
+    spent = np.clip(budgets, 0, cum_upper[-1])
+
+    # k = number of fully funded products; product k (if any) is partially funded
+    k = np.searchsorted(cum_upper, spent, side='right') - 1
+    k = np.minimum(k, len(returns))
+    partial_r = np.where(k < len(returns), returns[np.minimum(k, len(returns) - 1)], 0.0)
+    total_return = cum_return[k] + partial_r * (spent - cum_upper[k])
+
+    return pd.DataFrame({
+        'budget': budgets,
+        'spent': spent,
+        'total_return': total_return,
+        'products_funded': k + (spent > cum_upper[k]),
+        'marginal_R_index': partial_r,
+    })
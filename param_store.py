@@ -0,0 +1,120 @@
+# param_store.py
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Union
+
+import numpy as np
+
+import config
+
+# Prophet-ის MAP პარამეტრები, რომლებსაც შემდეგი გაშვებისთვის ვინახავთ
+STORED_PARAMS = ('k', 'm', 'delta', 'beta', 'sigma_obs')
+VECTOR_PARAMS = ('delta', 'beta')
+
+# ერთი კავშირი თითო პროცესზე (worker-ები ერთ SQLite ფაილს იზიარებენ)
+_connection = None
+
+
+def config_fingerprint() -> str:
+    """Hash of the hyperparameters that shape the Stan problem; stored inits are only reused when it matches."""
+    payload = json.dumps({'prophet': config.PROPHET_PARAMS, 'seasonality': config.MONTHLY_SEASONALITY},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(config.PARAM_STORE_PATH) or '.', exist_ok=True)
+        _connection = sqlite3.connect(config.PARAM_STORE_PATH, timeout=30)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS params (
+                barcode TEXT PRIMARY KEY,
+                growth TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                params TEXT NOT NULL
+            )""")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS fit_stats (
+                run_id TEXT NOT NULL,
+                barcode TEXT NOT NULL,
+                warm INTEGER NOT NULL,
+                iterations INTEGER,
+                fit_seconds REAL NOT NULL
+            )""")
+        _connection.commit()
+    return _connection
+
+
+def load_params(barcode: str, growth_type: str) -> Union[dict, None]:
+    """
+    Returns the stored fit of a barcode in the form Prophet accepts as `init`,
+    or None (cold start) if there is none or it was fitted with another growth type or config.
+    """
+    row = _get_connection().execute(
+        "SELECT growth, fingerprint, params FROM params WHERE barcode = ?", (barcode,)
+    ).fetchone()
+    if row is None or row[0] != growth_type or row[1] != config_fingerprint():
+        return None
+    stored = json.loads(row[2])
+    return {name: np.asarray(value, dtype=float) if name in VECTOR_PARAMS else float(value)
+            for name, value in stored.items()}
+
+
+def to_init(params: dict) -> dict:
+    """Converts a fitted model.params into the `init` form accepted by Prophet.fit."""
+    init = {}
+    for name in STORED_PARAMS:
+        values = np.asarray(params[name], dtype=float).reshape(-1)
+        init[name] = values if name in VECTOR_PARAMS else float(values[0])
+    return init
+
+
+def save_params(barcode: str, growth_type: str, params: dict):
+    """Saves the fitted MAP parameters (model.params) of a barcode."""
+    stored = {name: value.tolist() if name in VECTOR_PARAMS else value for name, value in to_init(params).items()}
+    conn = _get_connection()
+    conn.execute("INSERT OR REPLACE INTO params (barcode, growth, fingerprint, params) VALUES (?, ?, ?, ?)",
+                 (barcode, growth_type, config_fingerprint(), json.dumps(stored)))
+    conn.commit()
+
+
+def record_fit(barcode: str, warm: bool, iterations: Union[int, None], fit_seconds: float):
+    """Records optimizer iterations and wall time of one fit for the current run."""
+    conn = _get_connection()
+    conn.execute("INSERT INTO fit_stats (run_id, barcode, warm, iterations, fit_seconds) VALUES (?, ?, ?, ?, ?)",
+                 (config.RUN_ID, barcode, int(warm), iterations, fit_seconds))
+    conn.commit()
+
+
+def last_fit_seconds() -> dict:
+    """Most recent recorded fit wall time per barcode, across runs ({barcode: seconds})."""
+    rows = _get_connection().execute("""
+        SELECT barcode, fit_seconds FROM fit_stats
+        WHERE rowid IN (SELECT MAX(rowid) FROM fit_stats GROUP BY barcode)
+    """).fetchall()
+    return dict(rows)
+
+
+def report_warm_start_stats(run_id: str):
+    """Prints warm vs cold fit counts, mean optimizer iterations and mean wall time for a run."""
+    rows = _get_connection().execute(
+        "SELECT warm, COUNT(*), AVG(iterations), AVG(fit_seconds) FROM fit_stats WHERE run_id = ? GROUP BY warm",
+        (run_id,)
+    ).fetchall()
+    stats = {bool(warm): (count, iters, secs) for warm, count, iters, secs in rows}
+    if not stats:
+        print("INFO: No Prophet fits were recorded in this run.")
+        return
+
+    for warm, label in ((True, 'warm'), (False, 'cold')):
+        if warm in stats:
+            count, iters, secs = stats[warm]
+            print(f"INFO: {count} {label}-start fits, avg {iters or 0:.1f} iterations, avg {secs:.3f}s per fit.")
+    if True in stats and False in stats and stats[True][1] and stats[True][2]:
+        print(f"INFO: Warm-start speedup: {stats[False][1] / stats[True][1]:.2f}x fewer iterations, "
+              f"{stats[False][2] / stats[True][2]:.2f}x wall time.")
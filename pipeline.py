@@ -0,0 +1,105 @@
+# pipeline.py
+
+import math
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple
+
+import pandas as pd
+
+import config
+from prophecy import kpi_base, add_business_metrics
+
+
+def median_lookup(additional_data: pd.DataFrame) -> pd.Series:
+    """median_add_3m indexed by barcode (first row wins, NaN -> 0.0), built once instead of scanning per barcode."""
+    if additional_data is None or additional_data.empty or 'median_add_3m' not in additional_data.columns:
+        return pd.Series(dtype=float)
+    medians = additional_data.drop_duplicates(subset=['barcode']).set_index('barcode')['median_add_3m']
+    return pd.to_numeric(medians, errors='coerce').fillna(0.0)
+
+
+def iter_forecast_tasks(barcodes: Iterable[str], additional_data: pd.DataFrame) -> Iterator[Tuple[str, float]]:
+    """Lazily yields (barcode, median_add_3m) tasks from an indexed join of the sales barcodes and medians."""
+    medians = median_lookup(additional_data)
+    for barcode in barcodes:
+        yield barcode, float(medians.get(barcode, 0.0))
+
+
+def tuned_chunksize(n_tasks: int, n_workers: int) -> int:
+    """
+    Tasks per IPC round trip: large enough to amortize pickling, small enough that every
+    worker gets several chunks (good load balance, early first results).
+    """
+    if n_tasks <= 0:
+        return 1
+    return max(1, min(config.STREAM_MAX_CHUNKSIZE, math.ceil(n_tasks / (n_workers * config.STREAM_CHUNKS_PER_WORKER))))
+
+
+def forecast_frames(results: Iterable[tuple], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    (barcode, forecastedADD, fallback) frames of at most chunk_rows results each, read lazily
+    from an iterable of result tuples; always yields at least one (possibly empty) frame.
+    """
+    results = iter(results)
+    first = True
+    while True:
+        rows = [(res[0], res[1], res[4].get('fallback')) for res in islice(results, chunk_rows)]
+        if not rows and not first:
+            return
+        first = False
+        yield pd.DataFrame(rows, columns=['barcode', 'forecastedADD', 'fallback'])
+
+
+class KpiStreamWriter:
+    """
+    Turns forecast results into final KPI rows as they arrive and appends them to the output CSV,
+    so neither the results nor the final table have to be held in memory during Step 3.
+    It does hold the KPI base (one row of history KPIs and attributes per barcode), which,
+    like df_raw itself, grows with the catalogue.
+    """
+
+    def __init__(self, df_raw: pd.DataFrame, additional_data: pd.DataFrame, output_path: str, flush_every: int = None):
+        self.base = kpi_base(df_raw, additional_data)
+        self.output_path = output_path
+        self.flush_every = flush_every or config.STREAM_FLUSH_EVERY
+        self.rows_written = 0
+        self._buffer: List[tuple] = []
+        self._file = open(output_path, 'w', encoding='utf-8-sig', newline='')
+        self._header = True
+
+    def add(self, result: tuple):
+        self._buffer.append(result[:2])
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        forecast_df = pd.DataFrame(self._buffer, columns=['barcode', 'forecastedADD'])
+        forecast_df['barcode'] = forecast_df['barcode'].astype(str)
+        self._buffer = []
+
+        rows = self.base[self.base['barcode'].isin(forecast_df['barcode'])].merge(forecast_df, on='barcode', how='left')
+        final_rows = add_business_metrics(rows)
+        final_rows['barcode'] = "'" + final_rows['barcode'].astype(str)
+        final_rows.to_csv(self._file, index=False, header=self._header)
+        self._file.flush()
+        self._header = False
+        self.rows_written += len(final_rows)
+
+    def column_dtypes(self) -> dict:
+        """
+        dtypes of the written columns, taken from the KPI base of all barcodes rather than from one
+        batch, for reading the file back in chunks (text columns as str).
+        """
+        dtypes = add_business_metrics(self.base.head(0).assign(forecastedADD=0.0)).dtypes
+        return {col: (str if dtype == object or pd.api.types.is_string_dtype(dtype) else dtype)
+                for col, dtype in dtypes.items()}
+
+    def close(self) -> int:
+        self.flush()
+        if self._header:
+            # no rows at all: still leave a valid CSV with the expected columns
+            add_business_metrics(self.base.head(0).assign(forecastedADD=0.0)).to_csv(self._file, index=False)
+        self._file.close()
+        return self.rows_written
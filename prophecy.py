@@ -5,23 +5,193 @@ import numpy as np
 import io
 import contextlib
 import logging
+import os
+import pickle
+import time
+import multiprocessing
 from datetime import datetime
+from typing import Tuple, Union
 
 import config
-from utils import create_prophet_model
+from utils import create_prophet_model, apply_config
+from param_store import load_params, save_params, record_fit
+from result_cache import cache_key, model_key, get_cached, put_cached
+from model_store import load_model, save_model
+from holiday_index import holiday_index_for
+from tuning import tuned_params
+from watchdog import WARM_UP_KEY, kill_process_tree
 
 # Silence Prophet logs (already handled globally, but good practice per module)
 logging.getLogger('prophet').setLevel(logging.ERROR)
 logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
 
 
-def forecast_one(args):
+DEMAND_COLS = ['rolling_median_add', 'avg_daily_demand', 'avg_daily_demand_real']
+FUTURE_IN_STOCK_DAYS = 30  # პროგნოზირებულ თვეში ვუშვებთ, რომ პროდუქტი მთელი თვე მარაგშია
+
+# Per-process inputs shared by every task, set once by init_worker
+_WORKER_STATE = {'holidays': None, 'store': None, 'context_path': None, 'task_starts': None, 'in_pool': False}
+
+
+def init_worker(combined_holidays: pd.DataFrame, config_values: dict, store_handle: dict = None,
+                context_path: str = None, task_starts=None):
+    """
+    Pool initializer: receives the holiday table and config once
+    per process, attaches to the shared series store (if any), then optionally runs a
+    warm-up fit so the first real task is not slowed down by lazy imports and cold caches.
+    With context_path the pool can be started before the data is loaded: the holidays and
+    store handle are read from that file (see publish_worker_inputs) on the first task.
+    With a task_starts queue, forecast_stored reports every task it starts (watchdog.imap_with_deadline).
+    """
+    apply_config(config_values)
+    # a pool worker's only children are its CmdStan runs; the parent (also called here by benchmark.py) has its pool
+    _WORKER_STATE['in_pool'] = multiprocessing.parent_process() is not None
+    _WORKER_STATE['context_path'] = context_path
+    _WORKER_STATE['task_starts'] = task_starts
+    if context_path is None:
+        set_worker_inputs(combined_holidays, store_handle)
+    if config.WORKER_WARM_UP:
+        if task_starts is not None:
+            task_starts.put((WARM_UP_KEY, os.getpid(), time.time()))
+        warm_up()
+        if task_starts is not None:
+            task_starts.put((None, os.getpid(), time.time()))
+
+
+def set_worker_inputs(combined_holidays: pd.DataFrame, store_handle: dict = None):
+    """Installs this process's holiday table (and its index) and attaches to the shared series store."""
+    from series_store import SeriesStore
+
+    _WORKER_STATE['holidays'] = combined_holidays
+    holiday_index_for(combined_holidays)  # built once per worker, reused by every task
+    if store_handle is not None:
+        _WORKER_STATE['store'] = SeriesStore.attach(store_handle)
+
+
+def publish_worker_inputs(context_path: str, combined_holidays: pd.DataFrame, store_handle: dict):
+    """Writes the inputs for a pool started with context_path; must be called before the first task is submitted."""
+    with open(context_path + ".tmp", 'wb') as f:
+        pickle.dump((combined_holidays, store_handle), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(context_path + ".tmp", context_path)
+
+
+def _ensure_worker_inputs():
+    context_path = _WORKER_STATE['context_path']
+    if context_path is not None:
+        with open(context_path, 'rb') as f:
+            set_worker_inputs(*pickle.load(f))
+        _WORKER_STATE['context_path'] = None
+
+
+def warm_up():
+    """Runs one small throwaway fit through forecast_one."""
+    months = pd.date_range('2023-01-01', periods=config.MIN_DATA_POINTS_FOR_FORECAST * 2, freq='MS')
+    group = pd.DataFrame({
+        'transaction_month': months,
+        'avg_daily_demand': np.linspace(1.0, 2.0, len(months)),
+        'in_stock_days': 30,
+    })
+    # keep the throwaway fit out of the warm-start store, the result cache and the model store
+    saved = config.WARM_START, config.RESULT_CACHE, config.MODEL_STORE, config.PREDICT_ONLY
+    config.WARM_START = config.RESULT_CACHE = config.MODEL_STORE = config.PREDICT_ONLY = False
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            forecast_one((WARM_UP_KEY, group, 1.0))
+    finally:
+        config.WARM_START, config.RESULT_CACHE, config.MODEL_STORE, config.PREDICT_ONLY = saved
+
+
+def prepare_series(group: pd.DataFrame) -> Union[pd.DataFrame, None]:
+    """
+    Builds the monthly (ds, y, in_stock_days) frame used for fitting a single barcode.
+    Returns None if the group has no usable demand column.
+    """
+    df = group.copy()
+    df['ds'] = pd.to_datetime(df['transaction_month'])
+
+    # Use the best available demand column
+    y_col = next((col for col in DEMAND_COLS if col in df.columns and df[col].notna().any()), None)
+    if not y_col:
+        return None
+    df['y'] = df[y_col]
+
+    # Aggregate data by month
+    return df.groupby('ds', as_index=False).agg(
+        y=('y', 'mean'),
+        in_stock_days=('in_stock_days', 'mean')
+    ).dropna()
+
+
+def forecastability_issue(df: pd.DataFrame) -> Union[str, None]:
+    """
+    Returns why a prepared series cannot be fitted ('too_few_points', 'zero_demand',
+    'low_std'), or None if it has enough points and enough variation.
+    """
+    if len(df) < config.MIN_DATA_POINTS_FOR_FORECAST:
+        return 'too_few_points'
+    if df['y'].sum() == 0:
+        return 'zero_demand'
+    if not df['y'].std() >= config.STD_DEV_THRESHOLD:
+        return 'low_std'
+    return None
+
+
+def is_forecastable(df: pd.DataFrame) -> bool:
+    """Checks that a prepared series has enough points and enough variation to be fitted."""
+    return forecastability_issue(df) is None
+
+
+def choose_growth(df: pd.DataFrame) -> Tuple[str, Union[float, None]]:
+    """
+    Picks the trend type for a prepared series.
+    Returns (growth_type, cap_val); cap_val is None for linear growth.
+    """
+    use_logistic = (df['y'].max() / df['y'].mean()) > config.LOGISTIC_GROWTH_THRESHOLD
+    if not use_logistic:
+        return 'linear', None
+    cap_val = df['y'].quantile(config.LOGISTIC_CAP_QUANTILE) * config.LOGISTIC_CAP_MULTIPLIER
+    return 'logistic', cap_val
+
+
+def forecast_fallback(forecasted_add: float, median_add_3m: float) -> Union[str, None]:
+    """Which median safeguard finalize_forecast applies to a raw forecast, if any."""
+    if median_add_3m > 0 and forecasted_add < median_add_3m / 2:
+        return 'too_low_forecast'
+    if not np.isfinite(forecasted_add) or forecasted_add < 0:
+        return 'invalid_forecast'
+    return None
+
+
+def finalize_forecast(barcode: str, forecasted_add: float, median_add_3m: float) -> Tuple[float, Union[str, None]]:
+    """Applies the median safeguards to a raw next-month forecast; returns (final value, fallback or None)."""
+    fallback = forecast_fallback(forecasted_add, median_add_3m)
+    if fallback == 'too_low_forecast':
+        print(f"INFO: Barcode {barcode} forecast ({forecasted_add:.4f}) was too low compared to median ({median_add_3m:.4f}). Using median instead.")
+    final_forecast = median_add_3m if fallback else forecasted_add
+
+    return round(float(final_forecast), 4), fallback
+
+
+def forecast_one(args, combined_holidays: pd.DataFrame = None):
     """
     Runs Prophet forecast for a single barcode.
-    Returns a tuple: (barcode, forecast_value, start_time, end_time)
+    args is (barcode, group, median_add_3m); the holiday table defaults to the one
+    shipped to this worker by init_worker.
+    Returns a tuple: (barcode, forecast_value, start_time, end_time, info), where info holds
+    the series length, growth type, fit seconds, whether the result came from the cache or
+    a stored model, whether tuned hyperparameters were used, the worker pid and the fallback
+    path that fired (None if the model forecast was used).
     """
-    barcode, group, combined_holidays, median_add_3m = args
+    barcode, group, median_add_3m = args
+    if combined_holidays is None:
+        combined_holidays = _WORKER_STATE['holidays']
     start_time = datetime.now()
+    info = {'series_len': 0, 'growth': None, 'fallback': None, 'cached': False, 'stored_model': False,
+            'fit_seconds': None, 'worker': os.getpid(), 'tuned': False}
+
+    def done(value, fallback=None):
+        info['fallback'] = fallback
+        return (barcode, value, start_time, datetime.now(), info)
 
     try:
         # Redirect stderr to hide cmdstanpy's initial output
@@ -29,51 +199,98 @@ def forecast_one(args):
             
             # --- PRE-FORECAST CHECKS ---
             if median_add_3m == 0 or pd.isna(median_add_3m):
-                return (barcode, 0.0, start_time, datetime.now())
-
-            df = group.copy()
-            df['ds'] = pd.to_datetime(df['transaction_month'])
-            
-            # Use the best available demand column
-            demand_cols = ['rolling_median_add', 'avg_daily_demand', 'avg_daily_demand_real']
-            y_col = next((col for col in demand_cols if col in df.columns and df[col].notna().any()), None)
-            
-            if not y_col:
-                return (barcode, median_add_3m, start_time, datetime.now())
-            df['y'] = df[y_col]
+                return done(0.0, 'zero_median')
 
-            # Aggregate data by month
-            df = df.groupby('ds', as_index=False).agg(
-                y=('y', 'mean'),
-                in_stock_days=('in_stock_days', 'mean')
-            ).dropna()
+            df = prepare_series(group)
+            if df is None:
+                return done(median_add_3m, 'no_demand_column')
+            info['series_len'] = len(df)
 
             # --- VALIDATION ---
-            if len(df) < config.MIN_DATA_POINTS_FOR_FORECAST or df['y'].sum() == 0:
-                return (barcode, median_add_3m, start_time, datetime.now())
-            
-            if df['y'].std() < config.STD_DEV_THRESHOLD:
-                 return (barcode, median_add_3m, start_time, datetime.now())
+            issue = forecastability_issue(df)
+            if issue:
+                return done(median_add_3m, issue)
 
             # --- MODEL CONFIGURATION ---
-            use_logistic = (df['y'].max() / df['y'].mean()) > config.LOGISTIC_GROWTH_THRESHOLD
-            growth_type = 'logistic' if use_logistic else 'linear'
-            
-            model = create_prophet_model(combined_holidays, growth_type)
-            model.add_regressor('in_stock_days')
+            growth_type, cap_val = choose_growth(df)
+            use_logistic = growth_type == 'logistic'
+            info['growth'] = growth_type
+            # segment hyperparameters from `python main.py --tune` (None = PROPHET_PARAMS)
+            params = tuned_params(barcode)
+            info['tuned'] = params is not None
             
             fit_df = df[['ds', 'y', 'in_stock_days']].drop_duplicates(subset=['ds'])
+            next_month = df['ds'].max() + pd.offsets.MonthBegin(1)
+
+            # only the holidays that fall on this series' dates (others would be all-zero regressors)
+            series_holidays = holiday_index_for(combined_holidays).for_dates(pd.concat([fit_df['ds'], pd.Series([next_month])]))
+            info['holidays'] = series_holidays['holiday'].nunique()
 
             if use_logistic:
-                cap_val = df['y'].quantile(config.LOGISTIC_CAP_QUANTILE) * config.LOGISTIC_CAP_MULTIPLIER
                 fit_df['cap'] = cap_val
                 fit_df['floor'] = 0.01
 
+            # --- RESULT CACHE (skip Stan when nothing relevant has changed) ---
+            key = None
+            if config.RESULT_CACHE:
+                key = cache_key(fit_df, median_add_3m, series_holidays, params)
+                cached = None
+                if not config.FORCE_REFIT:
+                    cached = get_cached(key)
+                    info['cache_lookup'] = 'hit' if cached is not None else 'miss'
+                if cached is not None:
+                    value, cached_info = cached
+                    info['cached'] = True
+                    return done(value, cached_info['fallback'])
+
+            # --- STORED MODEL (predict-only: reuse the last fit if it saw exactly this data) ---
+            model = None
+            fingerprint = model_key(fit_df, growth_type, series_holidays, params) if config.MODEL_STORE or config.PREDICT_ONLY else None
+            if config.PREDICT_ONLY:
+                model = load_model(barcode, fingerprint)
+                info['stored_model'] = model is not None
+
             # --- FITTING AND PREDICTING ---
-            model.fit(fit_df, n_jobs=config.STAN_N_JOBS)
+            if model is None:
+                model = create_prophet_model(series_holidays if not series_holidays.empty else None,
+                                             growth_type, params)
+                model.add_regressor('in_stock_days')
+
+                # Stan's optimizer has no n_jobs argument; worker threads are capped by scheduler.limit_worker_threads
+                fit_kwargs = {}
+                init = None
+                if config.WARM_START:
+                    # Start from last run's optimum; cold start if growth type or config changed
+                    init = load_params(barcode, growth_type)
+                    fit_kwargs['save_iterations'] = True  # lets us count optimizer iterations
+                    if init is not None:
+                        fit_kwargs['init'] = init
+
+                if config.FIT_TIMEOUT_SECONDS > 0:
+                    # CmdStan is terminated at the deadline and cmdstanpy raises TimeoutError
+                    fit_kwargs['timeout'] = config.FIT_TIMEOUT_SECONDS
+
+                fit_start = time.perf_counter()
+                try:
+                    model.fit(fit_df, **fit_kwargs)
+                except TimeoutError:
+                    # SIGTERM may not stop a stalled CmdStan; nothing of this fit may outlive it.
+                    # Only in pool workers: in the parent (e.g. compare_with_prophet) the children are pool workers.
+                    if _WORKER_STATE['in_pool']:
+                        kill_process_tree(os.getpid(), include_root=False)
+                    info['fit_seconds'] = time.perf_counter() - fit_start
+                    info['error'] = f"fit timed out after {config.FIT_TIMEOUT_SECONDS:.0f}s (FIT_TIMEOUT_SECONDS)"
+                    return done(median_add_3m, 'fit_timeout')
+                info['fit_seconds'] = time.perf_counter() - fit_start
+                if config.WARM_START:
+                    iterations = model.stan_fit.optimized_iterations_np.shape[0] - 1
+                    record_fit(barcode, init is not None, iterations, info['fit_seconds'])
+                    save_params(barcode, growth_type, model.params)
+                if config.MODEL_STORE:
+                    save_model(barcode, fingerprint, model)
 
             future = model.make_future_dataframe(periods=1, freq='MS')
-            future['in_stock_days'] = 30
+            future['in_stock_days'] = FUTURE_IN_STOCK_DAYS
             if use_logistic:
                 future['cap'] = cap_val
                 future['floor'] = 0.01
@@ -83,46 +300,70 @@ def forecast_one(args):
             # --- POST-PROCESSING ---
             forecast_next_month = forecast[forecast['ds'] > df['ds'].max()]
             if forecast_next_month.empty:
-                return (barcode, median_add_3m, start_time, datetime.now())
+                return done(median_add_3m, 'empty_forecast')
 
             forecasted_add = forecast_next_month['yhat'].iloc[0]
-            
-            if median_add_3m > 0 and forecasted_add < median_add_3m / 2:
-                print(f"INFO: Barcode {barcode} forecast ({forecasted_add:.4f}) was too low compared to median ({median_add_3m:.4f}). Using median instead.")
-                final_forecast = median_add_3m
-            else:
-                final_forecast = forecasted_add
-
-            if not np.isfinite(final_forecast) or final_forecast < 0:
-                final_forecast = median_add_3m
+            final_forecast, fallback = finalize_forecast(barcode, forecasted_add, median_add_3m)
+            if key is not None:
+                put_cached(key, barcode, final_forecast, {'fallback': fallback})
 
-            return (barcode, round(float(final_forecast), 4), start_time, datetime.now())
+            return done(final_forecast, fallback)
 
     except Exception as e:
         # Log the error for debugging, but don't stop the whole process
         print(f"WARNING: Forecast for barcode {barcode} failed: {e}. Defaulting to median_add_3m.")
-        return (barcode, median_add_3m, start_time, datetime.now())
+        info['error'] = str(e)
+        return done(median_add_3m, 'exception')
+
+def forecast_stored(args):
+    """
+    Pool task for series kept in the worker's shared SeriesStore.
+    args is (barcode, median_add_3m); the series is sliced from shared memory.
+    """
+    barcode, median_add_3m = args
+    if _WORKER_STATE['task_starts'] is not None:
+        _WORKER_STATE['task_starts'].put((barcode, os.getpid(), time.time()))
+    _ensure_worker_inputs()
+    return forecast_one((barcode, worker_series(barcode), median_add_3m))
+
+def worker_series(barcode: str) -> pd.DataFrame:
+    """Series of a barcode from the shared store attached by init_worker."""
+    return _WORKER_STATE['store'].frame(barcode)
+
+def worker_holidays() -> pd.DataFrame:
+    """Holiday table shipped to this worker by init_worker."""
+    return _WORKER_STATE['holidays']
 
 def calculate_kpis(df_raw: pd.DataFrame, forecast_df: pd.DataFrame, additional_data: pd.DataFrame) -> pd.DataFrame:
     """Calculates final KPIs, merges all data sources, and adds business metrics."""
-    from utils import safe_mean_filtered
-    
+    result = kpi_base(df_raw, additional_data).merge(forecast_df, on='barcode', how='left')
+    return add_business_metrics(result)
+
+def kpi_aggregates(df_raw: pd.DataFrame, demand_col: str) -> pd.DataFrame:
+    """averageADD, DSI and GMROI per barcode (index) over the rows with positive demand."""
+    from utils import group_mean_filtered
+
+    # ერთიანი (ვექტორული) აგრეგაცია ყველა ბარკოდზე, Python-ის lambda-ების გარეშე
+    filtered = df_raw[df_raw[demand_col] > 0]
+    keys = filtered['barcode']
+    agg = pd.DataFrame({
+        'averageADD': filtered[demand_col].groupby(keys).mean().round(4),
+        'DSI': group_mean_filtered(filtered['dsi'], keys),
+        'GMROI': group_mean_filtered(filtered['gmroi'], keys),
+    })
+    agg.index.name = 'barcode'
+    return agg
+
+def kpi_base(df_raw: pd.DataFrame, additional_data: pd.DataFrame) -> pd.DataFrame:
+    """Per-barcode historical KPIs merged with product attributes, i.e. everything except the forecast."""
     if not pd.api.types.is_datetime64_any_dtype(df_raw['ds']):
         df_raw['ds'] = pd.to_datetime(df_raw['ds'])
 
-    demand_cols = ['rolling_median_add', 'avg_daily_demand', 'avg_daily_demand_real']
-    demand_col = next((col for col in demand_cols if col in df_raw.columns), None)
+    demand_col = next((col for col in DEMAND_COLS if col in df_raw.columns), None)
     if not demand_col:
         raise ValueError(f"No demand column found in raw data. Available: {df_raw.columns.tolist()}")
 
-    filtered = df_raw[df_raw[demand_col] > 0]
-    agg = filtered.groupby('barcode').agg(
-        averageADD=(demand_col, lambda x: round(x[x > 0].mean(), 4)),
-        DSI=('dsi', lambda x: safe_mean_filtered(x)),
-        GMROI=('gmroi', lambda x: safe_mean_filtered(x)),
-    )
-
-    result = agg.reset_index().merge(forecast_df, on='barcode', how='left')
+    result = kpi_aggregates(df_raw, demand_col).reset_index()
     
     if additional_data is not None and not additional_data.empty:
         # დარწმუნდით, რომ ყველა საჭირო ველი არსებობს additional_data-ში
@@ -131,7 +372,10 @@ def calculate_kpis(df_raw: pd.DataFrame, forecast_df: pd.DataFrame, additional_d
                                       'items_sold_3m', 'median_add_3m'] 
                       if col in additional_data.columns]
         result = result.merge(additional_data[merge_cols], on='barcode', how='left')
-    
+    return result
+
+def add_business_metrics(result: pd.DataFrame) -> pd.DataFrame:
+    """Adds revenue, COGS and purchase recommendation to KPI rows that already carry forecastedADD."""
     # ვავსებთ ცარიელ მნიშვნელობებს, რათა თავიდან ავიცილოთ შეცდომები
     for col in ['items_sold_3m', 'price', 'cost', 'in_stock', 'forecastedADD']:
         if col in result.columns:
@@ -0,0 +1,160 @@
+# result_cache.py
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Union
+
+import pandas as pd
+
+import config
+
+# ერთი კავშირი თითო ნაკადზე (worker-ები და CV-ის ნაკადები ერთ SQLite ფაილს იზიარებენ)
+_local = threading.local()
+TOUCH_SECONDS = 3600  # LRU-ს სიზუსტე: ამაზე ახლახან გამოყენებული ჩანაწერის last_used აღარ ახლდება
+
+
+def _get_connection() -> sqlite3.Connection:
+    _connection = getattr(_local, 'connection', None)
+    if _connection is None:
+        os.makedirs(os.path.dirname(config.RESULT_CACHE_PATH) or '.', exist_ok=True)
+        _connection = _local.connection = sqlite3.connect(config.RESULT_CACHE_PATH, timeout=30)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                barcode TEXT NOT NULL,
+                forecast REAL NOT NULL,
+                last_used REAL NOT NULL,
+                info TEXT
+            )""")
+        columns = {row[1] for row in _connection.execute("PRAGMA table_info(results)")}
+        if 'info' not in columns:
+            # caches written before per-series info was stored; their rows read as misses and are refit once
+            _connection.execute("ALTER TABLE results ADD COLUMN info TEXT")
+        _connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS cv_folds (
+                key TEXT PRIMARY KEY,
+                fold TEXT NOT NULL,
+                last_used REAL NOT NULL DEFAULT 0
+            )""")
+        if 'last_used' not in {row[1] for row in _connection.execute("PRAGMA table_info(cv_folds)")}:
+            # folds cached before eviction existed count as least recently used
+            _connection.execute("ALTER TABLE cv_folds ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+        _connection.execute("CREATE INDEX IF NOT EXISTS cv_folds_last_used ON cv_folds (last_used)")
+        _connection.commit()
+    return _connection
+
+
+def _content_hash(frames: list, holidays_slice: pd.DataFrame, settings: dict) -> str:
+    digest = hashlib.sha1()
+    for frame in frames:
+        digest.update(pd.util.hash_pandas_object(frame.reset_index(drop=True), index=False).values.tobytes())
+    hol = holidays_slice.sort_values(['holiday', 'ds']).reset_index(drop=True) if not holidays_slice.empty else holidays_slice
+    digest.update(pd.util.hash_pandas_object(hol, index=False).values.tobytes())
+    settings = {**settings, 'prophet': config.PROPHET_PARAMS, 'seasonality': config.MONTHLY_SEASONALITY}
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _with_params(settings: dict, params: Union[dict, None]) -> dict:
+    # tuned hyperparameters (tuning.tuned_params) are part of the key only where they apply
+    return {**settings, 'params': params} if params else settings
+
+
+def cache_key(fit_df: pd.DataFrame, median_add_3m: float, holidays_slice: pd.DataFrame, params: dict = None) -> str:
+    """Content hash of everything that determines a barcode's forecastedADD."""
+    return _content_hash([fit_df], holidays_slice, _with_params({
+        'median_add_3m': round(float(median_add_3m), 10),
+        'logistic': [config.LOGISTIC_GROWTH_THRESHOLD, config.LOGISTIC_CAP_QUANTILE, config.LOGISTIC_CAP_MULTIPLIER],
+    }, params))
+
+
+def model_key(fit_df: pd.DataFrame, growth_type: str, holidays_slice: pd.DataFrame, params: dict = None) -> str:
+    """Fingerprint of a fitted model's training inputs (series, holidays, config); unlike cache_key it ignores median_add_3m."""
+    return _content_hash([fit_df], holidays_slice, _with_params({'kind': 'model', 'growth': growth_type}, params))
+
+
+def fold_key(train: pd.DataFrame, test_ds: pd.Series, holidays_slice: pd.DataFrame, params: dict = None) -> str:
+    """Content hash of one cross-validation fold (training slice, predicted dates, holidays, config)."""
+    return _content_hash([train, test_ds.to_frame()], holidays_slice, _with_params({'kind': 'cv_fold'}, params))
+
+
+def get_cached_fold(key: str) -> Union[pd.DataFrame, None]:
+    """Returns the cached predictions (ds, yhat, y, cutoff) of a CV fold (and marks it recently used), or None."""
+    conn = _get_connection()
+    row = conn.execute("SELECT fold, last_used FROM cv_folds WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    now = time.time()
+    if now - row[1] > TOUCH_SECONDS:
+        conn.execute("UPDATE cv_folds SET last_used = ? WHERE key = ?", (now, key))
+        conn.commit()
+    fold = pd.read_json(io.StringIO(row[0]), orient='split')
+    for col in ('ds', 'cutoff'):
+        fold[col] = pd.to_datetime(fold[col])
+    return fold
+
+
+def put_cached_fold(key: str, fold: pd.DataFrame):
+    conn = _get_connection()
+    conn.execute("INSERT OR REPLACE INTO cv_folds (key, fold, last_used) VALUES (?, ?, ?)",
+                 (key, fold.to_json(orient='split', date_format='iso', index=False), time.time()))
+    conn.commit()
+
+
+def get_cached(key: str) -> Union[tuple, None]:
+    """
+    Returns (forecast, info) cached for a key (and marks it recently used), or None on a miss.
+    info holds the per-series outputs stored with the forecast by put_cached (e.g. the fallback path).
+    A miss costs one read; a hit writes only when last_used is older than TOUCH_SECONDS.
+    """
+    conn = _get_connection()
+    row = conn.execute("SELECT forecast, info, last_used FROM results WHERE key = ? AND info IS NOT NULL",
+                       (key,)).fetchone()
+    if row is None:
+        return None
+    now = time.time()
+    if now - row[2] > TOUCH_SECONDS:
+        conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        conn.commit()
+    return row[0], json.loads(row[1])
+
+
+def put_cached(key: str, barcode: str, forecast: float, info: dict):
+    conn = _get_connection()
+    conn.execute("INSERT OR REPLACE INTO results (key, barcode, forecast, last_used, info) VALUES (?, ?, ?, ?, ?)",
+                 (key, barcode, float(forecast), time.time(), json.dumps(info, default=str)))
+    conn.commit()
+
+
+def _evict(conn: sqlite3.Connection, table: str, size_expr: str, max_bytes: int) -> int:
+    # drops the least recently used rows once the running payload size passes max_bytes
+    return conn.execute(f"""
+        DELETE FROM {table} WHERE key IN (
+            SELECT key FROM (
+                SELECT key, SUM({size_expr}) OVER (ORDER BY last_used DESC, key) AS running FROM {table}
+            ) WHERE running > ?
+        )""", (max_bytes,)).rowcount
+
+
+def prune_cache(max_result_bytes: int, max_fold_bytes: int):
+    """Evicts least recently used results and CV folds beyond their byte budgets (keys and payloads)."""
+    conn = _get_connection()
+    results = _evict(conn, 'results', "length(key) + length(barcode) + 8 + ifnull(length(info), 0)", max_result_bytes)
+    folds = _evict(conn, 'cv_folds', "length(key) + length(fold)", max_fold_bytes)
+    conn.commit()
+    if results or folds:
+        print(f"INFO: Result cache evicted {results} least recently used forecasts and {folds} CV folds.")
+
+
+def report_cache_stats(hits: int, misses: int):
+    """Prints the hit/miss counts of a run (tallied by the caller from the results' info['cache_lookup'])."""
+    total = hits + misses
+    rate = hits / total * 100 if total else 0.0
+    print(f"INFO: Result cache: {hits} hits, {misses} misses ({rate:.1f}% hit rate).")
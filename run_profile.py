@@ -0,0 +1,132 @@
+# run_profile.py
+
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Union
+
+import pandas as pd
+
+import config
+
+
+class RunProfile:
+    """
+    Collects stage durations and per-barcode forecast telemetry for one run and writes them
+    as output/run_profile_<RUN_ID>.json (summary) and output/run_profile_<RUN_ID>_skus.csv.
+    """
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.started_at = datetime.now()
+        self.stages: Dict[str, float] = {}
+        self.workers = None  # pool size; None when forecasts are not run per barcode in workers
+        self._stage: Union[str, None] = None
+        self._stage_start = 0.0
+        self._tasks: List[dict] = []
+
+    def begin(self, stage: str):
+        """Starts timing a stage; the previous stage (if any) ends here."""
+        self.end()
+        self._stage, self._stage_start = stage, time.perf_counter()
+
+    def end(self):
+        if self._stage is not None:
+            self.stages[self._stage] = self.stages.get(self._stage, 0.0) + time.perf_counter() - self._stage_start
+            self._stage = None
+
+    def add_task(self, result: tuple):
+        """Records one forecast result: (barcode, value, start_time, end_time[, info])."""
+        barcode, value, start_time, end_time = result[:4]
+        info = result[4] if len(result) > 4 else {}
+        self._tasks.append({
+            'barcode': barcode,
+            'forecastedADD': value,
+            'seconds': (end_time - start_time).total_seconds(),
+            'fit_seconds': info.get('fit_seconds'),
+            'series_len': info.get('series_len'),
+            'growth': info.get('growth'),
+            'fallback': info.get('fallback'),
+            'cached': info.get('cached', False),
+            'stored_model': info.get('stored_model', False),
+            'tuned': info.get('tuned', False),
+            'worker': info.get('worker'),
+            'error': info.get('error'),
+            'pooled': info.get('pooled'),
+            'start_time': start_time,
+            'end_time': end_time,
+        })
+
+    def tasks(self) -> pd.DataFrame:
+        # an empty run (e.g. a fully journaled --resume) still gets numeric timing columns
+        return pd.DataFrame(self._tasks, columns=['barcode', 'forecastedADD', 'seconds', 'fit_seconds', 'series_len',
+                                                  'growth', 'fallback', 'cached', 'stored_model', 'tuned', 'worker', 'error',
+                                                  'pooled', 'start_time', 'end_time']).astype({'seconds': float, 'fit_seconds': float})
+
+    def utilization(self, tasks: pd.DataFrame) -> dict:
+        """Busy time per worker relative to the forecast stage wall time."""
+        wall = self.stages.get('forecast', 0.0)
+        busy = tasks.groupby('worker')['seconds'].sum() if not tasks.empty else pd.Series(dtype=float)
+        capacity = wall * (self.workers or 0)
+        return {
+            'workers': self.workers,
+            'forecast_wall_seconds': round(wall, 3),
+            'busy_seconds': round(float(busy.sum()), 3),
+            'utilization': round(float(busy.sum()) / capacity, 4) if capacity > 0 else None,
+            'per_worker_busy_seconds': {str(worker): round(float(secs), 3) for worker, secs in busy.items()},
+        }
+
+    def summary(self, slowest_n: int = None) -> dict:
+        slowest_n = config.PROFILE_SLOWEST_N if slowest_n is None else slowest_n
+        tasks = self.tasks()
+        slowest = tasks.nlargest(slowest_n, 'seconds')[['barcode', 'seconds', 'fit_seconds', 'series_len',
+                                                        'growth', 'fallback']]
+        # members of a pooled group share one fit (hierarchical engine)
+        fitted, pooled = tasks['fit_seconds'].notna(), tasks['pooled'].notna()
+        n_group_fits = int(tasks.loc[fitted & pooled, 'pooled'].nunique())
+        return {
+            'run_id': self.run_id,
+            'started_at': self.started_at.isoformat(),
+            'engine': config.FORECAST_ENGINE,
+            'stages_seconds': {stage: round(secs, 3) for stage, secs in self.stages.items()},
+            'n_barcodes': len(tasks),
+            'n_fitted': int((fitted & ~pooled).sum()) + n_group_fits,
+            'n_group_fits': n_group_fits,
+            'n_pooled_fitted': int((fitted & pooled).sum()),
+            'n_cached': int(tasks['cached'].sum()),
+            'n_stored_model': int(tasks['stored_model'].sum()),
+            'n_tuned': int(tasks['tuned'].sum()),
+            'fallback_counts': tasks['fallback'].value_counts().to_dict(),
+            'growth_counts': tasks['growth'].value_counts().to_dict(),
+            'fit_seconds': tasks['fit_seconds'].describe(percentiles=[0.5, 0.9, 0.99]).round(4).fillna(0).to_dict(),
+            'worker_utilization': self.utilization(tasks),
+            'slowest': json.loads(slowest.to_json(orient='records')),
+        }
+
+    def write(self, folder: str = None) -> str:
+        """Writes the JSON summary and the per-barcode CSV; prints a short report. Returns the JSON path."""
+        self.end()
+        folder = folder or config.OUTPUT_FOLDER
+        os.makedirs(folder, exist_ok=True)
+        base = os.path.join(folder, f"run_profile_{self.run_id}")
+
+        summary = self.summary()
+        with open(base + ".json", 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+        self.tasks().to_csv(base + "_skus.csv", index=False, encoding='utf-8-sig')
+
+        stages = ", ".join(f"{stage} {secs:.1f}s" for stage, secs in summary['stages_seconds'].items())
+        print(f"INFO: Run profile: {stages}.")
+        utilization = summary['worker_utilization']['utilization']
+        if utilization is not None:
+            print(f"INFO: Worker utilization {utilization:.0%} over {self.workers} workers.")
+        groups = (f" ({summary['n_group_fits']} group models for {summary['n_pooled_fitted']} pooled SKUs)"
+                  if summary['n_group_fits'] else "")
+        print(f"INFO: {summary['n_fitted']} fitted{groups}, {summary['n_cached']} from cache, "
+              f"{summary['n_stored_model']} predicted from stored models, {summary['n_tuned']} with tuned params, "
+              f"fallbacks: {summary['fallback_counts'] or 'none'}.")
+        if summary['slowest']:
+            top = ", ".join(f"{row['barcode']} ({row['seconds']:.2f}s)" for row in summary['slowest'][:5])
+            print(f"INFO: Slowest barcodes: {top}. Full profile saved to {base}.json")
+        return base + ".json"
@@ -0,0 +1,90 @@
+# scheduler.py
+
+import os
+from multiprocessing import cpu_count
+from typing import Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+
+# ნაკადების ლიმიტები, რომლებსაც BLAS/OpenMP და Stan კითხულობენ worker-ის სტარტზე
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS', 'STAN_NUM_THREADS']
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects CPU affinity / container cpusets where available)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return cpu_count()
+
+
+def plan_workers(threads_per_task: int = None, core_budget: int = None) -> Tuple[int, int]:
+    """
+    Splits the core budget between pool size and threads per task so that
+    processes x threads never exceeds it. Returns (processes, threads_per_task).
+    """
+    budget = core_budget or config.CORE_BUDGET or max(1, available_cores() - 1)
+    threads = max(1, min(threads_per_task or config.STAN_N_JOBS, budget))
+    return max(1, budget // threads), threads
+
+
+def limit_worker_threads(threads: int):
+    """
+    Caps BLAS/OpenMP/Stan threads for worker processes started from now on. Spawned workers
+    inherit the environment, and the libraries read these variables when they are first loaded.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+
+def estimate_costs(df_raw: pd.DataFrame, barcodes: Iterable[str], observed: dict = None) -> pd.Series:
+    """
+    Relative fit cost per barcode from its series length and expected growth type, computed
+    with one vectorized pass over df_raw. observed ({barcode: fit seconds} from earlier runs)
+    overrides the estimate where available. Series that will fall back to the median before
+    fitting (too short, no variation) cost 0.
+    """
+    from prophecy import DEMAND_COLS
+
+    demand_col = next((col for col in DEMAND_COLS if col in df_raw.columns), None)
+    if demand_col is None:
+        return pd.Series(0.0, index=pd.Index(barcodes))
+
+    grouped = df_raw.groupby('barcode')[demand_col]
+    stats = pd.DataFrame({
+        'points': df_raw.groupby('barcode')['ds'].nunique(),
+        'mean': grouped.mean(),
+        'max': grouped.max(),
+        'std': grouped.std(),
+    }).reindex(pd.Index(barcodes))
+
+    fittable = (stats['points'] >= config.MIN_DATA_POINTS_FOR_FORECAST) & (stats['std'] >= config.STD_DEV_THRESHOLD)
+    logistic = (stats['max'] / stats['mean']) > config.LOGISTIC_GROWTH_THRESHOLD
+    cost = (config.COST_PER_FIT + config.COST_PER_POINT * stats['points'].fillna(0)) \
+        * np.where(logistic, config.COST_LOGISTIC_FACTOR, 1.0)
+
+    if observed is not None and len(observed):
+        # მიმდინარე ბარკოდებისთვის ბოლო გაშვების რეალური დრო უფრო ზუსტია, ვიდრე ევრისტიკა;
+        # დანარჩენებისთვის ევრისტიკა იმავე ერთეულებში გადაგვყავს (მედიანური თანაფარდობით)
+        observed = pd.Series(observed, dtype=float).reindex(cost.index)
+        known = observed.notna() & (cost > 0)
+        if known.any():
+            cost = observed.where(known, cost * float((observed[known] / cost[known]).median()))
+    return cost.where(fittable, 0.0).rename('cost')
+
+
+def order_longest_first(tasks: Iterable[Tuple[str, float]], costs: pd.Series) -> List[Tuple[str, float]]:
+    """
+    Sorts (barcode, median_add_3m) tasks by expected cost, most expensive first, so the long
+    fits start early and the end of the run is made of cheap ones (shorter tail).
+    Zero-median tasks never fit and go last. Sorting needs every task at once, so the
+    (barcode, median_add_3m) list is materialized (one small tuple per barcode).
+    """
+    tasks = list(tasks)
+    expected = [0.0 if not median else float(costs.get(barcode, 0.0)) for barcode, median in tasks]
+    order = np.argsort(-np.asarray(expected, dtype=float), kind='stable')
+    return [tasks[i] for i in order]
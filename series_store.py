@@ -0,0 +1,106 @@
+# series_store.py
+
+import sys
+from multiprocessing import shared_memory
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from prophecy import DEMAND_COLS
+
+# forecast_one მხოლოდ ამ სვეტებს კითხულობს
+STORE_DTYPES = {
+    'transaction_month': np.dtype('datetime64[ns]'),
+    'in_stock_days': np.dtype('float32'),
+    **{col: np.dtype('float32') for col in DEMAND_COLS},
+}
+
+
+def _open_shared_memory(name: str) -> shared_memory.SharedMemory:
+    # Python 3.13+: attaching processes must not unlink the block on exit
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class SeriesStore:
+    """
+    Columnar, shared-memory copy of the per-barcode series that forecast_one needs.
+
+    Rows are sorted by integer-coded barcode, and `offsets[i]:offsets[i + 1]` is the
+    row range of `barcodes[i]`. The parent builds the store once with from_frame();
+    workers attach() to the same memory and slice their series without copying.
+    """
+
+    def __init__(self, barcodes: List[str], offsets: np.ndarray, columns: Dict[str, np.ndarray],
+                 segments: Dict[str, shared_memory.SharedMemory], owner: bool):
+        self.barcodes = barcodes
+        self.offsets = offsets
+        self.columns = columns
+        self._segments = segments
+        self._owner = owner
+        self._index = {barcode: i for i, barcode in enumerate(barcodes)}
+
+    @classmethod
+    def from_frame(cls, df_raw: pd.DataFrame) -> 'SeriesStore':
+        """Copies the needed columns of the raw sales frame into shared memory."""
+        codes, uniques = pd.factorize(df_raw['barcode'].astype(str), sort=True)
+        order = np.argsort(codes, kind='stable')
+        offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(uniques)))
+
+        columns, segments = {}, {}
+        for name, dtype in STORE_DTYPES.items():
+            if name not in df_raw.columns:
+                continue
+            if name == 'transaction_month':
+                values = pd.to_datetime(df_raw[name]).to_numpy(dtype=dtype)
+            else:
+                values = pd.to_numeric(df_raw[name], errors='coerce').to_numpy(dtype=dtype)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+            column = np.ndarray(values.shape, dtype=dtype, buffer=shm.buf)
+            column[:] = values[order]
+            columns[name], segments[name] = column, shm
+
+        return cls(list(uniques), offsets, columns, segments, owner=True)
+
+    def handle(self) -> dict:
+        """Small picklable description that workers pass to attach()."""
+        return {
+            'barcodes': self.barcodes,
+            'offsets': self.offsets,
+            'columns': {name: (self._segments[name].name, col.dtype.str, len(col)) for name, col in self.columns.items()},
+        }
+
+    @classmethod
+    def attach(cls, handle: dict) -> 'SeriesStore':
+        """Maps a store created by another process without copying its data."""
+        columns, segments = {}, {}
+        for name, (shm_name, dtype, length) in handle['columns'].items():
+            shm = _open_shared_memory(shm_name)
+            columns[name] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf)
+            segments[name] = shm
+        return cls(handle['barcodes'], handle['offsets'], columns, segments, owner=False)
+
+    def frame(self, barcode: str) -> pd.DataFrame:
+        """Returns the series of one barcode as a DataFrame over shared-memory views."""
+        i = self._index[barcode]
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return pd.DataFrame({name: col[lo:hi] for name, col in self.columns.items()}, copy=False)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(col.nbytes for col in self.columns.values()) + self.offsets.nbytes
+
+    def close(self):
+        """Releases the mapping; the creating process also frees the shared memory."""
+        self.columns = {}
+        for shm in self._segments.values():
+            try:
+                shm.close()
+            except BufferError:
+                pass  # frames still hold views; the mapping goes away with them
+            if self._owner:
+                shm.unlink()
+        self._segments = {}
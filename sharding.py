@@ -0,0 +1,126 @@
+# sharding.py
+
+import glob
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Iterable, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import config
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parses '--shard i/N' (1-based, e.g. '2/4') into (i, N)."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}': expected i/N, e.g. 1/4.")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}': i must be between 1 and N.")
+    return index, count
+
+
+def shard_suffix(shard: Union[Tuple[int, int], None]) -> str:
+    """Suffix that keeps the journal and profile of each shard of a run apart ('' outside shard mode)."""
+    return f"_shard{shard[0]}of{shard[1]}" if shard else ""
+
+
+def hash_shards(barcodes: Iterable[str], count: int) -> pd.Series:
+    """1-based shard per barcode from a CRC32 of the barcode: the same on every node, run and Python process."""
+    barcodes = pd.Index(barcodes)
+    shards = [zlib.crc32(str(barcode).encode('utf-8')) % count + 1 for barcode in barcodes]
+    return pd.Series(shards, index=barcodes, name='shard')
+
+
+def cost_balanced_shards(costs: pd.Series, count: int) -> pd.Series:
+    """
+    1-based shard per barcode that evens out the expected fit cost: most expensive series first,
+    each to the least loaded shard (ties broken by barcode, so every node computes the same split).
+    Series that never reach Stan (cost 0) are spread by hash.
+    """
+    shards = hash_shards(costs.index, count)
+    fitted = costs[costs > 0]
+    order = sorted(zip(-fitted.to_numpy(), fitted.index.astype(str), fitted.index))
+    load = np.zeros(count)
+    for negative_cost, _, barcode in order:
+        target = int(np.argmin(load))
+        shards[barcode] = target + 1
+        load[target] -= negative_cost
+    return shards
+
+
+def assign_shards(series_frame: pd.DataFrame, barcodes: Iterable[str], count: int) -> pd.Series:
+    """Shard per series key by SHARD_BALANCE: 'hash' (stable hash) or 'cost' (balanced on series length)."""
+    if config.SHARD_BALANCE == 'cost':
+        from scheduler import estimate_costs
+
+        # only data every node sees identically (no per-node fit history), so all nodes agree on the split
+        return cost_balanced_shards(estimate_costs(series_frame, barcodes), count)
+    if config.SHARD_BALANCE != 'hash':
+        raise ValueError(f"Unknown SHARD_BALANCE '{config.SHARD_BALANCE}'. Use 'hash' or 'cost'.")
+    return hash_shards(barcodes, count)
+
+
+def _shard_folder(run_id: str) -> str:
+    return os.path.join(config.SHARD_FOLDER, run_id)
+
+
+def write_shard(run_id: str, shard: Tuple[int, int], results: Iterable[tuple], fingerprint: str) -> str:
+    """Writes one shard's per-barcode forecasts (CSV) and a meta file; both are replaced atomically."""
+    folder = _shard_folder(run_id)
+    os.makedirs(folder, exist_ok=True)
+    base = os.path.join(folder, f"shard_{shard[0]}of{shard[1]}")
+
+    rows = [(res[0], res[1], (res[4] if len(res) > 4 else {}).get('fallback')) for res in results]
+    forecast_df = pd.DataFrame(rows, columns=['barcode', 'forecastedADD', 'fallback'])
+    forecast_df.to_csv(base + ".csv.tmp", index=False)
+    os.replace(base + ".csv.tmp", base + ".csv")
+
+    meta = {'run_id': run_id, 'shard': shard[0], 'shards': shard[1], 'fingerprint': fingerprint,
+            'rows': len(forecast_df), 'finished_at': datetime.now().isoformat()}
+    with open(base + ".json.tmp", 'w') as f:
+        json.dump(meta, f)
+    os.replace(base + ".json.tmp", base + ".json")
+    return base + ".csv"
+
+
+def latest_shard_run() -> Union[str, None]:
+    """Run ID of the most recently written shard folder, or None."""
+    folders = [path for path in glob.glob(os.path.join(config.SHARD_FOLDER, '*')) if os.path.isdir(path)]
+    return os.path.basename(max(folders, key=os.path.getmtime)) if folders else None
+
+
+def read_shards(run_id: str) -> pd.DataFrame:
+    """
+    Combines the shard files of a run into one (barcode, forecastedADD, fallback) frame.
+    Raises RuntimeError if a shard is missing or the shards were computed on different input data.
+    """
+    metas = []
+    for path in glob.glob(os.path.join(_shard_folder(run_id), "shard_*.json")):
+        with open(path) as f:
+            metas.append(json.load(f))
+    if not metas:
+        raise RuntimeError(f"No shard results found for run {run_id} in {_shard_folder(run_id)}.")
+
+    count = metas[0]['shards']
+    found = {meta['shard'] for meta in metas if meta['shards'] == count}
+    missing = sorted(set(range(1, count + 1)) - found)
+    if missing or len(found) != len(metas):
+        raise RuntimeError(f"Run {run_id} has incomplete shard results: missing {missing} of {count} "
+                           f"(or shards of different N in the same folder).")
+    fingerprints = {meta['fingerprint'] for meta in metas}
+    if len(fingerprints) > 1:
+        raise RuntimeError(f"Shards of run {run_id} were forecast on different input data or settings.")
+
+    frames = [pd.read_csv(os.path.join(_shard_folder(run_id), f"shard_{index}of{count}.csv"), dtype={'barcode': str})
+              for index in range(1, count + 1)]
+    forecast_df = pd.concat(frames, ignore_index=True)
+    duplicated = forecast_df['barcode'].duplicated()
+    if duplicated.any():
+        raise RuntimeError(f"Shards of run {run_id} overlap on {int(duplicated.sum())} barcodes.")
+    print(f"INFO: Merged {count} shards of run {run_id}: {len(forecast_df)} barcodes.")
+    return forecast_df
@@ -0,0 +1,279 @@
+# snapshot.py
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+import config
+from db import release_db_connection
+from file_lock import folder_lock
+from query.LoadData import LoadData
+
+SALES_DIR = "sales"
+MONTH_COL = 'transaction_month'
+SNAPSHOT_FORMAT = 2  # 2: თვე datetime64-ად და barcode სტრიქონად ინახება (ტიპები ერთხელ გარდაიქმნება)
+
+
+def _folder(*parts) -> str:
+    path = os.path.join(config.SNAPSHOT_FOLDER, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _remove(path: str):
+    # another process may have pruned it already
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _stage_arrow(df: pd.DataFrame, path: str) -> str:
+    """Writes an uncompressed Arrow IPC file next to path under a temporary name and returns that name."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return tmp_path
+
+
+def _write_arrow(df: pd.DataFrame, path: str):
+    """Writes an uncompressed Arrow IPC file (atomically), so it can be memory-mapped on read."""
+    os.replace(_stage_arrow(df, path), path)
+
+
+def _read_arrow(path: str) -> pa.Table:
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _read_meta(folder: str) -> dict:
+    path = os.path.join(folder, "meta.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_meta(folder: str, meta: dict):
+    path = os.path.join(folder, "meta.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path)
+
+
+def _with_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts the month column to datetime64 and barcodes to str once, as the data arrives from the database."""
+    if MONTH_COL in df.columns:
+        df[MONTH_COL] = pd.to_datetime(df[MONTH_COL])
+    if 'barcode' in df.columns:
+        df['barcode'] = df['barcode'].astype(str)
+    return df
+
+
+def _month_key(values: pd.Series) -> pd.Series:
+    return pd.to_datetime(values).dt.strftime('%Y-%m')
+
+
+def _month_file(folder: str, month: str) -> str:
+    return os.path.join(folder, f"{MONTH_COL}={month}.arrow")
+
+
+def load_sales_data(start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    LoadData.get_sales_data backed by a local per-month Arrow snapshot.
+    Cold run: the whole range is fetched and stored one file per transaction_month.
+    Warm run: only months from the refresh point onwards (the last SNAPSHOT_REFRESH_MONTHS
+    months, and anything after the last cached month) are fetched and replaced; older months
+    are memory-mapped from disk. The refresh runs under the snapshot folder's lock.
+    """
+    if not config.SNAPSHOT_ENABLED:
+        return _with_types(LoadData.get_sales_data(start_date, end_date))
+
+    folder = _folder(SALES_DIR)
+    with folder_lock(folder):
+        return _refresh_sales(folder, start_date, end_date)
+
+
+def _refresh_sales(folder: str, start_date: str, end_date: str) -> pd.DataFrame:
+    start = time.perf_counter()
+    meta = _read_meta(folder)
+    reusable = meta.get('start_date') == start_date and meta.get('format') == SNAPSHOT_FORMAT
+    months = sorted(meta.get('months', [])) if reusable else []
+
+    current_month = pd.Timestamp(end_date).to_period('M')
+    if months:
+        refresh_from = min(current_month - (config.SNAPSHOT_REFRESH_MONTHS - 1),
+                           pd.Period(months[-1], 'M') + 1)
+        fetch_start = max(refresh_from.start_time, pd.Timestamp(start_date)).strftime('%Y-%m-%d')
+        kind = 'warm'
+    else:
+        refresh_from = None
+        fetch_start = start_date
+        kind = 'cold'
+
+    delta = _with_types(LoadData.get_sales_data(fetch_start, end_date))
+    delta_months = _month_key(delta[MONTH_COL]) if not delta.empty else pd.Series(dtype=str)
+
+    kept = [m for m in months if refresh_from is None or pd.Period(m, 'M') < refresh_from]
+    all_months = sorted(set(kept) | set(delta_months.unique()))
+
+    # publish: new files first (temporary names, then renamed in), then meta.json, deletions last,
+    # so a crash at any point leaves meta.json listing only files that exist
+    staged = [(_stage_arrow(rows, _month_file(folder, month)), _month_file(folder, month))
+              for month, rows in delta.groupby(delta_months)]
+    for tmp_path, path in staged:
+        os.replace(tmp_path, path)
+    _write_meta(folder, {'query': 'get_sales_data', 'start_date': start_date, 'months': all_months,
+                         'format': SNAPSHOT_FORMAT, 'updated_at': datetime.now().isoformat()})
+    # refreshed months the source no longer has, files of another period or format, and
+    # temporary files of crashed refreshes (the lock is held, so none of them is in use)
+    published = {os.path.basename(_month_file(folder, m)) for m in all_months}
+    for name in os.listdir(folder):
+        if name.endswith('.tmp') or (name.endswith('.arrow') and name not in published):
+            _remove(os.path.join(folder, name))
+
+    cached = [_read_arrow(_month_file(folder, m)) for m in kept]
+    if cached:
+        tables = cached + ([pa.Table.from_pandas(delta, preserve_index=False)] if not delta.empty else [])
+        df = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+    else:
+        df = delta.reset_index(drop=True)
+
+    print(f"INFO: Sales data loaded ({kind} snapshot): {len(kept)} cached months + {delta_months.nunique()} fetched months, "
+          f"{len(df)} rows in {time.perf_counter() - start:.2f}s.")
+    return df
+
+
+def read_sales_data(start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    Sales rows of the months from start_date to end_date, read from the existing snapshot
+    without refreshing or rewriting it (unlike load_sales_data, whose snapshot is keyed on the
+    main run's START_DATE). Queries LoadData directly, still without writing, when the snapshot
+    does not cover the range: missing, starting later, another format, or last refreshed before
+    end_date had passed.
+    """
+    start = time.perf_counter()
+    first, last = pd.Timestamp(start_date).to_period('M'), pd.Timestamp(end_date).to_period('M')
+    folder = _folder(SALES_DIR)
+    with folder_lock(folder):
+        meta = _read_meta(folder)
+        covered = (meta.get('format') == SNAPSHOT_FORMAT and 'start_date' in meta
+                   and pd.Timestamp(meta['start_date']).to_period('M') <= first
+                   and pd.Timestamp(meta.get('updated_at', '1970-01-01')) > pd.Timestamp(end_date) + pd.Timedelta(days=1))
+        months = [m for m in meta.get('months', []) if first <= pd.Period(m, 'M') <= last]
+        if config.SNAPSHOT_ENABLED and covered and months:
+            df = pa.concat_tables([_read_arrow(_month_file(folder, m)) for m in months],
+                                  promote_options='permissive').to_pandas()
+            kind = 'snapshot'
+        else:
+            df = None
+    if df is None:
+        df = _with_types(LoadData.get_sales_data(start_date, end_date))
+        kind = 'database'
+    print(f"INFO: Sales data for {first}..{last} read from the {kind}: {len(df)} rows in {time.perf_counter() - start:.2f}s.")
+    return df
+
+
+def _load_with_ttl(name: str, params: dict, fetch: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """Snapshot of a query without a month key: reused while younger than SNAPSHOT_MAX_AGE_HOURS."""
+    start = time.perf_counter()
+    folder = _folder(name)
+    path = os.path.join(folder, "data.arrow")
+
+    with folder_lock(folder):
+        meta = _read_meta(folder)
+        fresh = (meta.get('params') == params and meta.get('format') == SNAPSHOT_FORMAT and os.path.exists(path)
+                 and time.time() - meta.get('updated_at', 0) < config.SNAPSHOT_MAX_AGE_HOURS * 3600)
+        if fresh:
+            df = _read_arrow(path).to_pandas()
+            kind = 'warm'
+        else:
+            df = _with_types(fetch())
+            _write_arrow(df, path)
+            _write_meta(folder, {'params': params, 'format': SNAPSHOT_FORMAT, 'updated_at': time.time()})
+            kind = 'cold'
+    print(f"INFO: {name} loaded ({kind} snapshot): {len(df)} rows in {time.perf_counter() - start:.2f}s.")
+    return df
+
+
+def load_additional_metrics() -> pd.DataFrame:
+    if not config.SNAPSHOT_ENABLED:
+        return _with_types(LoadData.get_additional_metrics())
+    return _load_with_ttl('additional_metrics', {}, LoadData.get_additional_metrics)
+
+
+def load_promo_campaigns(min_cashback: int) -> pd.DataFrame:
+    if not config.SNAPSHOT_ENABLED:
+        return _with_types(LoadData.get_promo_campaigns(min_cashback))
+    return _load_with_ttl('promo_campaigns', {'min_cashback': min_cashback},
+                          lambda: LoadData.get_promo_campaigns(min_cashback))
+
+
+def _own_connection(load: Callable, *args) -> pd.DataFrame:
+    """Runs one loader in a worker thread on its own pooled connection, returned to the pool afterwards."""
+    try:
+        return load(*args)
+    finally:
+        release_db_connection()
+
+
+def load_inputs(start_date: str, end_date: str, min_cashback: int) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Loads sales, additional metrics and promo campaigns concurrently (one thread and one
+    pooled connection per query), so Step 1 takes about as long as the slowest query.
+    Returns (sales with a datetime 'ds' column, additional metrics, promo campaigns).
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix='load') as executor:
+        sales = executor.submit(_own_connection, load_sales_data, start_date, end_date)
+        additional = executor.submit(_own_connection, load_additional_metrics)
+        promos = executor.submit(_own_connection, load_promo_campaigns, min_cashback)
+        df_raw, additional_data, promo_holidays = sales.result(), additional.result(), promos.result()
+    df_raw['ds'] = df_raw[MONTH_COL]
+    print(f"INFO: Inputs loaded concurrently in {time.perf_counter() - start:.2f}s.")
+    return df_raw, additional_data, promo_holidays
+
+
+def validate_sales_snapshot(start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    Compares per-month row counts and demand sums of the snapshot against a fresh
+    full query. Returns the months that differ (empty frame = snapshot matches the source).
+    """
+    from prophecy import DEMAND_COLS
+
+    folder = _folder(SALES_DIR)
+    with folder_lock(folder):
+        months = _read_meta(folder).get('months', [])
+        if not months:
+            print("INFO: No sales snapshot to validate.")
+            return pd.DataFrame()
+
+        snapshot = pa.concat_tables([_read_arrow(_month_file(folder, m)) for m in months],
+                                    promote_options='permissive').to_pandas()
+    source = LoadData.get_sales_data(start_date, end_date)
+
+    def aggregates(df: pd.DataFrame) -> pd.DataFrame:
+        value_cols = [col for col in DEMAND_COLS + ['in_stock_days'] if col in df.columns]
+        grouped = df.groupby(_month_key(df[MONTH_COL]))
+        return grouped[value_cols].sum().round(6).join(grouped.size().rename('rows'))
+
+    snapshot_agg, source_agg = aggregates(snapshot), aggregates(source)
+    missing = sorted(set(snapshot_agg.index) ^ set(source_agg.index))
+    if missing:
+        print(f"WARNING: Snapshot and source cover different months: {missing}")
+        return pd.DataFrame({'month': missing})
+
+    diff = snapshot_agg.compare(source_agg.loc[snapshot_agg.index], result_names=('snapshot', 'source'))
+    if diff.empty:
+        print(f"SUCCESS: Sales snapshot matches the source for all {len(months)} months.")
+    else:
+        print(f"WARNING: Sales snapshot differs from the source in {len(diff)} months: {list(diff.index)}")
+    return diff
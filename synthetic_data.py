@@ -0,0 +1,111 @@
+# synthetic_data.py
+
+import numpy as np
+import pandas as pd
+
+# სერიის ტიპები და მათი წილი სინთეტიკურ მონაცემებში
+SERIES_PROFILES = {
+    'stable': 0.35,
+    'trending': 0.2,
+    'seasonal': 0.2,
+    'intermittent': 0.15,  # ბევრი ნულოვანი თვე
+    'new': 0.1,  # მოკლე ისტორია (ახალი პროდუქტი)
+}
+CATEGORIES = {
+    'Food': ['Dairy', 'Bakery', 'Snacks'],
+    'Drinks': ['Water', 'Juice', 'Coffee'],
+    'Home': ['Cleaning', 'Kitchen'],
+    'Beauty': ['Skin', 'Hair'],
+}
+
+
+def generate_sales_data(n_skus: int, n_months: int = 24, end_month: str = None, seed: int = 0) -> pd.DataFrame:
+    """
+    Frame shaped like LoadData.get_sales_data: one row per barcode and transaction_month with
+    rolling_median_add, avg_daily_demand, avg_daily_demand_real, in_stock_days, dsi and gmroi.
+    Every barcode gets one of SERIES_PROFILES; built with array operations so millions of rows are cheap.
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end_month) if end_month else pd.Timestamp.now().normalize()
+    months = pd.date_range(end=end.to_period('M').start_time, periods=n_months, freq='MS')
+
+    profiles = rng.choice(list(SERIES_PROFILES), size=n_skus, p=list(SERIES_PROFILES.values()))
+    first_month = np.where(profiles == 'new', rng.integers(max(n_months - 8, 0), n_months, n_skus),
+                           rng.integers(0, max(n_months // 3, 1), n_skus))
+    base = rng.lognormal(mean=0.5, sigma=1.0, size=n_skus)
+    slope = np.where(profiles == 'trending', rng.normal(0, 0.04, n_skus), 0.0)
+    amplitude = np.where(profiles == 'seasonal', rng.uniform(0.2, 0.6, n_skus), 0.0)
+    phase = rng.uniform(0, 2 * np.pi, n_skus)
+
+    sku, month = np.divmod(np.arange(n_skus * n_months), n_months)
+    keep = month >= first_month[sku]
+    sku, month = sku[keep], month[keep]
+    age = month - first_month[sku]
+
+    demand = base[sku] * (1 + slope[sku] * age) * (1 + amplitude[sku] * np.sin(2 * np.pi * month / 12 + phase[sku]))
+    demand *= rng.lognormal(0, 0.15, len(sku))
+    demand[(profiles[sku] == 'intermittent') & (rng.random(len(sku)) < 0.6)] = 0.0
+    demand = np.clip(demand, 0, None)
+
+    in_stock_days = np.where(rng.random(len(sku)) < 0.1, rng.integers(0, 30, len(sku)), 30)
+    real = demand * np.where(in_stock_days > 0, 30 / np.maximum(in_stock_days, 1), 0)
+
+    return pd.DataFrame({
+        'barcode': (1_000_000 + sku).astype(str),
+        'transaction_month': months[month].strftime('%Y-%m-%d'),
+        'rolling_median_add': pd.Series(demand).groupby(sku).rolling(3, min_periods=1).median().round(4).to_numpy(),
+        'avg_daily_demand': demand.round(4),
+        'avg_daily_demand_real': real.round(4),
+        'in_stock_days': in_stock_days,
+        'dsi': np.where(demand > 0, rng.gamma(2, 40, len(sku)), 0).round(2),
+        'gmroi': rng.normal(1.8, 1.2, len(sku)).round(3),
+    })
+
+
+def generate_additional_metrics(sales_data: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    """Frame shaped like LoadData.get_additional_metrics for the barcodes in sales_data."""
+    rng = np.random.default_rng(seed + 1)
+    last = sales_data.groupby('barcode', sort=False).tail(3).groupby('barcode', sort=False)['avg_daily_demand'].median()
+    n = len(last)
+
+    pairs = [(category, subcategory) for category, subcategories in CATEGORIES.items() for subcategory in subcategories]
+    categories, subcategories = zip(*[pairs[i] for i in rng.integers(0, len(pairs), n)])
+    cost = rng.lognormal(1.5, 0.8, n).round(2)
+    return pd.DataFrame({
+        'barcode': last.index.to_numpy(),
+        'product_name': [f"Product {barcode}" for barcode in last.index],
+        'mother_cat_name': list(categories),
+        'subcategory': list(subcategories),
+        'supplier_name': [f"Supplier {i}" for i in rng.integers(0, max(n // 50, 1), n)],
+        'brand': [f"Brand {i}" for i in rng.integers(0, max(n // 20, 1), n)],
+        'in_stock': rng.integers(0, 200, n),
+        'price': (cost * rng.uniform(1.05, 1.8, n)).round(2),
+        'cost': cost,
+        'items_sold_3m': (last.to_numpy() * 90).round(),
+        'median_add_3m': last.to_numpy().round(4),
+    })
+
+
+def generate_promo_campaigns(start_date: str, end_date: str, n_campaigns: int = 40, seed: int = 0) -> pd.DataFrame:
+    """Frame shaped like LoadData.get_promo_campaigns: one row per promo day (holiday, ds, windows)."""
+    rng = np.random.default_rng(seed + 2)
+    starts = pd.to_datetime(rng.integers(pd.Timestamp(start_date).value // 10**9, pd.Timestamp(end_date).value // 10**9,
+                                         n_campaigns), unit='s').normalize()
+    frames = [pd.DataFrame({'holiday': f"promo_{i}", 'ds': pd.date_range(start, periods=rng.integers(1, 8))})
+              for i, start in enumerate(starts)]
+    promos = pd.concat(frames, ignore_index=True)
+    promos['lower_window'] = 0
+    promos['upper_window'] = 0
+    return promos
+
+
+def generate_dataset(n_skus: int, n_months: int = 24, seed: int = 0, end_month: str = '2025-06-01'):
+    """
+    Returns (sales_data, additional_data, promo_campaigns) with main.py's dtype conversions applied.
+    end_month is fixed by default so that repeated benchmark runs see identical data.
+    """
+    sales = generate_sales_data(n_skus, n_months, end_month, seed)
+    sales['ds'] = pd.to_datetime(sales['transaction_month'])
+    additional = generate_additional_metrics(sales, seed)
+    promos = generate_promo_campaigns(sales['ds'].min(), sales['ds'].max() + pd.offsets.MonthEnd(1), seed=seed)
+    return sales, additional, promos
@@ -0,0 +1,63 @@
+# tests/test_kpi_aggregation.py
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prophecy import kpi_aggregates
+from synthetic_data import generate_sales_data
+from utils import safe_mean_filtered
+
+
+def lambda_kpi_aggregates(df_raw: pd.DataFrame, demand_col: str) -> pd.DataFrame:
+    """The per-barcode lambda aggregation kpi_base used before group_mean_filtered."""
+    filtered = df_raw[df_raw[demand_col] > 0]
+    return filtered.groupby('barcode').agg(
+        averageADD=(demand_col, lambda x: round(x[x > 0].mean(), 4)),
+        DSI=('dsi', lambda x: safe_mean_filtered(x)),
+        GMROI=('gmroi', lambda x: safe_mean_filtered(x)),
+    )
+
+
+def sales_frame(n_skus: int, seed: int) -> pd.DataFrame:
+    """Synthetic sales with the edge cases of the filters mixed in: NaN, negative and >= 10000 values."""
+    df = generate_sales_data(n_skus, 24, '2025-06-01', seed)
+    rng = np.random.default_rng(seed)
+    for col in ('dsi', 'gmroi'):
+        n = len(df) // 20
+        df.loc[rng.choice(df.index, n, replace=False), col] = np.nan
+        df.loc[rng.choice(df.index, n, replace=False), col] = rng.uniform(10000, 50000, n)
+        df.loc[rng.choice(df.index, n, replace=False), col] = -rng.uniform(0, 10, n)
+    # barcodes whose every DSI is filtered out must get 0.0
+    df.loc[df['barcode'].isin(df['barcode'].unique()[:5]), 'dsi'] = 0.0
+    return df
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('demand_col', ['avg_daily_demand', 'rolling_median_add'])
+def test_vectorized_matches_lambda_aggregation(seed, demand_col):
+    df = sales_frame(300, seed)
+    expected = lambda_kpi_aggregates(df, demand_col)
+    actual = kpi_aggregates(df, demand_col)
+
+    assert list(actual.index) == list(expected.index)
+    # the grouped mean sums in a different order, so the floats may differ in the last bit
+    pd.testing.assert_frame_equal(actual[['DSI', 'GMROI']], expected[['DSI', 'GMROI']], check_exact=False, rtol=1e-12)
+
+    # ...which moves averageADD by one rounding step when the mean sits on a 4-decimal tie
+    filtered = df[df[demand_col] > 0]
+    scaled = filtered.groupby('barcode')[demand_col].mean() * 1e4
+    at_tie = (scaled - np.floor(scaled) - 0.5).abs() < 1e-6
+    differs = actual['averageADD'] != expected['averageADD']
+    assert (actual['averageADD'] - expected['averageADD']).abs().max() <= 1e-4 + 1e-12
+    assert not (differs & ~at_tie).any()
+
+
+def test_empty_frame():
+    df = sales_frame(10, 0).head(0)
+    assert kpi_aggregates(df, 'avg_daily_demand').empty
@@ -0,0 +1,63 @@
+# tests/test_result_cache.py
+
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import result_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A result cache on a fresh file, with every hit refreshing last_used."""
+    monkeypatch.setattr(config, 'RESULT_CACHE_PATH', str(tmp_path / 'forecast_cache.sqlite'))
+    monkeypatch.setattr(result_cache, 'TOUCH_SECONDS', -1)
+    monkeypatch.setattr(result_cache, '_local', type(result_cache._local)())
+    yield result_cache
+    result_cache._get_connection().close()
+
+
+def fold_frame() -> pd.DataFrame:
+    return pd.DataFrame({'ds': pd.to_datetime(['2025-01-01']), 'yhat': [1.0], 'y': [1.0],
+                         'cutoff': pd.to_datetime(['2024-12-01'])})
+
+
+def test_prune_keeps_recently_used_folds_within_budget(cache):
+    for i in range(5):
+        cache.put_cached_fold(f'fold{i}', fold_frame())
+    assert cache.get_cached_fold('fold0') is not None
+    fold_bytes = cache._get_connection().execute("SELECT length(key) + length(fold) FROM cv_folds").fetchone()[0]
+
+    cache.prune_cache(10 ** 6, 2 * fold_bytes)
+
+    kept = {row[0] for row in cache._get_connection().execute("SELECT key FROM cv_folds")}
+    assert kept == {'fold0', 'fold4'}
+
+
+def test_prune_bounds_results_by_bytes(cache):
+    for i in range(5):
+        cache.put_cached(f'key{i}', 'barcode', 1.0, {'fallback': None})
+    assert cache.get_cached('key1') == (1.0, {'fallback': None})
+
+    cache.prune_cache(1, 10 ** 6)
+
+    assert cache._get_connection().execute("SELECT count(*) FROM results").fetchone()[0] == 0
+
+
+def test_cv_folds_without_last_used_are_migrated(cache):
+    conn = sqlite3.connect(config.RESULT_CACHE_PATH)
+    conn.execute("CREATE TABLE cv_folds (key TEXT PRIMARY KEY, fold TEXT NOT NULL)")
+    conn.execute("INSERT INTO cv_folds VALUES ('legacy', ?)", (fold_frame().to_json(orient='split', date_format='iso', index=False),))
+    conn.commit()
+    conn.close()
+
+    assert cache.get_cached_fold('legacy') is not None
+    cache.put_cached_fold('fresh', fold_frame())
+    cache.prune_cache(10 ** 6, 1)
+    assert cache._get_connection().execute("SELECT count(*) FROM cv_folds").fetchone()[0] == 0
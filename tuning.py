@@ -0,0 +1,268 @@
+# tuning.py
+
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import math
+import os
+import time
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+import config
+from utils import create_prophet_model, config_snapshot
+from result_cache import fold_key, get_cached_fold, put_cached_fold
+from holiday_index import holiday_index_for
+
+# tuned_params-ის ლუქაპი, ერთხელ იკითხება თითო პროცესზე
+_LOOKUP = None
+
+
+def _load_lookup() -> dict:
+    global _LOOKUP
+    if _LOOKUP is None:
+        _LOOKUP = {'segments': {}, 'barcodes': {}}
+        if os.path.exists(config.TUNED_PARAMS_PATH):
+            with open(config.TUNED_PARAMS_PATH, encoding='utf-8') as f:
+                _LOOKUP = json.load(f)
+    return _LOOKUP
+
+
+def baseline_params() -> dict:
+    """The PROPHET_PARAMS values of the tuned hyperparameters."""
+    return {name: config.PROPHET_PARAMS.get(name) for name in config.TUNING_GRID}
+
+
+def tuned_params(barcode: str) -> Union[dict, None]:
+    """
+    Hyperparameters tuned for the barcode's segment by run_tuning, or None when tuning is off,
+    the barcode was not segmented or the search kept the PROPHET_PARAMS values.
+    """
+    if not config.TUNED_PARAMS:
+        return None
+    lookup = _load_lookup()
+    segment = lookup['barcodes'].get(barcode)
+    params = lookup['segments'].get(segment, {}).get('params') if segment is not None else None
+    return params if params and params != baseline_params() else None
+
+
+def lookup_fingerprint() -> str:
+    """Hash of the tuned-parameter lookup in use ('' if none), so runs forecast with other tuned values do not mix."""
+    if not config.TUNED_PARAMS or not os.path.exists(config.TUNED_PARAMS_PATH):
+        return ''
+    with open(config.TUNED_PARAMS_PATH, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def candidate_grid() -> List[dict]:
+    """Every combination of TUNING_GRID, plus the PROPHET_PARAMS values if the grid does not contain them."""
+    names = list(config.TUNING_GRID)
+    grid = [dict(zip(names, values)) for values in itertools.product(*config.TUNING_GRID.values())]
+    if baseline_params() not in grid:
+        grid.append(baseline_params())
+    return grid
+
+
+def holdout_error(group: pd.DataFrame, combined_holidays: pd.DataFrame, params: dict) -> Tuple[float, bool]:
+    """
+    Fits a series as forecast_one would, but without its last TUNING_HOLDOUT_MONTHS months, and
+    returns (MAE on those months / mean training demand, whether the fold came from the cache).
+    NaN if the shortened series cannot be fitted.
+    """
+    from prophecy import prepare_series, forecastability_issue, choose_growth
+
+    df = prepare_series(group)
+    if df is None or len(df) <= config.TUNING_HOLDOUT_MONTHS:
+        return np.nan, False
+    df = df.sort_values('ds').drop_duplicates(subset=['ds']).reset_index(drop=True)
+    train, test = df.iloc[:-config.TUNING_HOLDOUT_MONTHS].copy(), df.iloc[-config.TUNING_HOLDOUT_MONTHS:].copy()
+    if forecastability_issue(train):
+        return np.nan, False
+
+    growth_type, cap_val = choose_growth(train)
+    fit_df = train[['ds', 'y', 'in_stock_days']]
+    future = test[['ds', 'in_stock_days']]
+    if growth_type == 'logistic':
+        fit_df = fit_df.assign(cap=cap_val, floor=0.01)
+        future = future.assign(cap=cap_val, floor=0.01)
+    fold_holidays = holiday_index_for(combined_holidays).for_dates(df['ds'])
+
+    key, fold, cached = None, None, False
+    if config.RESULT_CACHE:
+        key = fold_key(fit_df, test['ds'], fold_holidays, params)
+        fold = None if config.FORCE_REFIT else get_cached_fold(key)
+        cached = fold is not None
+    if fold is None:
+        model = create_prophet_model(fold_holidays if not fold_holidays.empty else None, growth_type, params=params)
+        model.add_regressor('in_stock_days')
+        model.fit(fit_df)
+        forecast = model.predict(future)
+        fold = pd.DataFrame({'ds': test['ds'].values, 'yhat': forecast['yhat'].values,
+                             'y': test['y'].values, 'cutoff': train['ds'].max()})
+        if key is not None:
+            put_cached_fold(key, fold)
+
+    scale = max(float(train['y'].mean()), 1e-9)
+    return float(np.mean(np.abs(fold['yhat'] - fold['y'])) / scale), cached
+
+
+def holdout_stored(task: tuple) -> tuple:
+    """Pool task: (segment, barcode, config id, params) -> the same ids with the holdout error, seconds and cache flag."""
+    from prophecy import worker_series, worker_holidays
+
+    segment, barcode, config_id, params = task
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()):
+            error, cached = holdout_error(worker_series(barcode), worker_holidays(), params)
+    except Exception:
+        error, cached = np.nan, False
+    return segment, barcode, config_id, error, time.perf_counter() - start, cached
+
+
+def assign_segments(series_frame: pd.DataFrame, additional_data: pd.DataFrame,
+                    barcodes: List[str]) -> Tuple[pd.Series, pd.Index]:
+    """
+    Segment per barcode: category x volume tier (TUNING_VOLUME_TIERS quantiles of median_add_3m).
+    Categories with fewer than TUNING_MIN_SKUS tunable SKUs in a tier are pooled per tier ('*|tierN').
+    Returns (segment per barcode, barcodes long enough to hold out TUNING_HOLDOUT_MONTHS).
+    """
+    from pipeline import median_lookup
+    from scheduler import estimate_costs
+
+    index = pd.Index(barcodes)
+    attrs = additional_data.drop_duplicates(subset=['barcode']).set_index('barcode').reindex(index)
+    category = attrs['mother_cat_name'] if 'mother_cat_name' in attrs else pd.Series(np.nan, index=index)
+    medians = median_lookup(additional_data).reindex(index).fillna(0.0)
+    n_tiers = max(1, min(config.TUNING_VOLUME_TIERS, len(index)))
+    tiers = pd.qcut(medians.rank(method='first'), n_tiers, labels=[f"tier{i + 1}" for i in range(n_tiers)])
+    segment = category.fillna('unknown').astype(str) + '|' + tiers.astype(str)
+
+    points = series_frame.groupby('barcode')['ds'].nunique().reindex(index).fillna(0)
+    tunable = (estimate_costs(series_frame, index) > 0) & (medians > 0) \
+        & (points >= config.MIN_DATA_POINTS_FOR_FORECAST + config.TUNING_HOLDOUT_MONTHS)
+    counts = segment[tunable].value_counts()
+    small = segment.map(counts).fillna(0) < config.TUNING_MIN_SKUS
+    segment = segment.where(~small, '*|' + tiers.astype(str))
+    return segment, index[tunable.to_numpy()]
+
+
+class SegmentSearch:
+    """
+    Successive halving over the candidate grid for one segment: every surviving config is scored
+    on the first rung_size SKUs, the best 1/TUNING_ETA survive and the next rung has TUNING_ETA
+    times more SKUs, until one config is left or the whole sample was used. The baseline
+    (PROPHET_PARAMS) is scored on every rung, so the winner can be compared against it.
+    """
+
+    def __init__(self, name: str, barcodes: List[str], n_candidates: int, baseline_id: int):
+        self.name = name
+        self.barcodes = barcodes
+        self.alive = list(range(n_candidates))
+        self.baseline_id = baseline_id
+        self.rung_size = min(len(barcodes), config.TUNING_MIN_SKUS)
+        self.errors: Dict[Tuple[int, str], float] = {}
+        self.winner = None
+
+    def pending(self) -> List[Tuple[str, int]]:
+        """(barcode, config id) pairs of the current rung that have not been scored yet."""
+        ids = sorted(set(self.alive) | {self.baseline_id})
+        return [(barcode, config_id) for config_id in ids for barcode in self.barcodes[:self.rung_size]
+                if (config_id, barcode) not in self.errors]
+
+    def score(self, config_id: int) -> float:
+        """Mean holdout error of a config on the current rung (inf if every fit failed)."""
+        values = np.array([self.errors[(config_id, barcode)] for barcode in self.barcodes[:self.rung_size]])
+        return float(np.nanmean(values)) if np.isfinite(values).any() else np.inf
+
+    def advance(self):
+        """Keeps the best configs of the finished rung and grows the SKU sample, or picks the winner."""
+        ranked = sorted(self.alive, key=lambda config_id: (self.score(config_id), config_id))
+        if len(ranked) == 1 or self.rung_size == len(self.barcodes):
+            self.winner = ranked[0]
+            return
+        self.alive = ranked[:max(1, math.ceil(len(ranked) / config.TUNING_ETA))]
+        self.rung_size = min(len(self.barcodes), self.rung_size * config.TUNING_ETA)
+
+
+def run_tuning(store, series_frame: pd.DataFrame, additional_data: pd.DataFrame,
+               combined_holidays: pd.DataFrame) -> str:
+    """
+    Searches Prophet hyperparameters per segment with successive halving on a holdout of the
+    last TUNING_HOLDOUT_MONTHS months (all segments of a rung run in one process pool) and writes
+    the winners with a barcode -> segment map to TUNED_PARAMS_PATH, which forecast_one reads.
+    """
+    from prophecy import init_worker
+    from pipeline import tuned_chunksize
+    from scheduler import plan_workers, limit_worker_threads
+
+    candidates = candidate_grid()
+    baseline_id = candidates.index(baseline_params())
+    segment_of, tunable = assign_segments(series_frame, additional_data, store.barcodes)
+
+    rng = np.random.default_rng(config.TUNING_SEED)
+    searches = {}
+    for name, members in segment_of[tunable].groupby(segment_of[tunable]):
+        barcodes = list(members.index)
+        rng.shuffle(barcodes)
+        searches[name] = SegmentSearch(name, barcodes[:config.TUNING_MAX_SKUS], len(candidates), baseline_id)
+    if not searches:
+        print("WARNING: No segment has enough history to tune; PROPHET_PARAMS stay in use.")
+        return config.TUNED_PARAMS_PATH
+    print(f"INFO: Tuning {len(candidates)} configs in {len(searches)} segments "
+          f"({sum(len(s.barcodes) for s in searches.values())} sampled SKUs, "
+          f"successive halving with eta={config.TUNING_ETA}).")
+
+    processes, _ = plan_workers(threads_per_task=1)
+    limit_worker_threads(1)
+    start = time.perf_counter()
+    evaluated, from_cache, rung = 0, 0, 0
+    init_args = (combined_holidays, config_snapshot(), store.handle())
+    with get_context("spawn").Pool(processes=processes, initializer=init_worker, initargs=init_args) as pool:
+        active = list(searches.values())
+        while active:
+            rung += 1
+            tasks = [(search.name, barcode, config_id, candidates[config_id])
+                     for search in active for barcode, config_id in search.pending()]
+            results = pool.imap_unordered(holdout_stored, tasks, chunksize=tuned_chunksize(len(tasks), processes))
+            for segment, barcode, config_id, error, _, cached in tqdm(results, total=len(tasks), desc=f"Tuning rung {rung}"):
+                searches[segment].errors[(config_id, barcode)] = error
+                evaluated += 1
+                from_cache += cached
+            for search in active:
+                search.advance()
+            active = [search for search in active if search.winner is None]
+    elapsed = time.perf_counter() - start
+
+    segments, improved = {}, 0
+    for name, search in searches.items():
+        winner_score, baseline_score = search.score(search.winner), search.score(baseline_id)
+        # the winner is only kept if it beats PROPHET_PARAMS on the SKUs both were scored on
+        chosen = search.winner if winner_score < baseline_score else baseline_id
+        improved += chosen != baseline_id
+        segments[name] = {'params': candidates[chosen], 'holdout_error': round(min(winner_score, baseline_score), 6),
+                          'baseline_error': round(baseline_score, 6), 'skus': search.rung_size}
+
+    lookup = {'created_at': datetime.now().isoformat(), 'run_id': config.RUN_ID, 'baseline': baseline_params(),
+              'segments': segments,
+              'barcodes': {barcode: name for barcode, name in segment_of.items() if name in segments}}
+    os.makedirs(os.path.dirname(config.TUNED_PARAMS_PATH) or '.', exist_ok=True)
+    with open(config.TUNED_PARAMS_PATH + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(lookup, f, default=str)
+    os.replace(config.TUNED_PARAMS_PATH + ".tmp", config.TUNED_PARAMS_PATH)
+
+    full_grid = len(candidates) * sum(len(search.barcodes) for search in searches.values())
+    print(f"INFO: Successive halving scored {evaluated} (config, SKU) holdouts ({evaluated - from_cache} Stan fits, "
+          f"{from_cache} from the fold cache) in {elapsed:.1f}s over {rung} rungs; a full grid on the same SKUs "
+          f"needs {full_grid} fits (~{full_grid * elapsed / max(evaluated, 1):.0f}s at this rate, "
+          f"{full_grid / max(evaluated, 1):.1f}x).")
+    print(f"SUCCESS: Tuned params beat PROPHET_PARAMS in {improved} of {len(segments)} segments; "
+          f"lookup saved to {config.TUNED_PARAMS_PATH}.")
+    return config.TUNED_PARAMS_PATH
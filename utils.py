@@ -5,19 +5,29 @@ from prophet import Prophet
 import config
 
 # utils.py
-def create_prophet_model(holidays_df: pd.DataFrame, growth_type: str = 'linear') -> Prophet:
+def create_prophet_model(holidays_df: pd.DataFrame, growth_type: str = 'linear', params: dict = None) -> Prophet:
     """
     Creates a Prophet model with standardized parameters from the config file.
+    params (e.g. tuned prior scales) override the matching PROPHET_PARAMS entries.
     """
     model = Prophet(
         growth=growth_type,
         holidays=holidays_df,
         stan_backend='CMDSTANPY',  
-        **config.PROPHET_PARAMS
+        **{**config.PROPHET_PARAMS, **(params or {})}
     )
     model.add_seasonality(**config.MONTHLY_SEASONALITY)
     return model
 
+def config_snapshot() -> dict:
+    """Returns all upper-case settings of the config module as a plain dict."""
+    return {name: getattr(config, name) for name in dir(config) if name.isupper()}
+
+def apply_config(values: dict) -> None:
+    """Applies a config_snapshot() (e.g. from the parent process) to this process's config module."""
+    for name, value in values.items():
+        setattr(config, name, value)
+
 def safe_mean_filtered(series: pd.Series, max_val: int = 10000) -> float:
     """
     Calculates the mean of a series after filtering out zeros and outliers.
@@ -25,3 +35,11 @@ def safe_mean_filtered(series: pd.Series, max_val: int = 10000) -> float:
     valid = series[(series > 0) & (series < max_val)]
 
     return valid.mean() if not valid.empty else 0.0
+
+def group_mean_filtered(values: pd.Series, keys: pd.Series, max_val: int = 10000) -> pd.Series:
+    """
+    Vectorized safe_mean_filtered for every group at once: values outside (0, max_val)
+    are masked out and groups with no valid value get 0.0.
+    """
+    valid = values.where((values > 0) & (values < max_val))
+    return valid.groupby(keys).mean().fillna(0.0)
@@ -0,0 +1,143 @@
+# watchdog.py
+
+import os
+import queue
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Iterator, List, Union
+
+POLL_SECONDS = 1.0  # რამდენ ხანში ერთხელ მოწმდება გაჭედილი დავალებები
+WARM_UP_KEY = 'warm-up'  # init_worker-ის საცდელი ფიტის "ბარკოდი"
+
+
+def _child_pids(pid: int) -> List[int]:
+    """Direct children of a process, read from /proc (Linux)."""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # ppid is the second field after the ')' that closes the command name
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def kill_process_tree(pid: int, include_root: bool = True):
+    """
+    SIGKILLs the descendants of a process (e.g. a worker's CmdStan subprocesses) and, with
+    include_root, the process itself. Works on stopped or SIGTERM-ignoring processes.
+    """
+    if sys.platform == 'win32':
+        if include_root:
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(pid)], capture_output=True)
+        return
+    pids = [pid]
+    if os.path.isdir('/proc'):
+        i = 0
+        while i < len(pids):
+            pids.extend(_child_pids(pids[i]))
+            i += 1
+    targets = pids if include_root else pids[1:]
+    for target in reversed(targets):
+        try:
+            os.kill(target, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def timed_out_result(task: tuple, seconds: float, pid: Union[int, None]) -> tuple:
+    """Median fallback result (forecast_one's tuple) for a task whose worker was killed at the deadline."""
+    barcode, median_add_3m = task
+    end_time = datetime.now()
+    reason = f"worker {pid} killed after {seconds:.0f}s (TASK_HARD_TIMEOUT_SECONDS)" if pid else "lost with a killed worker"
+    info = {'series_len': None, 'growth': None, 'fallback': 'task_timeout', 'cached': False, 'stored_model': False,
+            'fit_seconds': None, 'worker': pid, 'tuned': False, 'error': reason}
+    return barcode, median_add_3m, end_time - timedelta(seconds=seconds), end_time, info
+
+
+def imap_with_deadline(pool, func: Callable, tasks: Iterable[tuple], task_starts, timeout: float, window: int,
+                       on_timeout: Callable[[tuple, float, Union[int, None]], tuple] = timed_out_result) -> Iterator[tuple]:
+    """
+    Like pool.imap_unordered(func, tasks), but one task per round trip and with a deadline:
+    a task still running after `timeout` seconds gets its worker and that worker's CmdStan
+    processes killed, the pool starts a replacement worker (running the initializer again),
+    and on_timeout(task, seconds, pid) is yielded in place of its result. Results are yielded
+    as they finish, so a stuck series never holds back the ones behind it.
+    At most `window` tasks are submitted at a time; tasks are drawn lazily from the iterable
+    (in its order) as earlier ones finish, so a long task generator is never materialized.
+    Workers report (key, pid, start time) on task_starts when they pick up a task (key
+    WARM_UP_KEY for the initializer's warm-up fit, None when it is done); tasks and results
+    are matched on their first element (the barcode / series key).
+    """
+    results = queue.Queue()
+    tasks = iter(tasks)
+    pending = {}
+
+    def submit():
+        for task in tasks:
+            pending[task[0]] = task
+            pool.apply_async(func, (task,), callback=results.put, error_callback=results.put)
+            if len(pending) >= window:
+                break
+
+    running = {}  # worker pid -> (key, start time) of what the worker is busy with
+    killed = 0
+    last_progress = time.time()
+    while True:
+        if len(pending) < window:
+            submit()
+        if not pending:
+            break
+        try:
+            res = results.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            res = None
+        while True:
+            try:
+                key, pid, started = task_starts.get_nowait()
+            except queue.Empty:
+                break
+            if key is None:
+                running.pop(pid, None)
+            elif key in pending or key == WARM_UP_KEY:
+                running[pid] = (key, started)
+                last_progress = time.time()
+
+        if isinstance(res, BaseException):
+            raise res
+        # a result that arrives after its worker was killed has already been replaced by the fallback
+        if res is not None and pending.pop(res[0], None) is not None:
+            for pid, (key, _) in list(running.items()):
+                if key == res[0]:
+                    del running[pid]
+            last_progress = time.time()
+            yield res
+
+        now = time.time()
+        for pid, (key, started) in list(running.items()):
+            if now - started <= timeout:
+                continue
+            kill_process_tree(pid)
+            killed += 1
+            del running[pid]
+            last_progress = now  # the replacement worker gets a full deadline to pick up the queued tasks
+            if key in pending:
+                print(f"WARNING: Series {key} exceeded the {timeout:.0f}s task deadline; worker {pid} was "
+                      f"killed and replaced, falling back to median_add_3m.")
+                yield on_timeout(pending.pop(key), now - started, pid)
+            else:
+                print(f"WARNING: Worker {pid} did not finish its warm-up within {timeout:.0f}s; killed and replaced.")
+
+        if killed and not running and now - last_progress > timeout:
+            # a task taken by a worker at the moment it was killed is never started or returned
+            print(f"WARNING: {len(pending)} series were lost with a killed worker; falling back to median_add_3m.")
+            for key in list(pending):
+                yield on_timeout(pending.pop(key), 0.0, None)